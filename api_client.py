@@ -0,0 +1,171 @@
+import os
+import socket
+import threading
+
+# --- DeepSeek 接口客户端：连接池复用 + 超时 + 429/5xx 指数退避重试 ---
+# requests 在第一次发请求时才导入并建立会话，启动阶段不付出这部分开销
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+DEFAULT_MODEL = "deepseek-chat"
+# 本地模拟服务器等场景可通过环境变量覆盖默认接口地址 (显式传入的地址优先)
+BASE_URL_ENV = "JINTA_API_BASE_URL"
+
+CONNECT_TIMEOUT = 10
+# 流式响应中两次收到数据之间的最长等待
+READ_TIMEOUT = 120
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 1.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+POOL_SIZE = 8
+
+
+class ApiError(Exception):
+    def __init__(self, status_code, message="", retry_after=None):
+        super().__init__(f"API错误: {status_code} {message}".strip())
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def is_rate_limited(self):
+        return self.status_code == 429
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+def abort_response(response):
+    # 直接关闭底层套接字：阻塞在读取上的线程立刻返回，服务端也随即停止生成
+    # 只关闭 response 要等到下一块数据到达才生效，停滞的流会一直占住线程
+    sock = None
+    try:
+        connection = getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            sock = response.raw._fp.fp.raw._sock
+    except AttributeError:
+        pass
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+class DeepSeekClient:
+    def __init__(self, api_key="", base_url=None, model=DEFAULT_MODEL,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, pool_size=POOL_SIZE):
+        self.api_key = api_key
+        self.base_url = (base_url or os.environ.get(BASE_URL_ENV) or DEFAULT_BASE_URL).rstrip("/")
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        max_retries = self.max_retries
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            # 读超时不重试：请求可能已被计费
+            read=0,
+            status=max_retries,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def chat_url(self):
+        return f"{self.base_url}/chat/completions"
+
+    def chat(self, messages, stream=False, **extra):
+        # 返回 requests.Response；流式时由调用方负责 close()
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        payload = {"model": self.model, "messages": messages, "stream": stream}
+        payload.update(extra)
+        response = self.session.post(self.chat_url, headers=headers, json=payload, stream=stream, timeout=self.timeout)
+        if response.status_code != 200:
+            message = ""
+            try:
+                message = response.json().get("error", {}).get("message", "")
+            except Exception:
+                pass
+            retry_after = None
+            try:
+                retry_after = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                pass
+            response.close()
+            raise ApiError(response.status_code, message, retry_after)
+        return response
+
+    def chat_cancellable(self, messages, cancel_token, stream=False, **extra):
+        # 等待响应头 (含限流退避重试) 期间也能立即取消：请求在辅助线程中发出，
+        # 调用线程只等结果或取消信号；取消后迟到的响应由辅助线程直接断开
+        if cancel_token is None:
+            return self.chat(messages, stream=stream, **extra)
+        done = threading.Event()
+        lock = threading.Lock()
+        box = {}
+
+        def send():
+            try:
+                result = ("response", self.chat(messages, stream=stream, **extra))
+            except Exception as e:
+                result = ("error", e)
+            with lock:
+                if box.get("abandoned"):
+                    if result[0] == "response":
+                        abort_response(result[1])
+                    return
+                box[result[0]] = result[1]
+            done.set()
+
+        threading.Thread(target=send, daemon=True).start()
+        handle = cancel_token.on_cancel(done.set)
+        done.wait()
+        cancel_token.remove(handle)
+        with lock:
+            if "response" not in box and "error" not in box:
+                box["abandoned"] = True
+                raise RequestCancelled()
+        if "error" in box:
+            raise box["error"]
+        if cancel_token.cancelled:
+            abort_response(box["response"])
+            raise RequestCancelled()
+        return box["response"]
+
+    def complete(self, messages, **extra):
+        response = self.chat(messages, stream=False, **extra)
+        return response.json()['choices'][0]['message']['content']
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
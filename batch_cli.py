@@ -0,0 +1,334 @@
+import os
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+
+from doc_cache import DocumentCache
+from doc_ingest import IngestEngine
+from doc_index import DEFAULT_CONTEXT_BUDGET
+from prompt_budget import DEFAULT_REQUEST_BUDGET
+from api_client import ApiError
+from llm_backends import build_registry
+from response_cache import ResponseCache
+from batch_scheduler import BatchScheduler, DEFAULT_CONCURRENCY, DONE, FAILED, CANCELLED
+from lesson_engine import LessonEngine, load_config, PLAN_TYPES, DEFAULT_INSTRUCTION
+from lesson_export import export_lessons
+from text_store import TextStore, DEFAULT_MEMORY_MB
+
+# --- 命令行批量生成：无需界面，整学期课题一次跑完，中断后可续跑 ---
+# 用法：python batch_cli.py 课题清单.csv --out 输出目录 [--concurrency 3]
+# 清单为 CSV 或 JSON，字段：topic, periods, files, custom_content, instruction, plan_type
+#   files 在 CSV 中用 ; 分隔，JSON 中可直接写列表；相对路径相对于清单所在目录
+# 进度保存在 输出目录/progress.json，重新运行同一命令即跳过已完成的课时
+
+PROGRESS_FILE = "progress.json"
+ENV_API_KEY = "DEEPSEEK_API_KEY"
+
+
+def log(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def safe_filename(name):
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("_") or "教案"
+
+
+def _split_files(value):
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in re.split(r"[;；|]", value or "") if v.strip()]
+
+
+def load_topics(path, default_plan_type, default_instruction):
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith(".json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows.get("topics", [])
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    topics = []
+    used_names = set()
+    for line_no, row in enumerate(rows, 1):
+        topic = str(row.get("topic") or "").strip()
+        if not topic:
+            raise ValueError(f"第 {line_no} 条缺少 topic")
+        periods = int(row.get("periods") or 1)
+        if periods < 1:
+            raise ValueError(f"第 {line_no} 条 periods 必须大于 0")
+        files = []
+        for fp in _split_files(row.get("files")):
+            fp = os.path.expanduser(fp)
+            files.append(os.path.normpath(fp if os.path.isabs(fp) else os.path.join(base_dir, fp)))
+        plan_type = str(row.get("plan_type") or default_plan_type).strip()
+        if plan_type not in PLAN_TYPES:
+            raise ValueError(f"第 {line_no} 条 plan_type 无效：{plan_type}（可选 {' / '.join(PLAN_TYPES)}）")
+
+        # 同名课题输出到不同文件
+        name = safe_filename(topic)
+        stem, n = name, 2
+        while stem in used_names:
+            stem = f"{name}_{n}"
+            n += 1
+        used_names.add(stem)
+
+        topics.append({
+            "key": stem,
+            "topic": topic,
+            "periods": periods,
+            "files": files,
+            "custom_content": str(row.get("custom_content") or "").strip(),
+            "instruction": str(row.get("instruction") or default_instruction).strip(),
+            "plan_type": plan_type
+        })
+    return topics
+
+
+class ProgressStore:
+    # 每完成一个任务就整体落盘 (临时文件 + 原子替换)，中断后据此续跑
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"topics": {}}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    def period(self, key, p):
+        with self.lock:
+            return dict(self.data["topics"].get(key, {}).get("periods", {}).get(str(p), {}))
+
+    def update_period(self, key, p, result):
+        with self.lock:
+            entry = self.data["topics"].setdefault(key, {"periods": {}, "exported": False})
+            entry["periods"].setdefault(str(p), {}).update(result)
+            entry["exported"] = False
+            self._save_locked()
+
+    def lesson_data(self, key):
+        with self.lock:
+            periods = self.data["topics"].get(key, {}).get("periods", {})
+            return {int(p): dict(v) for p, v in periods.items()}
+
+    def is_exported(self, key):
+        with self.lock:
+            return self.data["topics"].get(key, {}).get("exported", False)
+
+    def mark_exported(self, key):
+        with self.lock:
+            self.data["topics"].setdefault(key, {"periods": {}})["exported"] = True
+            self._save_locked()
+
+    def _save_locked(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+def ingest_files(filepaths, max_workers=None):
+    # 同步解析所有参考文件 (同一文件只解析一次，命中磁盘缓存则直接读取)
+    results = {}
+    failed = {}
+    pending = set(filepaths)
+    cond = threading.Condition()
+
+    def on_done(filepath, filename, text, content_hash, from_cache, meta):
+        with cond:
+            results[filepath] = (filename, text, content_hash)
+            pending.discard(filepath)
+            cond.notify_all()
+        log(f"{'⚡ 命中缓存' if from_cache else '✅ 解析完成'}：{filename}")
+
+    def on_error(filepath, filename, exc):
+        with cond:
+            failed[filepath] = str(exc)
+            pending.discard(filepath)
+            cond.notify_all()
+        log(f"❌ 解析失败：{filename}：{exc}")
+
+    if not pending:
+        return results, failed
+    kwargs = {"max_workers": max_workers} if max_workers else {}
+    engine = IngestEngine(cache=DocumentCache(), on_done=on_done, on_error=on_error, **kwargs)
+    try:
+        engine.ingest(sorted(pending))
+        with cond:
+            while pending:
+                cond.wait(timeout=0.5)
+    finally:
+        engine.shutdown()
+    return results, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量生成教案 (无界面)")
+    parser.add_argument("topics", help="课题清单 (.csv 或 .json)")
+    parser.add_argument("--out", default="教案输出", help="输出目录，每个课题一个 .docx")
+    parser.add_argument("--concurrency", type=int, default=None, help=f"并发请求数 (默认 {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--api-key", default=None, help=f"DeepSeek API Key，默认读取环境变量 {ENV_API_KEY} 或界面保存的配置")
+    parser.add_argument("--plan-type", default=PLAN_TYPES[0], choices=PLAN_TYPES, help="清单中未指定时使用的教案类型")
+    parser.add_argument("--instruction", default=DEFAULT_INSTRUCTION, help="清单中未指定时使用的撰写要求")
+    parser.add_argument("--bypass-cache", action="store_true", help="不使用响应缓存")
+    parser.add_argument("--digest", action="store_true", help="先为每份参考文件生成课题摘要，以摘要代替原文注入")
+    parser.add_argument("--hedge-ms", type=int, default=None, help="首字超过该毫秒数时向下一个后端对冲 (0 为关闭，默认取配置)")
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    api_key = args.api_key or os.environ.get(ENV_API_KEY) or config.get("api_key", "")
+    # 接口后端与对冲设置与图形界面共用同一份配置
+    api_client = build_registry(config, api_key)
+    if args.hedge_ms is not None:
+        api_client.hedge_after_ms = max(0, args.hedge_ms)
+    if not api_key and api_client.needs_shared_key:
+        log(f"❌ 未配置 API Key：请使用 --api-key、环境变量 {ENV_API_KEY}，或先在界面中保存")
+        return 2
+
+    try:
+        topics = load_topics(args.topics, args.plan_type, args.instruction)
+    except (OSError, ValueError) as e:
+        log(f"❌ 无法读取课题清单：{e}")
+        return 2
+    os.makedirs(args.out, exist_ok=True)
+    progress = ProgressStore(os.path.join(args.out, PROGRESS_FILE))
+
+    # 已全部生成的课题不再解析其参考文件
+    def is_complete(t):
+        return all(progress.period(t["key"], p).get("objectives") and progress.period(t["key"], p).get("process")
+                   for p in range(1, t["periods"] + 1))
+
+    all_files = sorted({fp for t in topics if not is_complete(t) for fp in t["files"]})
+    if all_files:
+        log(f"⏳ 正在解析 {len(all_files)} 个参考文件...")
+    documents, failed_files = ingest_files(all_files)
+    if failed_files:
+        log(f"⚠️ {len(failed_files)} 个参考文件解析失败，相关课题将在缺少这些素材的情况下继续生成")
+
+    response_cache = ResponseCache()
+    # 摘要与解析结果存于同一文档缓存
+    doc_cache = DocumentCache()
+    # 各课题的索引共用一个磁盘文本存储，正文不常驻内存
+    text_store = TextStore(memory_limit=int(config.get("text_memory_mb", DEFAULT_MEMORY_MB)) * 1024 * 1024)
+    concurrency = args.concurrency or int(config.get("batch_concurrency", DEFAULT_CONCURRENCY))
+
+    def on_update(job):
+        key, kind, p = job.key
+        label = "框架" if kind == "framework" else "过程"
+        suffix = f"：{job.error}" if job.error else ""
+        log(f"{job.status}  {key} 第 {p} 课时{label}{suffix}")
+
+    def rate_limit_delay(exc):
+        if isinstance(exc, ApiError) and exc.is_rate_limited:
+            return exc.retry_after or 0
+        return None
+
+    batch = BatchScheduler(concurrency, on_update=on_update, rate_limit_delay=rate_limit_delay)
+    for t in topics:
+        # 每个课题只检索自己的参考文件；接口客户端与响应缓存全局共享
+        engine = LessonEngine(
+            api_client,
+            response_cache=response_cache,
+            context_budget=int(config.get("context_token_budget", DEFAULT_CONTEXT_BUDGET)),
+            request_budget=int(config.get("request_token_budget", DEFAULT_REQUEST_BUDGET)),
+            doc_cache=doc_cache,
+            text_store=text_store
+        )
+        engine.bypass_cache = args.bypass_cache
+        engine.use_digests = args.digest
+        for fp in t["files"]:
+            if fp in documents:
+                name, text, content_hash = documents[fp]
+                engine.add_document(fp, name, text, content_hash)
+
+        key = t["key"]
+        for p in range(1, t["periods"] + 1):
+            saved = progress.period(key, p)
+            need_framework = not saved.get("objectives")
+            need_process = not saved.get("process")
+
+            def framework_job(should_stop, t=t, engine=engine, p=p):
+                if engine.use_digests:
+                    engine.ensure_digests(t["topic"], should_stop)
+                result = engine.generate_framework(t["topic"], p, t["periods"], t["custom_content"], should_stop)
+                if result is None:
+                    raise RuntimeError("已取消")
+                progress.update_period(t["key"], p, dict(result, custom_content=t["custom_content"]))
+                return result
+
+            def process_job(should_stop, t=t, engine=engine, p=p):
+                context = progress.period(t["key"], p)
+                context.setdefault("custom_content", t["custom_content"])
+                if engine.use_digests:
+                    engine.ensure_digests(t["topic"], should_stop)
+                text = engine.generate_process(t["topic"], context, t["instruction"], t["plan_type"], p, should_stop)
+                if should_stop():
+                    raise RuntimeError("已取消")
+                progress.update_period(t["key"], p, {"process": text})
+                return text
+
+            if need_framework:
+                batch.add((key, "framework", p), framework_job)
+            if need_process:
+                batch.add((key, "process", p), process_job,
+                          depends_on=(key, "framework", p) if need_framework else None)
+
+    def export_ready():
+        for t in topics:
+            key = t["key"]
+            out_path = os.path.join(args.out, key + ".docx")
+            if progress.is_exported(key) and os.path.exists(out_path):
+                continue
+            if not is_complete(t):
+                continue
+            data = progress.lesson_data(key)
+            try:
+                export_lessons(out_path, t["topic"], t["periods"], data)
+            except Exception as e:
+                log(f"❌ 导出失败：{out_path}：{e}")
+                continue
+            progress.mark_exported(key)
+            log(f"📄 已导出：{out_path}")
+
+    # 正文已全部写入文本存储，释放解析结果
+    documents.clear()
+
+    exit_code = 0
+    if batch.jobs:
+        log(f"📚 共 {len(batch.jobs)} 个生成任务，并发 {concurrency}")
+        batch.start()
+        try:
+            while batch.is_active():
+                time.sleep(0.5)
+                export_ready()
+        except KeyboardInterrupt:
+            log("⛔ 已中断，已完成的课时均已保存，重新运行即可续跑")
+            batch.cancel()
+            exit_code = 130
+        finally:
+            batch.shutdown()
+    else:
+        log("✅ 所有课时均已生成，无需请求接口")
+    export_ready()
+
+    jobs = list(batch.jobs.values())
+    done = sum(1 for j in jobs if j.status == DONE)
+    failed = [j for j in jobs if j.status in (FAILED, CANCELLED)]
+    if jobs:
+        log(f"📚 批量生成结束：{done}/{len(jobs)} 个任务完成")
+    if failed and exit_code == 0:
+        exit_code = 1
+    api_client.close()
+    return exit_code
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cancel_token import CancelToken
+
+# --- 批量任务调度：有界并发 + 依赖链 + 限流自适应 (AIMD) + 单任务重试 ---
+PENDING = "⏳ 排队中"
+WAITING = "⏸ 等待前置"
+RUNNING = "🔄 生成中"
+DONE = "✅ 完成"
+FAILED = "❌ 失败"
+CANCELLED = "⛔ 已取消"
+
+DEFAULT_CONCURRENCY = 3
+# 被限流后自动重试的次数，超过后标记失败等待手动重试
+MAX_AUTO_RETRIES = 2
+DEFAULT_COOLDOWN = 5.0
+# 连续成功多少次后把并发上限加回 1
+RECOVER_AFTER = 2
+
+
+class BatchJob:
+    def __init__(self, key, fn, depends_on=None):
+        self.key = key
+        self.fn = fn
+        self.depends_on = depends_on
+        self.status = PENDING
+        self.error = ""
+        self.attempts = 0
+        self.rate_limit_retries = 0
+        self.generation = 0
+        self.result = None
+
+
+class BatchScheduler:
+    # fn(should_stop) 在工作线程执行，返回值存入 job.result；should_stop 是该次执行的 CancelToken，
+    # cancel() 时立即触发，在途请求随之断开
+    # on_update(job) 在工作线程触发，调用方自行切回界面线程
+    # rate_limit_delay(exc) 返回建议等待秒数 (可为 0)；非限流异常返回 None
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY, on_update=None, rate_limit_delay=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.on_update = on_update
+        self.rate_limit_delay = rate_limit_delay
+        self.jobs = {}
+        self.cond = threading.Condition()
+        self.running = 0
+        self.cooldown_until = 0.0
+        self.successes = 0
+        self.generation = 0
+        # 正在执行的任务的取消令牌
+        self.tokens = set()
+        # 依赖检查与“等待前置”状态切换需原子完成，避免前置刚好完成时漏掉后继
+        self.dep_lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+    def add(self, key, fn, depends_on=None):
+        job = BatchJob(key, fn, depends_on)
+        self.jobs[key] = job
+        return job
+
+    def start(self):
+        with self.dep_lock:
+            for job in list(self.jobs.values()):
+                if self._dependency_ready(job):
+                    self._schedule(job)
+                else:
+                    self._set_status(job, WAITING)
+
+    def _dependency_ready(self, job):
+        return job.depends_on is None or self.jobs[job.depends_on].status == DONE
+
+    def _schedule(self, job):
+        with self.cond:
+            job.generation = self.generation
+        self._set_status(job, PENDING)
+        self.executor.submit(self._run, job)
+
+    def _set_status(self, job, status, error=""):
+        job.status = status
+        job.error = error
+        if self.on_update:
+            self.on_update(job)
+
+    def _is_stale(self, job):
+        return job.generation != self.generation
+
+    def _acquire(self, job):
+        with self.cond:
+            while True:
+                if self._is_stale(job):
+                    return False
+                wait = self.cooldown_until - time.time()
+                if wait <= 0 and self.running < self.limit:
+                    self.running += 1
+                    return True
+                self.cond.wait(timeout=wait if wait > 0 else 0.5)
+
+    def _release(self):
+        with self.cond:
+            self.running -= 1
+            self.cond.notify_all()
+
+    def _run(self, job):
+        if not self._acquire(job):
+            self._set_status(job, CANCELLED)
+            return
+        job.attempts += 1
+        token = CancelToken()
+        with self.cond:
+            self.tokens.add(token)
+            stale = self._is_stale(job)
+        if stale:
+            token.cancel()
+        self._set_status(job, RUNNING)
+        try:
+            job.result = job.fn(token)
+        except Exception as e:
+            self._discard_token(token)
+            self._release()
+            delay = self.rate_limit_delay(e) if self.rate_limit_delay else None
+            if self._is_stale(job):
+                # 取消时断开的请求会以异常结束，不算失败
+                self._set_status(job, CANCELLED)
+            elif delay is not None and job.rate_limit_retries < MAX_AUTO_RETRIES:
+                job.rate_limit_retries += 1
+                self._on_rate_limited(delay)
+                self._schedule(job)
+            else:
+                self._set_status(job, FAILED, str(e))
+            return
+        self._discard_token(token)
+        self._release()
+        if self._is_stale(job):
+            self._set_status(job, CANCELLED)
+            return
+        self._on_success()
+        with self.dep_lock:
+            self._set_status(job, DONE)
+            for dependent in list(self.jobs.values()):
+                if dependent.depends_on == job.key and dependent.status == WAITING:
+                    self._schedule(dependent)
+
+    def _discard_token(self, token):
+        with self.cond:
+            self.tokens.discard(token)
+
+    def _on_rate_limited(self, delay):
+        # 乘性减：并发减半，并让所有任务一起冷却
+        with self.cond:
+            self.limit = max(1, self.limit // 2)
+            self.successes = 0
+            backoff = delay or DEFAULT_COOLDOWN
+            self.cooldown_until = max(self.cooldown_until, time.time() + backoff)
+            self.cond.notify_all()
+
+    def _on_success(self):
+        # 加性增：连续成功后逐步恢复并发上限
+        with self.cond:
+            self.successes += 1
+            if self.limit < self.max_concurrency and self.successes >= RECOVER_AFTER:
+                self.limit += 1
+                self.successes = 0
+                self.cond.notify_all()
+
+    def retry(self, key):
+        job = self.jobs.get(key)
+        if job is None or job.status not in (FAILED, CANCELLED):
+            return False
+        job.rate_limit_retries = 0
+        with self.dep_lock:
+            if self._dependency_ready(job):
+                self._schedule(job)
+                return True
+            # 前置任务未完成时先重试前置，完成后自动带起本任务
+            self._set_status(job, WAITING)
+            dependency = self.jobs[job.depends_on]
+            if dependency.status in (FAILED, CANCELLED):
+                return self.retry(dependency.key)
+            return True
+
+    def cancel(self):
+        with self.cond:
+            self.generation += 1
+            tokens = list(self.tokens)
+            self.tokens.clear()
+            self.cond.notify_all()
+        for token in tokens:
+            token.cancel()
+        with self.dep_lock:
+            for job in self.jobs.values():
+                if job.status == WAITING:
+                    self._set_status(job, CANCELLED)
+
+    def is_active(self):
+        # 只剩“等待前置”时说明前置已失败/取消，批次不会再自行推进
+        return any(job.status in (PENDING, RUNNING) for job in self.jobs.values())
+
+    def current_limit(self):
+        with self.cond:
+            return self.limit
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
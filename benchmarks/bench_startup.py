@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- 冷启动基准：导入 main 的耗时、主窗口首帧绘制耗时，以及启动时是否误加载了重依赖 ---
+# 每轮都在全新子进程中测量，避免模块缓存干扰
+# 用法：python benchmarks/bench_startup.py [--runs 5] [--max-import-ms 400] [--json 输出文件]
+
+HEAVY_MODULES = ("requests", "urllib3", "docx", "pptx", "pypdf")
+
+_PROBE = r"""
+import sys, time, json
+t0 = time.perf_counter()
+result = {}
+try:
+    import main
+except Exception as e:
+    result["error"] = f"import: {e!r}"
+    print(json.dumps(result))
+    sys.exit(0)
+result["import_ms"] = (time.perf_counter() - t0) * 1000
+result["heavy_loaded"] = [m for m in %(heavy)r if m in sys.modules]
+try:
+    app = main.LessonPlanWriter()
+    app.update_idletasks()
+    app.update()
+    result["first_paint_ms"] = (time.perf_counter() - t0) * 1000
+    app.destroy()
+except Exception as e:
+    # 无显示环境 (CI / SSH) 下只统计导入耗时
+    result["paint_error"] = repr(e)
+print(json.dumps(result))
+"""
+
+
+def run_once():
+    probe = _PROBE % {"heavy": HEAVY_MODULES}
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if not lines:
+        return {"error": proc.stderr.strip()[-300:] or "no output"}
+    return json.loads(lines[-1])
+
+
+def summarize(runs, key):
+    values = [r[key] for r in runs if key in r]
+    if not values:
+        return None
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量主程序冷启动耗时")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=None, help="导入耗时中位数超过该值时以非零状态退出")
+    parser.add_argument("--json", dest="json_path", default=None)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    report = {
+        "runs": args.runs,
+        "import_ms": summarize(runs, "import_ms"),
+        "first_paint_ms": summarize(runs, "first_paint_ms"),
+        "heavy_loaded": sorted({m for r in runs for m in r.get("heavy_loaded", [])}),
+        "errors": sorted({r.get("error") or r.get("paint_error") for r in runs if r.get("error") or r.get("paint_error")}),
+    }
+
+    for key in ("import_ms", "first_paint_ms"):
+        stats = report[key]
+        if stats:
+            print(f"{key:<16} 中位数 {stats['median']:8.1f} ms  (最快 {stats['min']:.1f} / 最慢 {stats['max']:.1f})")
+        else:
+            print(f"{key:<16} 未测得")
+    print(f"启动时已加载的重依赖: {report['heavy_loaded'] or '无'}")
+    for err in report["errors"]:
+        print(f"提示: {err}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = bool(report["heavy_loaded"]) or report["import_ms"] is None
+    if args.max_import_ms is not None and report["import_ms"] and report["import_ms"]["median"] > args.max_import_ms:
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
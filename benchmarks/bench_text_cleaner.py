@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_cleaner import StreamingCleaner, clean_text  # noqa: E402
+
+# --- 文本清洗吞吐基准：旧版逐增量 clean_text 与流式清洗器对比 ---
+# 用法：python benchmarks/bench_text_cleaner.py [总字符数]
+
+
+def legacy_clean_text(text):
+    # 原 LessonPlanWriter.clean_text 的实现，作为对照组
+    text = text.replace("**", "").replace("__", "")
+    text = text.replace("```json", "").replace("```", "")
+    lines = []
+    for line in text.split('\n'):
+        clean_line = line.strip()
+        while clean_line.startswith("#"):
+            clean_line = clean_line[1:].strip()
+        lines.append(clean_line)
+    return "\n".join(lines)
+
+
+def make_deltas(total_chars, seed=7):
+    # 模拟模型输出：中文正文夹杂 Markdown 标记，按 1~6 字切成增量
+    rng = random.Random(seed)
+    pieces = ["环节一：情景创设（5分钟）", "\n", "## ", "**教师活动**", "：", "展示Fe³⁺与SCN⁻反应的实验",
+              "\n- ", "学生观察并记录现象", "```", "，", "设计意图：", "  ", "引发认知冲突", "__", "\n\n"]
+    text = []
+    size = 0
+    while size < total_chars:
+        piece = rng.choice(pieces)
+        text.append(piece)
+        size += len(piece)
+    text = "".join(text)
+    deltas = []
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, 6)
+        deltas.append(text[i:i + step])
+        i += step
+    return text, deltas
+
+
+def bench(label, fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return label, best
+
+
+def run(total_chars=200000):
+    text, deltas = make_deltas(total_chars)
+
+    def legacy_stream():
+        for d in deltas:
+            legacy_clean_text(d)
+
+    def streaming():
+        cleaner = StreamingCleaner()
+        for d in deltas:
+            cleaner.feed(d)
+        cleaner.finish()
+
+    results = [
+        bench("legacy clean_text / delta", legacy_stream),
+        bench("StreamingCleaner / delta", streaming),
+        bench("legacy clean_text / whole", lambda: legacy_clean_text(text)),
+        bench("clean_text / whole", lambda: clean_text(text)),
+    ]
+    print(f"{len(text)} chars, {len(deltas)} deltas")
+    for label, seconds in results:
+        print(f"{label:<28} {seconds * 1000:8.1f} ms  {len(text) / seconds / 1e6:6.2f} Mchar/s")
+
+    # 正确性对照：旧版逐增量清洗会漏掉被切断的标记、误删增量边界处的空格
+    expected = legacy_clean_text(text)
+    legacy_out = "".join(legacy_clean_text(d) for d in deltas)
+    cleaner = StreamingCleaner()
+    streamed = "".join(cleaner.feed(d) for d in deltas) + cleaner.finish()
+    print(f"legacy per-delta matches whole-text result: {legacy_out == expected}")
+    print(f"StreamingCleaner matches whole-text result: {streamed == expected}")
+    return results
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
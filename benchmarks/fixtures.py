@@ -0,0 +1,174 @@
+import os
+import json
+import random
+
+# --- 基准测试用的合成素材：大体量 docx / pptx / pdf、录制格式的 SSE 流、多课时 lesson_data ---
+# 全部由固定随机种子生成，保证每次运行的输入一致
+
+_CN_SENTENCES = [
+    "离子反应是指有离子参加或有离子生成的化学反应。",
+    "电解质在水溶液中或熔融状态下能够导电。",
+    "强电解质在水溶液中完全电离，例如 HCl、NaOH 和 NaCl。",
+    "书写离子方程式时，难溶物、弱电解质和气体保留化学式。",
+    "Fe³⁺ 与 SCN⁻ 反应生成血红色的络合物，可用于检验铁离子。",
+    "复分解型离子反应发生的条件是生成沉淀、气体或弱电解质。",
+    "通过实验探究，培养学生证据推理与模型认知的核心素养。",
+    "教师展示 BaCl₂ 溶液与 Na₂SO₄ 溶液混合的实验现象。",
+    "学生分组讨论，归纳离子方程式的书写步骤。",
+    "课堂检测围绕离子共存与离子方程式正误判断展开。",
+]
+_EN_WORDS = ("ion reaction electrolyte solution precipitate equation charge conservation "
+             "experiment observe sulfate chloride sodium barium model evidence").split()
+
+PROCESS_SAMPLE = (
+    "环节一：**学习目标**（3分钟）\n"
+    "## 教师活动：展示本节课的学习目标，强调 SO₄²⁻ 的检验方法。\n"
+    "学生活动：齐读目标，明确任务。  \n"
+    "设计意图：__目标导向__，让学生带着问题进入课堂。\n\n"
+    "环节二：情景创设（5分钟）\n"
+    "教师活动：演示 BaCl₂ 与 Na₂SO₄ 反应，提出“溶液中真正反应的是什么？”\n"
+    "学生活动：观察白色沉淀，尝试用微观视角解释。\n"
+    "```\n设计意图：引发认知冲突。\n```\n"
+)
+
+
+def cn_paragraph(rng, sentences=4):
+    return "".join(rng.choice(_CN_SENTENCES) for _ in range(sentences))
+
+
+def en_line(rng, words=12):
+    return " ".join(rng.choice(_EN_WORDS) for _ in range(words))
+
+
+def generate_docx(path, paragraphs=3000, seed=1):
+    from docx import Document
+
+    rng = random.Random(seed)
+    doc = Document()
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            doc.add_heading(f"第 {i // 50 + 1} 节", level=2)
+        doc.add_paragraph(cn_paragraph(rng))
+    doc.save(path)
+    return path
+
+
+def generate_pptx(path, slides=200, seed=2):
+    import pptx
+    from pptx.util import Inches
+
+    rng = random.Random(seed)
+    prs = pptx.Presentation()
+    layout = prs.slide_layouts[1]
+    for i in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"第 {i + 1} 页：离子反应"
+        slide.placeholders[1].text = "\n".join(cn_paragraph(rng, 2) for _ in range(4))
+        box = slide.shapes.add_textbox(Inches(1), Inches(6), Inches(8), Inches(1))
+        box.text_frame.text = cn_paragraph(rng, 1)
+    prs.save(path)
+    return path
+
+
+def generate_pdf(path, pages=300, lines_per_page=45, seed=3):
+    # 手写最小 PDF：每页一个 Helvetica 文本流 (标准 14 字体只支持拉丁字符)
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # 占位，最后回填
+    page_ids = []
+    for p in range(pages):
+        lines = [f"Page {p + 1}"] + [en_line(rng) for _ in range(lines_per_page)]
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 800 Td"]
+        for line in lines:
+            ops.append(f"({line}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+def generate_sse_recording(path, total_chars=30000, seed=4):
+    # 与 DeepSeek 流式接口格式一致的录制文件：每个增量一个 data 事件，夹杂心跳注释，末尾带 usage 与 [DONE]
+    rng = random.Random(seed)
+    text = (PROCESS_SAMPLE * (total_chars // len(PROCESS_SAMPLE) + 1))[:total_chars]
+    lines = [": keep-alive\n\n"]
+    i = 0
+    n = 0
+    while i < len(text):
+        step = rng.randint(1, 6)
+        delta = {"id": "bench", "object": "chat.completion.chunk",
+                 "choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}]}
+        lines.append("data: " + json.dumps(delta, ensure_ascii=False) + "\n\n")
+        i += step
+        n += 1
+        if n % 200 == 0:
+            lines.append(": keep-alive\n\n")
+    usage = {"id": "bench", "choices": [], "usage": {"prompt_tokens": 2000, "completion_tokens": n, "total_tokens": 2000 + n,
+                                                   "prompt_cache_hit_tokens": 1536, "prompt_cache_miss_tokens": 464}}
+    lines.append("data: " + json.dumps(usage) + "\n\n")
+    lines.append("data: [DONE]\n\n")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(lines))
+    return path
+
+
+def make_lesson_data(periods=10, process_lines=300, seed=5):
+    rng = random.Random(seed)
+    data = {}
+    for p in range(1, periods + 1):
+        data[p] = {
+            "custom_content": "",
+            "chapter": "必修第一册 第一章 第二节 离子反应",
+            "standard": cn_paragraph(rng, 3),
+            "objectives": "\n".join(f"{k}. {cn_paragraph(rng, 1)}" for k in range(1, 4)),
+            "key_points": cn_paragraph(rng, 1),
+            "difficulties": cn_paragraph(rng, 1),
+            "methods": "实验探究法、讨论法",
+            "homework": cn_paragraph(rng, 2),
+            "process": "\n".join(cn_paragraph(rng, 2) for _ in range(process_lines)),
+        }
+    return data
+
+
+def build_all(fixture_dir):
+    # 生成全部素材文件，已存在则复用；返回 {名称: 路径}
+    os.makedirs(fixture_dir, exist_ok=True)
+    builders = {
+        "docx": ("large.docx", generate_docx),
+        "pptx": ("large.pptx", generate_pptx),
+        "pdf": ("large.pdf", generate_pdf),
+        "sse": ("process_stream.sse", generate_sse_recording),
+    }
+    paths = {}
+    for name, (filename, builder) in builders.items():
+        path = os.path.join(fixture_dir, filename)
+        if not os.path.exists(path):
+            builder(path)
+        paths[name] = path
+    return paths
@@ -0,0 +1,118 @@
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 本地模拟 DeepSeek 接口：把录制好的 SSE 流原样回放 ---
+# 可单独运行供界面联调：python benchmarks/mock_server.py 录制文件.sse [端口]
+# 再设置环境变量 JINTA_API_BASE_URL=http://127.0.0.1:端口 启动主程序
+
+
+class MockDeepSeekServer:
+    # chunk_bytes：每次写出的字节数；delay：每块之间的停顿秒数 (模拟网络节奏)
+    # first_delay：发出响应头后、第一块数据前的停顿秒数 (模拟高峰期排队)，期间发送 keep-alive 注释
+    def __init__(self, recording_path, port=0, chunk_bytes=512, delay=0.0, first_delay=0.0):
+        with open(recording_path, "rb") as f:
+            self.recording = f.read()
+        self.chunk_bytes = chunk_bytes
+        self.delay = delay
+        self.first_delay = first_delay
+        self.requests = 0
+        self.aborted = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server.requests += 1
+                if not body.get("stream"):
+                    self._send_json()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                data = server.recording
+                try:
+                    if server.first_delay:
+                        self._keep_alive(server.first_delay)
+                    for i in range(0, len(data), server.chunk_bytes):
+                        piece = data[i:i + server.chunk_bytes]
+                        self.wfile.write(b"%x\r\n" % len(piece) + piece + b"\r\n")
+                        self.wfile.flush()
+                        if server.delay:
+                            time.sleep(server.delay)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端中途停止并断开连接
+                    server.aborted += 1
+                    self.close_connection = True
+
+            def _keep_alive(self, seconds):
+                comment = b": keep-alive\n\n"
+                deadline = time.monotonic() + seconds
+                while True:
+                    self.wfile.write(b"%x\r\n" % len(comment) + comment + b"\r\n")
+                    self.wfile.flush()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    time.sleep(min(0.1, remaining))
+
+            def _send_json(self):
+                # 非流式请求：把录制内容拼成一条完整回复
+                content = []
+                for line in server.recording.decode("utf-8").splitlines():
+                    if line.startswith("data: ") and line != "data: [DONE]":
+                        event = json.loads(line[6:])
+                        for choice in event.get("choices", []):
+                            content.append(choice.get("delta", {}).get("content") or "")
+                payload = json.dumps({"choices": [{"message": {"content": "".join(content)}}]}, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法：python benchmarks/mock_server.py 录制文件.sse [端口]")
+        sys.exit(2)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    mock = MockDeepSeekServer(sys.argv[1], port=port, delay=0.005)
+    print(f"模拟接口已启动：{mock.base_url}  (Ctrl+C 退出)")
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tempfile
+import threading
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fixtures  # noqa: E402
+from mock_server import MockDeepSeekServer  # noqa: E402
+from doc_cache import DocumentCache  # noqa: E402
+from doc_ingest import IngestEngine  # noqa: E402
+from api_client import DeepSeekClient  # noqa: E402
+from llm_backends import Backend, BackendRegistry, LatencyStats  # noqa: E402
+from text_cleaner import StreamingCleaner, clean_text  # noqa: E402
+import lesson_engine  # noqa: E402
+from lesson_engine import LessonEngine, PLAN_TYPES, DEFAULT_INSTRUCTION  # noqa: E402
+from lesson_export import export_lessons, FragmentCache  # noqa: E402
+
+# --- 基准测试套件：文档解析、素材检索与 Prompt 构建、文本清洗、流式撰写、Word 导出 ---
+# 用法：python benchmarks/run_benchmarks.py [--only ingest,export] [--baseline 基线.json] [--save-baseline 基线.json]
+# 每次结果写入 benchmarks/results/<时间>.json；指定基线时逐项对比，变慢超过容差记为回退
+
+FIXTURE_DIR = os.path.join(BENCH_DIR, ".fixtures")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.20
+SUITES = ("ingest", "context", "clean", "stream", "export")
+
+
+def measure(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3), "runs": repeat}
+
+
+class SyncIngest:
+    # 把回调式的 IngestEngine 包成同步调用，进程池在多轮之间复用
+    def __init__(self, cache):
+        self.cache = cache
+        self.cond = threading.Condition()
+        self.pending = set()
+        self.texts = {}
+        self.errors = {}
+        self.engine = IngestEngine(cache=cache, on_done=self._on_done, on_error=self._on_error)
+
+    def _on_done(self, filepath, filename, text, content_hash, from_cache, meta):
+        with self.cond:
+            self.texts[filepath] = text
+            self.pending.discard(filepath)
+            self.cond.notify_all()
+
+    def _on_error(self, filepath, filename, exc):
+        with self.cond:
+            self.errors[filepath] = exc
+            self.pending.discard(filepath)
+            self.cond.notify_all()
+
+    def run(self, paths):
+        with self.cond:
+            self.pending = set(paths)
+        self.engine.ingest(list(paths))
+        with self.cond:
+            while self.pending:
+                self.cond.wait(timeout=0.5)
+        if self.errors:
+            raise RuntimeError(f"解析失败: {self.errors}")
+        return {p: self.texts[p] for p in paths}
+
+    def shutdown(self):
+        self.engine.shutdown()
+
+
+def bench_ingest(paths, repeat, results, work_dir):
+    cache = DocumentCache(os.path.join(work_dir, "doc_cache"))
+    ingest = SyncIngest(cache)
+    docs = [paths["docx"], paths["pptx"], paths["pdf"]]
+    try:
+        # 首轮预热进程池，避免把进程启动时间算进单个格式
+        ingest.run(docs)
+        for name in ("docx", "pptx", "pdf"):
+            results[f"ingest.{name}.cold"] = measure(lambda n=name: ingest.run([paths[n]]), repeat, setup=cache.clear)
+        results["ingest.all.cold"] = measure(lambda: ingest.run(docs), repeat, setup=cache.clear)
+        ingest.run(docs)
+        results["ingest.all.cached"] = measure(lambda: ingest.run(docs), repeat)
+        return ingest.run(docs)
+    finally:
+        ingest.shutdown()
+
+
+def make_engine(texts):
+    engine = LessonEngine(None)
+    for path, text in texts.items():
+        engine.add_document(path, os.path.basename(path), text)
+    return engine
+
+
+def bench_context(texts, repeat, results):
+    start = time.perf_counter()
+    engine = make_engine(texts)
+    results["context.index_build"] = {"median_ms": round((time.perf_counter() - start) * 1000, 3), "min_ms": None, "runs": 1}
+
+    query = "离子反应 第2课时 离子方程式 书写步骤 electrolyte"
+    results["context.get_combined_doc_context"] = measure(lambda: engine.get_combined_doc_context(query), repeat)
+    context = period_context()
+    results["context.build_framework_prompt"] = measure(
+        lambda: engine.build_framework_prompt("离子反应", 2, 3, ""), repeat)
+    results["context.build_process_prompt"] = measure(
+        lambda: engine.build_process_prompt("离子反应", context, DEFAULT_INSTRUCTION, PLAN_TYPES[2], 2), repeat)
+
+
+def period_context():
+    data = fixtures.make_lesson_data(periods=1, process_lines=0)[1]
+    return {k: v for k, v in data.items() if k != "process"}
+
+
+def bench_clean(sse_path, repeat, results):
+    deltas = []
+    with open(sse_path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("data: {"):
+                for choice in json.loads(line[6:]).get("choices", []):
+                    if choice.get("delta", {}).get("content"):
+                        deltas.append(choice["delta"]["content"])
+    text = "".join(deltas) * 4
+
+    def streaming():
+        cleaner = StreamingCleaner()
+        for _ in range(4):
+            for d in deltas:
+                cleaner.feed(d)
+        cleaner.finish()
+
+    results["clean.clean_text.whole"] = measure(lambda: clean_text(text), repeat)
+    results["clean.streaming.per_delta"] = measure(streaming, repeat)
+
+
+def bench_stream(sse_path, repeat, results):
+    with MockDeepSeekServer(sse_path) as mock:
+        client = DeepSeekClient(api_key="bench", base_url=mock.base_url)
+        engine = LessonEngine(client)
+        prompt = [{"role": "user", "content": "基准测试"}]
+        # 预热：建立连接池
+        engine.run_process(prompt, lambda: False)
+        results["stream.run_process"] = measure(lambda: engine.run_process(prompt, lambda: False), repeat)
+        deltas = []
+        results["stream.run_process.ui_callback"] = measure(
+            lambda: engine.run_process(prompt, lambda: False, deltas.append), repeat)
+        client.close()
+    bench_hedge(sse_path, repeat, results)
+
+
+def bench_hedge(sse_path, repeat, results):
+    # 首选后端排队 1 秒才开始输出，对冲到正常后端；统计样本清零以固定首选顺序
+    with MockDeepSeekServer(sse_path, first_delay=1.0) as slow, MockDeepSeekServer(sse_path) as fast:
+        registry = BackendRegistry([Backend("slow", slow.base_url, "bench"), Backend("fast", fast.base_url, "bench")],
+                                   api_key="bench", hedge_after_ms=200)
+        engine = LessonEngine(registry)
+        prompt = [{"role": "user", "content": "基准测试"}]
+
+        def reset():
+            for backend in registry.backends:
+                backend.stats = LatencyStats()
+        reset()
+        engine.run_process(prompt, lambda: False)
+        results["stream.hedged_slow_primary"] = measure(lambda: engine.run_process(prompt, lambda: False), repeat, setup=reset)
+        registry.close()
+
+
+def bench_export(repeat, results, work_dir):
+    data = fixtures.make_lesson_data(periods=10)
+    out = os.path.join(work_dir, "export.docx")
+    results["export.cold"] = measure(lambda: export_lessons(out, "离子反应", 10, data), repeat)
+
+    cache = FragmentCache()
+    export_lessons(out, "离子反应", 10, data, cache=cache)
+    counter = [0]
+
+    def edit_one():
+        counter[0] += 1
+        data[5] = dict(data[5], objectives=f"修改 {counter[0]}")
+
+    results["export.one_period_edited"] = measure(
+        lambda: export_lessons(out, "离子反应", 10, data, cache=cache), repeat, setup=edit_one)
+
+
+def compare(results, baseline, tolerance):
+    # 返回 [(名称, 基线ms, 当前ms, 比值, 是否回退)]，只比较两边都有的项
+    rows = []
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("median_ms"):
+            continue
+        ratio = current["median_ms"] / base["median_ms"]
+        rows.append((name, base["median_ms"], current["median_ms"], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运行性能基准测试")
+    parser.add_argument("--only", default=",".join(SUITES), help=f"逗号分隔的子集：{','.join(SUITES)}")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--out", default=None, help="结果 JSON 路径 (默认 benchmarks/results/<时间>.json)")
+    parser.add_argument("--baseline", default=None, help="对比的基线结果 JSON")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的变慢比例，默认 0.2")
+    parser.add_argument("--save-baseline", default=None, help="把本次结果另存为基线")
+    args = parser.parse_args()
+
+    suites = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"未知的测试项：{', '.join(sorted(unknown))}")
+    # Prompt 统计与请求耗时日志写在用户缓存目录，基准测试的模拟请求不写入，也不计入耗时
+    lesson_engine.log_prompt_stats = lambda *args, **kwargs: None
+    lesson_engine.log_request_metrics = lambda *args, **kwargs: None
+
+    start = time.perf_counter()
+    paths = fixtures.build_all(FIXTURE_DIR)
+    print(f"素材就绪 ({time.perf_counter() - start:.1f}s)：{FIXTURE_DIR}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        texts = None
+        if "ingest" in suites or "context" in suites:
+            if "ingest" in suites:
+                texts = bench_ingest(paths, args.repeat, results, work_dir)
+            else:
+                ingest = SyncIngest(DocumentCache(os.path.join(work_dir, "doc_cache")))
+                try:
+                    texts = ingest.run([paths["docx"], paths["pptx"], paths["pdf"]])
+                finally:
+                    ingest.shutdown()
+        if "context" in suites:
+            bench_context(texts, args.repeat, results)
+        if "clean" in suites:
+            bench_clean(paths["sse"], args.repeat, results)
+        if "stream" in suites:
+            bench_stream(paths["sse"], args.repeat, results)
+        if "export" in suites:
+            bench_export(args.repeat, results, work_dir)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    for name, r in results.items():
+        print(f"{name:<36} {r['median_ms']:10.2f} ms")
+
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {out}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.save_baseline}")
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n与基线对比 ({baseline.get('meta', {}).get('timestamp', '?')})，容差 {args.tolerance:.0%}：")
+        for name, base_ms, cur_ms, ratio, slow in compare(results, baseline, args.tolerance):
+            flag = "  ⚠️ 回退" if slow else ""
+            print(f"{name:<36} {base_ms:10.2f} → {cur_ms:10.2f} ms  ×{ratio:.2f}{flag}")
+            regressed = regressed or slow
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,56 @@
+import threading
+
+# --- 取消令牌：停止时立即执行登记的中断动作 (关闭在途连接等)，而不是等下一次轮询 ---
+# 令牌本身可调用，返回是否已取消，可直接当作 should_stop 传给原有接口
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_id = 0
+
+    def __call__(self):
+        return self._event.is_set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass
+
+    def on_cancel(self, fn):
+        # 登记中断动作，返回注销用的句柄；已取消时立即执行
+        with self._lock:
+            if not self._event.is_set():
+                self._next_id += 1
+                self._callbacks[self._next_id] = fn
+                return self._next_id
+        fn()
+        return None
+
+    def remove(self, handle):
+        if handle is None:
+            return
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+
+def as_token(should_stop):
+    # 普通的 should_stop 回调无法推送取消，返回 None 表示只能轮询
+    return should_stop if isinstance(should_stop, CancelToken) else None
@@ -0,0 +1,155 @@
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+
+# --- 文档解析结果的磁盘缓存 (按文件内容哈希 + 解析器版本寻址) ---
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".jinta_lesson_cache")
+DOC_CACHE_DIR = os.path.join(CACHE_ROOT, "docs")
+
+# 解析逻辑有变化时递增，旧版本的缓存条目会自然失效并被LRU淘汰
+PARSER_VERSION = 1
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(filepath):
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DocumentCache:
+    def __init__(self, cache_dir=DOC_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+        # entries: key -> {"size", "atime", "name", "meta"}
+        # stats:   路径 -> [size, mtime_ns, sha256]，文件未改动时免去重复哈希
+        self.entries = {}
+        self.stats = {}
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                self.entries = index.get("entries", {})
+                self.stats = index.get("stats", {})
+        except Exception:
+            self.entries = {}
+            self.stats = {}
+
+    def _save_index(self):
+        tmp_file = self.index_file + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"entries": self.entries, "stats": self.stats}, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+        except Exception:
+            pass
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".txt.gz")
+
+    @staticmethod
+    def make_key(content_hash, variant=""):
+        # variant：同一文档的派生内容 (如摘要)，与原文共用 LRU 淘汰
+        if variant:
+            return f"{content_hash}-{variant}-v{PARSER_VERSION}"
+        return f"{content_hash}-v{PARSER_VERSION}"
+
+    def hash_file(self, filepath):
+        st = os.stat(filepath)
+        abs_path = os.path.abspath(filepath)
+        with self.lock:
+            known = self.stats.get(abs_path)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        content_hash = file_sha256(filepath)
+        with self.lock:
+            self.stats[abs_path] = [st.st_size, st.st_mtime_ns, content_hash]
+        return content_hash
+
+    def contains(self, content_hash, variant=""):
+        key = self.make_key(content_hash, variant)
+        with self.lock:
+            return key in self.entries and os.path.exists(self._entry_path(key))
+
+    def get_meta(self, content_hash, variant=""):
+        # 只读元数据，不读正文也不刷新访问时间
+        with self.lock:
+            entry = self.entries.get(self.make_key(content_hash, variant))
+            return dict(entry.get("meta", {})) if entry else {}
+
+    def get(self, content_hash, variant=""):
+        key = self.make_key(content_hash, variant)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            try:
+                with gzip.open(self._entry_path(key), 'rt', encoding='utf-8') as f:
+                    text = f.read()
+            except Exception:
+                # 缓存文件被外部删除或损坏，按未命中处理
+                self.entries.pop(key, None)
+                self._save_index()
+                return None
+            entry["atime"] = time.time()
+            self._save_index()
+            return {"name": entry.get("name", ""), "text": text, "meta": entry.get("meta", {})}
+
+    def put(self, content_hash, name, text, meta=None, variant=""):
+        key = self.make_key(content_hash, variant)
+        path = self._entry_path(key)
+        tmp_path = path + ".tmp"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except Exception:
+            return
+        with self.lock:
+            self.entries[key] = {"size": size, "atime": time.time(), "name": name, "meta": meta or {}}
+            self._evict_locked()
+            self._save_index()
+
+    def _evict_locked(self):
+        total = sum(e["size"] for e in self.entries.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self.entries.items(), key=lambda kv: kv[1]["atime"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self.entries[key]
+        live_hashes = {k.split("-", 1)[0] for k in self.entries}
+        self.stats = {p: s for p, s in self.stats.items() if s[2] in live_hashes}
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                try:
+                    os.remove(self._entry_path(key))
+                except OSError:
+                    pass
+            self.entries = {}
+            self.stats = {}
+            self._save_index()
@@ -0,0 +1,136 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from api_client import RequestCancelled
+from cancel_token import as_token
+from doc_index import chunk_text, tokenize
+from prompt_budget import compact_whitespace
+
+# --- 参考文档摘要 (map-reduce)：每份文档按课题提炼一次，之后各课时复用 ---
+# map：把原文切成大段并行提炼要点；reduce：要点过长时再合并压缩一次
+# 摘要与原文一起存入文档缓存，按 文件内容哈希 + 课题 + 模型 + 摘要版本 寻址，文档或课题变化才重新生成
+
+# 提炼提示词或切分方式有变化时递增
+DIGEST_VERSION = 1
+MAP_CHUNK_CHARS = 6000
+# 超大文档只提炼与课题最相关的若干段，控制调用次数
+MAX_MAP_CHUNKS = 24
+MAP_LIMIT_CHARS = 400
+DIGEST_LIMIT_CHARS = 1500
+DIGEST_WORKERS = 4
+NO_CONTENT = "无相关内容"
+
+MAP_TEMPLATE = """
+        以下是教师上传的参考文件《{name}》的第 {index}/{total} 段节选。
+        请围绕高中化学课题《{topic}》提炼其中对备课有用的内容：核心概念与结论、实验及现象、典型例题与习题、生活或科技情境素材。
+        保留关键数据、化学式 (使用 Unicode 上下标) 与题目要点，删去与课题无关的内容。纯文本，无Markdown，不超过 {limit} 字。
+        若本段与课题无关，只回复“{none}”。
+
+        {chunk}
+        """
+
+REDUCE_TEMPLATE = """
+        以下是参考文件《{name}》各部分围绕课题《{topic}》提炼出的要点。
+        请合并去重，按“核心知识”“实验与现象”“例题与习题”“情境素材”分类整理成一份完整摘要。
+        保留化学式 (Unicode 上下标) 与关键数据。纯文本，无Markdown，不超过 {limit} 字。
+
+        {parts}
+        """
+
+
+def digest_variant(topic, model):
+    fingerprint = hashlib.sha1(f"{topic}\n{model}".encode("utf-8")).hexdigest()[:16]
+    return f"digest{DIGEST_VERSION}-{fingerprint}"
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def select_map_chunks(chunks, topic, limit=MAX_MAP_CHUNKS):
+    # 按课题词命中数挑选，保持原文顺序
+    if len(chunks) <= limit:
+        return chunks
+    terms = set(tokenize(topic))
+    scored = sorted(range(len(chunks)), key=lambda i: sum(1 for t in tokenize(chunks[i]) if t in terms), reverse=True)
+    keep = sorted(scored[:limit])
+    return [chunks[i] for i in keep]
+
+
+class DocumentDigester:
+    # doc_cache 为 None 时只在内存中生成，不落盘
+    def __init__(self, api_client, doc_cache=None, max_workers=DIGEST_WORKERS):
+        self.api_client = api_client
+        self.doc_cache = doc_cache
+        self.max_workers = max_workers
+
+    def cached(self, content_hash, topic):
+        if self.doc_cache is None:
+            return None
+        entry = self.doc_cache.get(content_hash, variant=digest_variant(topic, self.api_client.model))
+        return entry["text"] if entry is not None else None
+
+    def digest(self, name, text, topic, content_hash=None, should_stop=None, on_progress=None):
+        # 返回摘要文本；on_progress(done, total) 在工作线程回调
+        # should_stop 为 CancelToken 时在途请求随取消立即断开，并抛出 RequestCancelled
+        content_hash = content_hash or text_sha256(text)
+        cached = self.cached(content_hash, topic)
+        if cached is not None:
+            return cached
+        text = compact_whitespace(text)
+        # 经后端注册表请求时各段可能由不同后端应答：按实际应答的模型入缓存，混合多个模型时单独记一份
+        models = set()
+        if len(text) <= DIGEST_LIMIT_CHARS:
+            # 短文档原样保留，不必调用接口
+            result = text
+        else:
+            result = self._map_reduce(name, text, topic, should_stop, on_progress, models)
+        if self.doc_cache is not None:
+            model = "+".join(sorted(models)) or self.api_client.model
+            self.doc_cache.put(content_hash, name, result, meta={"topic": topic},
+                               variant=digest_variant(topic, model))
+        return result
+
+    def _complete(self, prompt, should_stop, models):
+        token = as_token(should_stop)
+        if should_stop is not None and should_stop():
+            raise RequestCancelled()
+        messages = [{"role": "user", "content": compact_whitespace(prompt)}]
+        response = self.api_client.chat_cancellable(messages, token, stream=False)
+        models.add(getattr(response, "backend_model", None) or self.api_client.model)
+        try:
+            return response.json()['choices'][0]['message']['content'].strip()
+        finally:
+            response.close()
+
+    def _map_reduce(self, name, text, topic, should_stop, on_progress, models):
+        chunks = select_map_chunks(chunk_text(text, MAP_CHUNK_CHARS), topic)
+        total = len(chunks)
+        done = [0]
+        lock = threading.Lock()
+
+        def summarize(index):
+            prompt = MAP_TEMPLATE.format(name=name, index=index + 1, total=total, topic=topic,
+                                         limit=MAP_LIMIT_CHARS, none=NO_CONTENT, chunk=chunks[index])
+            part = self._complete(prompt, should_stop, models)
+            with lock:
+                done[0] += 1
+                if on_progress:
+                    on_progress(done[0], total)
+            return part
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, total))
+        try:
+            futures = [executor.submit(summarize, i) for i in range(total)]
+            parts = [f.result() for f in futures]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        parts = [p for p in parts if p and NO_CONTENT not in p[:len(NO_CONTENT) + 4]]
+        if not parts:
+            return ""
+        joined = "\n".join(parts)
+        if len(joined) <= DIGEST_LIMIT_CHARS:
+            return joined
+        prompt = REDUCE_TEMPLATE.format(name=name, topic=topic, limit=DIGEST_LIMIT_CHARS, parts=joined)
+        return self._complete(prompt, should_stop, models)
@@ -0,0 +1,268 @@
+import re
+import math
+import threading
+from collections import Counter, defaultdict
+
+from prompt_budget import estimate_tokens
+
+# --- 参考文档检索索引：入库时分块 + BM25 倒排索引，按预算挑选相关段落 ---
+CHUNK_CHARS = 600
+DEFAULT_CONTEXT_BUDGET = 6000
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 相关段落占不到预算的该比例时 (课题与资料几乎没有共同词)，按原文顺序轮流取各文档开头的分块补足
+FALLBACK_MIN_SHARE = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+def tokenize(text):
+    # 英文/数字按整词，中文按相邻二字切分 (无需分词词典)
+    terms = []
+    for piece in _TOKEN_RE.findall(text.lower()):
+        if piece[0] < '一':
+            terms.append(piece)
+        elif len(piece) == 1:
+            terms.append(piece)
+        else:
+            terms.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return terms
+
+
+def chunk_text(text, max_chars=CHUNK_CHARS):
+    chunks = []
+    buf = ""
+    for para in text.split("\n"):
+        para = para.strip()
+        if not para:
+            continue
+        while len(para) > max_chars:
+            if buf:
+                chunks.append(buf)
+                buf = ""
+            chunks.append(para[:max_chars])
+            para = para[max_chars:]
+        if buf and len(buf) + len(para) + 1 > max_chars:
+            chunks.append(buf)
+            buf = ""
+        buf = f"{buf}\n{para}" if buf else para
+    if buf:
+        chunks.append(buf)
+    return chunks
+
+
+class DocumentIndex:
+    # store 为 TextStore 时分块正文写入磁盘，内存里只保留倒排索引与分块元数据
+    def __init__(self, chunk_chars=CHUNK_CHARS, store=None):
+        self.chunk_chars = chunk_chars
+        self.store = store
+        self.lock = threading.Lock()
+        # chunk_id -> (doc_id, 序号, 文本 (使用 store 时为 None), 词数, 估算token)
+        self.chunks = {}
+        self.postings = defaultdict(dict)
+        self.doc_chunks = {}
+        # chunk_id -> 该块出现的词 (移除时只清理这些倒排项，与文档规模成线性)
+        self.chunk_terms = {}
+        self.doc_names = {}
+        # doc_id -> TextStore 句柄
+        self.doc_handles = {}
+        # doc_id -> 入库版本号：同一路径每次重新入库都会变化，后台移除据此确认移除的仍是当时那一份
+        self.doc_versions = {}
+        self.next_version = 0
+        self.next_id = 0
+        self.total_terms = 0
+
+    def add_document(self, doc_id, name, text):
+        # 分块、分词与写盘在锁外完成，避免阻塞并发检索
+        chunks = chunk_text(text, self.chunk_chars)
+        prepared = [(seq, chunk, Counter(tokenize(chunk))) for seq, chunk in enumerate(chunks)]
+        handle = self.store.put(chunks) if self.store is not None else None
+        with self.lock:
+            self._remove_locked(doc_id)
+            ids = []
+            for seq, chunk, tf in prepared:
+                cid = self.next_id
+                self.next_id += 1
+                length = sum(tf.values())
+                kept = chunk if handle is None else None
+                self.chunks[cid] = (doc_id, seq, kept, length, estimate_tokens(chunk))
+                for term, count in tf.items():
+                    self.postings[term][cid] = count
+                self.total_terms += length
+                self.chunk_terms[cid] = tuple(tf)
+                ids.append(cid)
+            self.doc_chunks[doc_id] = ids
+            self.doc_names[doc_id] = name
+            self.next_version += 1
+            self.doc_versions[doc_id] = self.next_version
+            if handle is not None:
+                self.doc_handles[doc_id] = handle
+
+    def version(self, doc_id):
+        with self.lock:
+            return self.doc_versions.get(doc_id)
+
+    def remove_document(self, doc_id, version=None):
+        # 指定 version 时只在文档仍是该版本时移除；返回是否移除
+        with self.lock:
+            if version is not None and self.doc_versions.get(doc_id) != version:
+                return False
+            self._remove_locked(doc_id)
+            return True
+
+    def rename_document(self, old_id, new_id, name):
+        # 换路径 (改名/移动) 时沿用已有分块与索引，不重新分词
+        with self.lock:
+            if old_id not in self.doc_chunks or new_id in self.doc_chunks:
+                return False
+            ids = self.doc_chunks.pop(old_id)
+            for cid in ids:
+                self.chunks[cid] = (new_id,) + self.chunks[cid][1:]
+            self.doc_chunks[new_id] = ids
+            self.doc_versions[new_id] = self.doc_versions.pop(old_id)
+            self.doc_names.pop(old_id, None)
+            self.doc_names[new_id] = name
+            if old_id in self.doc_handles:
+                self.doc_handles[new_id] = self.doc_handles.pop(old_id)
+            return True
+
+    def _remove_locked(self, doc_id):
+        ids = self.doc_chunks.pop(doc_id, [])
+        for cid in ids:
+            self.total_terms -= self.chunks.pop(cid)[3]
+            for term in self.chunk_terms.pop(cid, ()):
+                plist = self.postings.get(term)
+                if plist is None:
+                    continue
+                plist.pop(cid, None)
+                if not plist:
+                    del self.postings[term]
+        self.doc_names.pop(doc_id, None)
+        self.doc_versions.pop(doc_id, None)
+        handle = self.doc_handles.pop(doc_id, None)
+        if handle is not None:
+            self.store.remove(handle)
+
+    def clear(self):
+        with self.lock:
+            for handle in self.doc_handles.values():
+                self.store.remove(handle)
+            self.doc_handles.clear()
+            self.chunks.clear()
+            self.postings.clear()
+            self.doc_chunks.clear()
+            self.chunk_terms.clear()
+            self.doc_versions.clear()
+            self.doc_names.clear()
+            self.total_terms = 0
+
+    def total_tokens(self, skip_docs=None):
+        with self.lock:
+            return sum(c[4] for c in self.chunks.values() if not skip_docs or c[0] not in skip_docs)
+
+    def doc_tokens(self, doc_id):
+        # 文档全部分块的估算 token 之和；尚未建好索引时为 0
+        with self.lock:
+            return sum(self.chunks[cid][4] for cid in self.doc_chunks.get(doc_id, ()))
+
+    def iter_document(self, doc_id):
+        # 逐块产出文档正文，不拼出整份副本
+        with self.lock:
+            handle = self.doc_handles.get(doc_id)
+            texts = [self.chunks[cid][2] for cid in self.doc_chunks.get(doc_id, ())] if handle is None else None
+        if handle is None:
+            yield from texts
+        else:
+            yield from self.store.iter_chunks(handle)
+
+    def document_text(self, doc_id):
+        # 由分块还原的全文 (段落间以换行分隔)
+        return "\n".join(self.iter_document(doc_id))
+
+    def search(self, query):
+        with self.lock:
+            n = len(self.chunks)
+            if n == 0:
+                return []
+            avgdl = self.total_terms / n or 1
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                plist = self.postings.get(term)
+                if not plist:
+                    continue
+                idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+                for cid, tf in plist.items():
+                    dl = self.chunks[cid][3]
+                    scores[cid] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl))
+            return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+    def pick_chunks(self, query, budget_tokens, exclude=None, skip_docs=None):
+        # 按相关度在预算内挑选分块，返回 chunk_id 列表
+        # exclude：已在别处注入的 chunk_id，不再重复挑选；skip_docs：不参与挑选的文档
+        ranked = self.search(query)
+        with self.lock:
+            candidates = [cid for cid, c in self.chunks.items() if not skip_docs or c[0] not in skip_docs]
+            if not exclude and sum(self.chunks[cid][4] for cid in candidates) <= budget_tokens:
+                return candidates
+            picked = []
+            used = 0
+            for cid, _ in ranked:
+                if cid not in self.chunks:
+                    continue
+                if exclude and cid in exclude:
+                    continue
+                if skip_docs and self.chunks[cid][0] in skip_docs:
+                    continue
+                cost = self.chunks[cid][4]
+                if used + cost > budget_tokens:
+                    continue
+                picked.append(cid)
+                used += cost
+            if used < budget_tokens * FALLBACK_MIN_SHARE:
+                picked += self._leading_chunks_locked(budget_tokens - used, set(picked), exclude, skip_docs)
+            return picked
+
+    def _leading_chunks_locked(self, budget_tokens, taken, exclude, skip_docs):
+        # 逐轮取每份文档的下一块 (第 1 轮为各文档开头)，保证没有检索命中时也有参考素材
+        docs = [ids for d, ids in self.doc_chunks.items() if not skip_docs or d not in skip_docs]
+        picked = []
+        used = 0
+        for rank in range(max((len(ids) for ids in docs), default=0)):
+            for ids in docs:
+                if rank >= len(ids):
+                    continue
+                cid = ids[rank]
+                if cid in taken or (exclude and cid in exclude):
+                    continue
+                cost = self.chunks[cid][4]
+                if used + cost > budget_tokens:
+                    continue
+                picked.append(cid)
+                used += cost
+        return picked
+
+    def passages(self, chunk_ids):
+        # 返回 [(文件名, [段落...])]，文件与段落均保持原文顺序；只读出被选中的分块
+        with self.lock:
+            grouped = defaultdict(list)
+            for cid in chunk_ids:
+                chunk = self.chunks.get(cid)
+                if chunk is not None:
+                    grouped[chunk[0]].append((chunk[1], chunk[2]))
+            order = [(d, self.doc_names[d], self.doc_handles.get(d)) for d in self.doc_chunks if d in grouped]
+        sections = []
+        for doc_id, name, handle in order:
+            items = sorted(grouped[doc_id])
+            if handle is None:
+                texts = [text for _, text in items]
+            else:
+                try:
+                    texts = self.store.read(handle, [seq for seq, _ in items])
+                except KeyError:
+                    # 读取前文档刚好被移除
+                    continue
+            sections.append((name, texts))
+        return sections
+
+    def select_passages(self, query, budget_tokens, exclude=None, skip_docs=None):
+        return self.passages(self.pick_chunks(query, budget_tokens, exclude, skip_docs))
@@ -0,0 +1,311 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# --- 文档解析引擎：有界进程池 + PDF按页段切分并行 ---
+# python-docx / python-pptx / pypdf 在首次解析时才导入，不拖慢主窗口启动
+# 每个进程池任务处理的PDF页数，兼顾并行度与重复打开文件的开销
+PDF_PAGES_PER_TASK = 16
+# 给界面线程留出一个核心
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+# ---------- 以下为可在子进程中执行的顶层函数 ----------
+
+# 由进程池 initializer 注入：逐页进度队列与取消代次计数器
+_worker_progress = None
+_worker_cancel_gen = None
+
+
+def _init_worker(progress_queue, cancel_gen):
+    global _worker_progress, _worker_cancel_gen
+    _worker_progress = progress_queue
+    _worker_cancel_gen = cancel_gen
+
+
+def extract_docx(filepath):
+    from docx import Document
+    doc = Document(filepath)
+    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+
+
+def extract_pptx(filepath):
+    # 返回 (文本, 幻灯片页数)
+    import pptx
+    text_content = ""
+    prs = pptx.Presentation(filepath)
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                text_content += shape.text + "\n"
+    return text_content, len(prs.slides)
+
+
+def extract_plain(filepath):
+    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+
+def pdf_page_count(filepath):
+    import pypdf
+    return len(pypdf.PdfReader(filepath).pages)
+
+
+def iter_pdf_pages(filepath, start=0, end=None, should_stop=None):
+    # 每页只调用一次 extract_text，逐页产出，便于上报进度与中途取消
+    import pypdf
+    reader = pypdf.PdfReader(filepath)
+    if end is None:
+        end = len(reader.pages)
+    for i in range(start, end):
+        if should_stop is not None and should_stop():
+            raise IngestCancelled()
+        yield i, reader.pages[i].extract_text() or ""
+
+
+def extract_pdf_range(filepath, start, end, task_tag=None, generation=None):
+    def should_stop():
+        return generation is not None and _worker_cancel_gen is not None and _worker_cancel_gen.value != generation
+
+    texts = []
+    for _, page_text in iter_pdf_pages(filepath, start, end, should_stop):
+        if page_text:
+            texts.append(page_text)
+        if _worker_progress is not None and task_tag is not None:
+            _worker_progress.put((task_tag, 1))
+    return "\n".join(texts)
+
+
+def extract_whole(filepath, ext):
+    # 返回 (文本, 页数)；没有页概念的格式页数为 0
+    if ext == '.docx':
+        return extract_docx(filepath), 0
+    if ext == '.pptx':
+        return extract_pptx(filepath)
+    if ext == '.pdf':
+        pages = pdf_page_count(filepath)
+        return extract_pdf_range(filepath, 0, pages), pages
+    return extract_plain(filepath), 0
+
+
+# ---------- 调度端 (运行在GUI进程内) ----------
+
+class _FileJob:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.name = os.path.basename(filepath)
+        self.ext = os.path.splitext(filepath)[1].lower()
+        self.content_hash = None
+        self.generation = 0
+        self.total_pages = 0
+        self.pages_done = 0
+        # PDF 页数 / 幻灯片页数，随结果写入缓存元数据
+        self.pages = 0
+        self.parts = []
+        self.remaining = 0
+        self.futures = []
+        self.finished = False
+
+
+class IngestEngine:
+    # 回调均在后台线程触发，调用方需自行切回界面线程：
+    #   on_progress(filepath, done, total, unit)   unit 为 "页"(PDF) 或 "段"
+    #   on_done(filepath, name, text, content_hash, from_cache, meta)   meta: {"pages": 页数}
+    #   on_error(filepath, name, exc)               取消时 exc 为 IngestCancelled
+    def __init__(self, cache=None, max_workers=DEFAULT_WORKERS, on_progress=None, on_done=None, on_error=None):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.lock = threading.Lock()
+        self.executor = None
+        self.active = {}
+        self.progress_queue = None
+        self.cancel_gen = None
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self._ensure_channels_locked()
+                initargs = (self.progress_queue, self.cancel_gen)
+                try:
+                    self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=initargs)
+                except (OSError, NotImplementedError, ImportError):
+                    # 受限环境无法创建子进程时退化为线程池
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=initargs)
+            return self.executor
+
+    def _ensure_channels_locked(self):
+        if self.progress_queue is None:
+            self.progress_queue = multiprocessing.Queue()
+            self.cancel_gen = multiprocessing.Value('i', 0)
+            threading.Thread(target=self._progress_listener, daemon=True).start()
+
+    def _progress_listener(self):
+        while True:
+            try:
+                filepath, pages = self.progress_queue.get()
+            except (EOFError, OSError):
+                return
+            with self.lock:
+                job = self.active.get(filepath)
+                if job is None or job.finished:
+                    continue
+                job.pages_done += pages
+                done, total = job.pages_done, job.total_pages
+            if self.on_progress:
+                self.on_progress(filepath, done, total, "页")
+
+    def _reset_executor(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+    def is_busy(self, filepath=None):
+        with self.lock:
+            if filepath is None:
+                return bool(self.active)
+            return filepath in self.active
+
+    def ingest(self, filepaths):
+        # 哈希与缓存查询放在后台线程，避免大文件阻塞界面
+        filepaths = [fp for fp in filepaths if not self.is_busy(fp)]
+        if not filepaths:
+            return
+        jobs = [_FileJob(fp) for fp in filepaths]
+        with self.lock:
+            self._ensure_channels_locked()
+            for job in jobs:
+                job.generation = self.cancel_gen.value
+                self.active[job.filepath] = job
+        threading.Thread(target=self._dispatch, args=(jobs,), daemon=True).start()
+
+    def _dispatch(self, jobs):
+        for job in jobs:
+            if job.finished:
+                continue
+            try:
+                if self.cache is not None:
+                    job.content_hash = self.cache.hash_file(job.filepath)
+                    cached = self.cache.get(job.content_hash)
+                    if cached is not None:
+                        job.pages = cached["meta"].get("pages", 0)
+                        self._finish(job, cached["text"], from_cache=True)
+                        continue
+                if job.ext == '.pdf':
+                    fut = self._submit(pdf_page_count, job.filepath)
+                    fut.add_done_callback(lambda f, j=job: self._on_page_count(j, f))
+                else:
+                    self._schedule_parts(job, [(extract_whole, (job.filepath, job.ext))])
+            except Exception as e:
+                self._fail(job, e)
+
+    def _submit(self, fn, *args):
+        try:
+            return self._get_executor().submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError):
+            # 子进程意外退出后进程池不可再用，重建一次
+            self._reset_executor()
+            return self._get_executor().submit(fn, *args)
+
+    def _on_page_count(self, job, fut):
+        try:
+            total_pages = fut.result()
+            ranges = [(s, min(s + PDF_PAGES_PER_TASK, total_pages)) for s in range(0, total_pages, PDF_PAGES_PER_TASK)]
+            if not ranges:
+                raise ValueError("PDF 文件不包含任何页面。")
+            job.total_pages = total_pages
+            job.pages = total_pages
+            tasks = [(extract_pdf_range, (job.filepath, s, e, job.filepath, job.generation)) for s, e in ranges]
+            self._schedule_parts(job, tasks)
+        except Exception as e:
+            self._fail(job, e)
+
+    def _schedule_parts(self, job, tasks):
+        with self.lock:
+            if job.finished:
+                return
+            job.parts = [None] * len(tasks)
+            job.remaining = len(tasks)
+        if self.on_progress:
+            if job.total_pages:
+                self.on_progress(job.filepath, 0, job.total_pages, "页")
+            else:
+                self.on_progress(job.filepath, 0, len(tasks), "段")
+        for index, (fn, args) in enumerate(tasks):
+            fut = self._submit(fn, *args)
+            job.futures.append(fut)
+            fut.add_done_callback(lambda f, j=job, i=index: self._on_part_done(j, i, f))
+
+    def _on_part_done(self, job, index, fut):
+        if fut.cancelled():
+            return
+        try:
+            part_text = fut.result()
+        except Exception as e:
+            self._fail(job, e)
+            return
+        if job.ext != '.pdf':
+            # 整文件解析任务同时返回页数
+            part_text, job.pages = part_text
+        with self.lock:
+            if job.finished:
+                return
+            job.parts[index] = part_text
+            job.remaining -= 1
+            remaining = job.remaining
+            total = len(job.parts)
+        if self.on_progress and not job.total_pages:
+            self.on_progress(job.filepath, total - remaining, total, "段")
+        if remaining == 0:
+            # 按页段原始顺序重新拼接
+            text_content = "\n".join(p for p in job.parts if p)
+            if not text_content.strip():
+                self._fail(job, ValueError("未提取到有效文本或不支持该二进制格式。"))
+                return
+            if self.cache is not None and job.content_hash:
+                self.cache.put(job.content_hash, job.name, text_content, meta={"pages": job.pages})
+            self._finish(job, text_content, from_cache=False)
+
+    def _finish(self, job, text_content, from_cache):
+        with self.lock:
+            if job.finished:
+                return
+            job.finished = True
+            self.active.pop(job.filepath, None)
+        if self.on_done:
+            self.on_done(job.filepath, job.name, text_content, job.content_hash, from_cache, {"pages": job.pages})
+
+    def _fail(self, job, exc):
+        with self.lock:
+            if job.finished:
+                return
+            job.finished = True
+            self.active.pop(job.filepath, None)
+        for fut in job.futures:
+            fut.cancel()
+        if self.on_error:
+            self.on_error(job.filepath, job.name, exc)
+
+    def cancel(self):
+        # 递增取消代次：排队中的页段直接撤销，正在执行的页段在下一页开始前退出
+        with self.lock:
+            if self.cancel_gen is not None:
+                with self.cancel_gen.get_lock():
+                    self.cancel_gen.value += 1
+            jobs = list(self.active.values())
+        for job in jobs:
+            self._fail(job, IngestCancelled())
+        return len(jobs)
+
+    def shutdown(self):
+        self._reset_executor()
@@ -0,0 +1,94 @@
+import os
+
+# --- 参考资料文件夹监视：定时扫描目录树，只把新增或改动过的文件交给解析 ---
+# 先比较 大小 + 修改时间，变化的文件再用内容哈希确认 (只是被“触碰”过的文件不会重新解析)；
+# 同一内容换了路径 (重命名/移动) 识别为改名，不重复解析
+
+SUPPORTED_EXTS = (".docx", ".pptx", ".pdf", ".txt", ".md")
+# 扫描间隔 (毫秒)
+WATCH_INTERVAL_MS = 5000
+
+
+def _is_candidate(name, extensions):
+    # 跳过隐藏文件与 Office 打开文档时生成的 ~$ 锁文件
+    if name.startswith((".", "~$")):
+        return False
+    return name.lower().endswith(extensions)
+
+
+class ScanResult:
+    def __init__(self):
+        # added / changed / removed: [(路径, 内容哈希)]；renamed: [(旧路径, 新路径, 内容哈希)]
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.renamed = []
+        self.errors = {}
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed or self.renamed)
+
+
+class FolderScanner:
+    # hash_file(path) -> 内容哈希；传入 DocumentCache.hash_file 可复用其按 大小+mtime 缓存的哈希
+    def __init__(self, root, hash_file, extensions=SUPPORTED_EXTS):
+        self.root = os.path.abspath(root)
+        self.hash_file = hash_file
+        self.extensions = tuple(extensions)
+        # 路径 -> (大小, mtime_ns, 内容哈希)
+        self.snapshot = {}
+
+    def _walk(self):
+        found = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if not _is_candidate(name, self.extensions):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (st.st_size, st.st_mtime_ns)
+        return found
+
+    def scan(self):
+        # 在后台线程调用；返回与上次扫描相比的变化
+        result = ScanResult()
+        found = self._walk()
+        snapshot = {}
+        for path, (size, mtime) in found.items():
+            old = self.snapshot.get(path)
+            if old is not None and old[0] == size and old[1] == mtime:
+                snapshot[path] = old
+                continue
+            try:
+                content_hash = self.hash_file(path)
+            except OSError as e:
+                # 文件正在被写入或已被删除，下一轮再看
+                result.errors[path] = str(e)
+                if old is not None:
+                    snapshot[path] = old
+                continue
+            snapshot[path] = (size, mtime, content_hash)
+            if old is None:
+                result.added.append((path, content_hash))
+            elif old[2] != content_hash:
+                result.changed.append((path, content_hash))
+
+        removed = [(path, old[2]) for path, old in self.snapshot.items() if path not in snapshot]
+        # 消失的旧路径与新出现的同内容路径配对为改名
+        added_by_hash = {}
+        for path, content_hash in result.added:
+            added_by_hash.setdefault(content_hash, []).append(path)
+        for path, content_hash in removed:
+            candidates = added_by_hash.get(content_hash)
+            if candidates:
+                new_path = candidates.pop(0)
+                result.renamed.append((path, new_path, content_hash))
+                result.added.remove((new_path, content_hash))
+            else:
+                result.removed.append((path, content_hash))
+        self.snapshot = snapshot
+        return result
@@ -0,0 +1,132 @@
+import json
+
+# --- 增量 JSON 解析：流式接收模型输出，顶层字段一旦完整立即产出 ---
+# 只需处理 {"key": value, ...} 形式的单层对象；嵌套数组/对象作为整体值解析。
+
+_SEEK, _KEY, _KEY_STR, _COLON, _VALUE, _STRING, _RAW, _AFTER, _DONE = range(9)
+
+
+class JsonFieldStreamer:
+    def __init__(self):
+        self.state = _SEEK
+        self.key = None
+        self.raw = []
+        self.escape = False
+        self.depth = 0
+        self.in_raw_string = False
+        self.fields = {}
+        self.text = []
+
+    def feed(self, chunk):
+        # 返回本次新完成的 [(key, value)]
+        self.text.append(chunk)
+        completed = []
+        for ch in chunk:
+            state = self.state
+            if state == _STRING or state == _KEY_STR:
+                if self.escape:
+                    self.raw.append(ch)
+                    self.escape = False
+                elif ch == '\\':
+                    self.raw.append(ch)
+                    self.escape = True
+                elif ch == '"':
+                    text = self._decode(self.raw)
+                    self.raw = []
+                    if state == _KEY_STR:
+                        self.key = text
+                        self.state = _COLON
+                    else:
+                        completed.append(self._emit(text))
+                        self.state = _AFTER
+                else:
+                    self.raw.append(ch)
+            elif state == _RAW:
+                if self.in_raw_string:
+                    self.raw.append(ch)
+                    if self.escape:
+                        self.escape = False
+                    elif ch == '\\':
+                        self.escape = True
+                    elif ch == '"':
+                        self.in_raw_string = False
+                elif self.depth == 0 and ch in ',}':
+                    completed.append(self._emit(self._decode_raw(self.raw)))
+                    self.raw = []
+                    self.state = _KEY if ch == ',' else _DONE
+                else:
+                    self.raw.append(ch)
+                    if ch == '"':
+                        self.in_raw_string = True
+                    elif ch in '[{':
+                        self.depth += 1
+                    elif ch in ']}':
+                        self.depth -= 1
+            elif state == _SEEK:
+                # 跳过 ```json 之类的前缀
+                if ch == '{':
+                    self.state = _KEY
+            elif state == _KEY:
+                if ch == '"':
+                    self.raw = []
+                    self.escape = False
+                    self.state = _KEY_STR
+                elif ch == '}':
+                    self.state = _DONE
+            elif state == _COLON:
+                if ch == ':':
+                    self.state = _VALUE
+            elif state == _VALUE:
+                if ch == '"':
+                    self.raw = []
+                    self.escape = False
+                    self.state = _STRING
+                elif not ch.isspace():
+                    self.raw = [ch]
+                    self.depth = 1 if ch in '[{' else 0
+                    self.in_raw_string = False
+                    self.escape = False
+                    self.state = _RAW
+            elif state == _AFTER:
+                if ch == ',':
+                    self.state = _KEY
+                elif ch == '}':
+                    self.state = _DONE
+        return completed
+
+    def _emit(self, value):
+        key = self.key
+        self.fields[key] = value
+        self.key = None
+        return key, value
+
+    @staticmethod
+    def _decode(raw):
+        text = "".join(raw)
+        try:
+            return json.loads(f'"{text}"')
+        except ValueError:
+            return text
+
+    @staticmethod
+    def _flatten(value):
+        if isinstance(value, list):
+            return "\n".join(str(v) for v in value)
+        if isinstance(value, dict):
+            return "\n".join(f"{k}：{v}" for k, v in value.items())
+        return "" if value is None else str(value)
+
+    def _decode_raw(self, raw):
+        text = "".join(raw).strip()
+        try:
+            return self._flatten(json.loads(text))
+        except ValueError:
+            return text
+
+    def finish(self):
+        # 流结束后兜底：若增量解析未拿到任何字段，再整体解析一次
+        if self.fields:
+            return self.fields
+        full = "".join(self.text).replace("```json", "").replace("```", "").strip()
+        data = json.loads(full)
+        return {k: v if isinstance(v, str) else self._flatten(v) for k, v in data.items()}
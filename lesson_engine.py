@@ -0,0 +1,411 @@
+import os
+import json
+import threading
+from collections import deque
+
+from doc_index import DocumentIndex, DEFAULT_CONTEXT_BUDGET
+from prompt_budget import build_messages, format_doc_context, log_prompt_stats, estimate_tokens, DEFAULT_REQUEST_BUDGET
+from json_stream import JsonFieldStreamer
+from sse import SSEDecoder, iter_json_events
+from text_cleaner import StreamingCleaner, clean_text
+from response_cache import make_key as make_response_key, replay as replay_response
+from request_metrics import RequestMetrics, log_request_metrics
+from api_client import RequestCancelled, abort_response
+from cancel_token import as_token
+from doc_digest import DocumentDigester
+
+# --- 教案生成引擎：Prompt 构建 + 流式请求 + 结果清洗，不依赖任何界面 ---
+# 桌面界面与命令行批处理共用同一套逻辑
+
+# 配置文件路径 (用户主目录)
+CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".jinta_lesson_config.json")
+
+PLAN_TYPES = ["详案 (标准)", "简案 (提纲)", "匹配教学环节详案", "匹配教学环节简案"]
+DEFAULT_INSTRUCTION = "环节清晰，体现学生探究，师生互动具体"
+# 教学框架的字段，顺序与导出表格一致
+FRAMEWORK_FIELDS = ("chapter", "standard", "objectives", "key_points", "difficulties", "methods", "homework")
+# 估算取消节省量时参考的最近完整请求数
+COMPLETION_HISTORY = 20
+# 文档总量超出素材预算时，按课题挑选的共享素材所占份额；其余留给按本课时要求补充的节选
+SHARED_CONTEXT_SHARE = 0.75
+
+# 共享前缀的固定说明：只含课题，同一课题的所有请求完全一致
+SYSTEM_TEMPLATE = """
+        你是一名经验丰富的高中化学教师，正在为课题《{topic}》备课，需要按要求撰写教案框架或教学过程。
+        下文【文档素材库】是教师为本课题上传的参考文件节选；后续要求中提到“文档素材库”或点名某个上传文件时，均指这里的内容。
+        """
+
+
+def load_config(path=CONFIG_FILE):
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return {}
+
+
+class LessonEngine:
+    def __init__(self, api_client, response_cache=None, doc_index=None,
+                 context_budget=DEFAULT_CONTEXT_BUDGET, request_budget=DEFAULT_REQUEST_BUDGET, doc_cache=None,
+                 text_store=None):
+        self.api_client = api_client
+        self.response_cache = response_cache
+        # 文档分块倒排索引：每次请求只注入与课题相关的段落；传入 text_store 时分块正文存放在磁盘
+        self.doc_index = doc_index if doc_index is not None else DocumentIndex(store=text_store)
+        self.context_budget = context_budget
+        self.request_budget = request_budget
+        self.bypass_cache = False
+        # 累计被丢弃/无法解析的 SSE 事件数
+        self.sse_anomalies = 0
+        self.stats_lock = threading.Lock()
+        # on_metrics(metrics, final)：每次真实请求的耗时统计，流式过程中节流回调，结束时 final=True
+        self.on_metrics = None
+        # 各类请求最近完整输出的 token 数，用于估算取消时节省的量
+        self.completion_history = {}
+        # 文档摘要：开启后已摘要的文档以摘要代替原文注入；摘要随文档缓存落盘
+        self.use_digests = False
+        self.digester = DocumentDigester(api_client, doc_cache)
+        # doc_id -> 内容哈希；doc_id -> {课题: 摘要}
+        self.doc_hashes = {}
+        self.digests = {}
+        # 同一时刻只有一个线程生成摘要，批量任务并发调用时其余线程等待后直接复用
+        self.digest_lock = threading.Lock()
+
+    # ---------- 参考文档 ----------
+    def add_document(self, doc_id, name, text, content_hash=None):
+        self.doc_index.add_document(doc_id, name, text)
+        with self.stats_lock:
+            self.doc_hashes[doc_id] = content_hash
+            self.digests.pop(doc_id, None)
+
+    def remove_document(self, doc_id, version=None):
+        # version 见 DocumentIndex.version：后台移除时同一路径已被重新注入则保留新的一份
+        with self.stats_lock:
+            if not self.doc_index.remove_document(doc_id, version):
+                return False
+            self.doc_hashes.pop(doc_id, None)
+            self.digests.pop(doc_id, None)
+            return True
+
+    def rename_document(self, old_id, new_id, name):
+        # 同一内容换了路径：沿用索引与摘要
+        if not self.doc_index.rename_document(old_id, new_id, name):
+            return False
+        with self.stats_lock:
+            self.doc_hashes[new_id] = self.doc_hashes.pop(old_id, None)
+            if old_id in self.digests:
+                self.digests[new_id] = self.digests.pop(old_id)
+        return True
+
+    def document_text(self, doc_id):
+        return self.doc_index.document_text(doc_id)
+
+    def clear_documents(self):
+        self.doc_index.clear()
+        with self.stats_lock:
+            self.doc_hashes.clear()
+            self.digests.clear()
+
+    # ---------- 文档摘要 ----------
+    def missing_digests(self, topic):
+        with self.stats_lock:
+            return [d for d in list(self.doc_index.doc_names) if topic not in self.digests.get(d, {})]
+
+    def ensure_digests(self, topic, should_stop=None, on_progress=None):
+        # 为尚无本课题摘要的文档生成摘要 (磁盘缓存命中时不调用接口)；返回新处理的文档数
+        # on_progress(文件名, 已完成段数, 总段数)；取消时抛出 RequestCancelled
+        with self.digest_lock:
+            pending = self.missing_digests(topic)
+            for doc_id in pending:
+                name = self.doc_index.doc_names.get(doc_id)
+                if name is None:
+                    continue
+                text = self.doc_index.document_text(doc_id)
+                progress = (lambda done, total, name=name: on_progress(name, done, total)) if on_progress else None
+                digest = self.digester.digest(name, text, topic, self.doc_hashes.get(doc_id), should_stop, progress)
+                with self.stats_lock:
+                    if doc_id in self.doc_index.doc_names:
+                        self.digests.setdefault(doc_id, {})[topic] = digest
+            return len(pending)
+
+    def digest_sections(self, topic):
+        # 返回 (已有摘要的 doc_id 集合, [(文件名, [摘要])])，按文档载入顺序
+        with self.stats_lock:
+            ready = {d: v[topic] for d, v in self.digests.items() if topic in v}
+        sections = [(f"{name}（摘要）", [ready[d]]) for d, name in list(self.doc_index.doc_names.items())
+                    if d in ready and ready[d]]
+        return set(ready), sections
+
+    def get_doc_sections(self, query=""):
+        if not self.doc_index.doc_names:
+            return []
+        return self.doc_index.select_passages(query, self.context_budget)
+
+    def get_combined_doc_context(self, query=""):
+        return format_doc_context(self.get_doc_sections(query))
+
+    def get_prompt_sections(self, topic, query):
+        # 返回 (共享素材, 补充素材)：共享部分只按课题挑选，各课时与两类请求都相同，可命中前缀缓存；
+        # 文档超出预算时，再按本课时的具体要求补充前者未覆盖的段落
+        # 开启摘要时，已摘要的文档整体以摘要进入共享部分，其余文档仍按原文检索
+        if not self.doc_index.doc_names:
+            return [], []
+        skip, digested = self.digest_sections(topic) if self.use_digests else (set(), [])
+        budget = self.context_budget - sum(estimate_tokens(p) for _, passages in digested for p in passages)
+        if len(skip) >= len(self.doc_index.doc_names) or budget <= 0:
+            return digested, []
+        if self.doc_index.total_tokens(skip) <= budget:
+            return digested + self.doc_index.select_passages(topic, budget, skip_docs=skip), []
+        shared_budget = int(budget * SHARED_CONTEXT_SHARE)
+        shared = self.doc_index.pick_chunks(topic, shared_budget, skip_docs=skip)
+        extra = self.doc_index.pick_chunks(query, budget - shared_budget, exclude=set(shared), skip_docs=skip)
+        return digested + self.doc_index.passages(shared), self.doc_index.passages(extra)
+
+    # ---------- Prompt 构建 ----------
+    def prepare_messages(self, kind, topic, render, query):
+        # 发送前：估算 → 压缩素材 → 按单次请求预算裁剪，并记录统计；返回 (messages, stats)
+        shared, extra = self.get_prompt_sections(topic, query)
+        messages, stats = build_messages(SYSTEM_TEMPLATE.format(topic=topic), shared, render, extra, self.request_budget)
+        log_prompt_stats(kind, stats)
+        return messages, stats
+
+    def build_framework_prompt(self, topic, current_p, total_p, custom_content):
+        custom_instruction_block = ""
+        if custom_content:
+            custom_instruction_block = f"""
+        【最高优先级：教师自定义指令】
+        用户原话：“{custom_content}”
+        (注意：请你务必严格、优先遵循上述指令。如果指令中要求你解读、参考指定的上传文件，请仔细在【文档素材库】及本课时补充素材中寻找对应内容，并完全依据指令的要求执行。请勿使用通用废话敷衍。)
+        """
+        else:
+            custom_instruction_block = f"请根据教学逻辑，自动规划第{current_p}课时（共{total_p}课时）的核心内容。"
+
+        # 优化点：修改了 Prompt 指令，强制要求素养目标带有数字编号分条列出。
+        def render(doc_context):
+            return f"""
+        任务：为高中化学课题《{topic}》设计第 {current_p} 课时的教案框架。
+
+        {custom_instruction_block}
+        {doc_context}
+
+        【核心要求】
+        1. **课程标准**：【必须】引用**《普通高中化学课程标准（2017年版2025年日常修订版）》**中与本课时内容直接相关的具体条目，严禁使用“匹配课标”等模糊词汇。
+        2. **素养导向**：严禁使用“三维目标”分类。必须分条列出具体的素养目标，并带上数字编号（如 1. 2. 3.），每条采用“通过...培养...素养”的句式描述。
+        3. 格式：纯文本，无Markdown。**【重要】化学式、离子符号、化学方程式【必须】严格使用 Unicode 标准的上标和下标字符（例如：H₂O, SO₄²⁻, Fe³⁺, ∆表示加热），绝对不能用普通数字替代。**
+        4. 返回JSON格式，Key必须保持一致：
+        {{
+            "chapter": "所属章节",
+            "standard": "在此处填写具体的2025日常修订版课标条目内容",
+            "objectives": "素养导向目标",
+            "key_points": "重点",
+            "difficulties": "难点",
+            "methods": "方法",
+            "homework": "作业"
+        }}
+        """
+
+        return self.prepare_messages("framework", topic, render, f"{topic} 第{current_p}课时 {custom_content}")
+
+    def build_process_prompt(self, topic, context, instruction, plan_type, current_p):
+        custom_content = context.get('custom_content', '')
+
+        stage_requirements = ""
+        if "匹配教学环节" in plan_type:
+            stage_requirements = """
+        【教学环节强制要求】
+        必须严格按照以下五个高中化学常规环节展开：
+        - 环节一：学习目标。对标课标，深度融合五大核心素养，表述清晰可量化（如“能写出”、“会分析”）。
+        - 环节二：情景创设。使用生活、实验或前沿情境引发认知冲突或探究欲望。
+        - 环节三：任务驱动教学。拆解本节核心任务，该环节必须包含“自主学习或者合作探究”、“归纳小结”、“评价训练”3个基本子环节。
+        - 环节四：课堂小结。师生共同梳理本节课知识脉络，形成完整体系。
+        - 环节五：课堂检测。紧密围绕目标设计基础达标与能力提升题。
+        """
+
+        detail_level = ""
+        if "简案" in plan_type:
+            detail_level = "【篇幅与深度要求】只需体现出教学的核心框架和逻辑思路。严禁长篇大论，不需要写出具体的师生对话和详细的题目内容。"
+        elif "详案" in plan_type:
+            detail_level = "【篇幅与深度要求】需要详细写出教师的具体话术引导、预期的学生具体回答，以及每一道评价训练和课堂检测的具体题目内容。"
+
+        custom_instruction_block = ""
+        if custom_content:
+            custom_instruction_block = f"""
+        【最高优先级：教师自定义指令】
+        用户原话：“{custom_content}”
+        (注意：请你必须严格、优先遵循上述指令。如果指令中点名要求依据某个具体课件或教材来撰写，请务必在【文档素材库】及本课时补充素材中检索该文件内容，紧密结合其中的知识点、情境和习题来设计这节课的教学过程，你的输出必须高度体现该指令的定制意图。)
+        """
+
+        def render(doc_context):
+            return f"""
+        任务：撰写高中化学《{topic}》第 {current_p} 课时的“教学过程”。
+
+        {custom_instruction_block}
+
+        【基础设计信息】
+        素养目标：{context.get('objectives', '')}
+        重难点：{context.get('key_points', '')}
+        {doc_context}
+
+        【严格限制】
+        1. 格式：纯文本，严禁Markdown。**【重要】所有的化学式、离子符号等【必须】严格使用 Unicode 标准的上下标字符（例如：H₂O, CO₃²⁻, Fe³⁺）。**
+        2. 时长：40分钟。
+        3. 风格类型：{plan_type}。{instruction}
+        4. 理念：新课标“教-学-评”一体化。
+        {stage_requirements}
+        {detail_level}
+
+        【输出结构】
+        环节名称（时间） - 教师活动 - 学生活动 - 设计意图
+        """
+
+        return self.prepare_messages(
+            "process", topic, render,
+            f"{topic} 第{current_p}课时 {custom_content} {instruction} {context.get('objectives', '')} {context.get('key_points', '')}"
+        )
+
+    # ---------- 生成 ----------
+    def run_framework(self, messages, should_stop, on_field=None):
+        # 流式请求 + 增量JSON解析：每个字段一完整就回调 on_field(key, value)
+        # 返回清洗后的完整字段；中途停止时返回 None
+        streamer = JsonFieldStreamer()
+        for content in self.stream_completion("framework", messages, should_stop):
+            for key, value in streamer.feed(content):
+                if on_field:
+                    on_field(key, clean_text(value))
+        if should_stop(): return None
+        # 模型未按预期输出对象时，finish() 会整体解析兜底
+        return {k: clean_text(v) for k, v in streamer.finish().items()}
+
+    def run_process(self, messages, should_stop, on_delta=None):
+        # 返回完整的教学过程文本；中途停止时返回已生成部分
+        # 整个流共用一个清洗器，跨增量被切断的标记也能识别
+        cleaner = StreamingCleaner()
+        parts = []
+        for content in self.stream_completion("process", messages, should_stop):
+            content = cleaner.feed(content)
+            if content:
+                parts.append(content)
+                if on_delta:
+                    on_delta(content)
+        tail = cleaner.finish()
+        if tail:
+            parts.append(tail)
+            if on_delta:
+                on_delta(tail)
+        return "".join(parts)
+
+    def generate_framework(self, topic, current_p, total_p, custom_content, should_stop, on_field=None):
+        messages, _ = self.build_framework_prompt(topic, current_p, total_p, custom_content)
+        return self.run_framework(messages, should_stop, on_field)
+
+    def generate_process(self, topic, context, instruction, plan_type, current_p, should_stop, on_delta=None):
+        messages, _ = self.build_process_prompt(topic, context, instruction, plan_type, current_p)
+        return self.run_process(messages, should_stop, on_delta)
+
+    def stream_completion(self, kind, messages, should_stop):
+        # 先查响应缓存，命中则按界面节奏回放；未命中走网络，完整收完后写入缓存
+        # should_stop 为 CancelToken 时，取消会立即断开在途连接，不必等下一块数据
+        key = None
+        if self.response_cache is not None and not self.bypass_cache:
+            key = make_response_key(self.api_client.model, messages, stream=True)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                yield from replay_response(cached, should_stop)
+                return
+        token = as_token(should_stop)
+        metrics = RequestMetrics(kind, self.api_client.model)
+        metrics.expected_tokens = self._expected_tokens(kind, metrics.expected_tokens)
+        cancel_handle = token.on_cancel(metrics.mark_cancel) if token is not None else None
+        try:
+            response = self.api_client.chat_cancellable(
+                messages, token, stream=True, stream_options={"include_usage": True})
+        except RequestCancelled:
+            metrics.finish("cancelled")
+            self._report_metrics(metrics, True)
+            return
+        except Exception:
+            metrics.finish("error")
+            self._report_metrics(metrics, True)
+            raise
+        finally:
+            if token is not None:
+                token.remove(cancel_handle)
+        metrics.mark_connected()
+        # 经后端注册表发出的请求带有应答后端、其模型与是否对冲；缓存与统计按实际应答的模型记录
+        metrics.backend = getattr(response, "backend", None)
+        metrics.hedged = getattr(response, "hedged", False)
+        metrics.model = getattr(response, "backend_model", None) or metrics.model
+        if key is not None and metrics.model != self.api_client.model:
+            key = make_response_key(metrics.model, messages, stream=True)
+        decoder = SSEDecoder()
+        abort_handle = None
+        if token is not None:
+            def abort():
+                metrics.mark_cancel()
+                abort_response(response)
+            abort_handle = token.on_cancel(abort)
+        # 消费方提前关闭生成器 (停止) 时保持 cancelled
+        status = "cancelled"
+        try:
+            chunks = []
+            for content in self._iter_stream_content(response, decoder, metrics):
+                if should_stop(): return
+                metrics.on_content(content)
+                if metrics.live_due():
+                    metrics.bytes = decoder.bytes
+                    self._report_metrics(metrics, False)
+                chunks.append(content)
+                yield content
+            if should_stop(): return
+            status = "ok"
+            self._record_completion(kind, metrics.completion_tokens)
+            # 中途停止的不完整响应不入缓存
+            if key is not None:
+                self.response_cache.put(key, chunks, kind)
+        except Exception:
+            # 连接被取消动作断开时读取会抛出异常，按取消处理
+            if should_stop(): return
+            status = "error"
+            raise
+        finally:
+            if token is not None:
+                token.remove(abort_handle)
+            with self.stats_lock:
+                self.sse_anomalies += decoder.invalid + decoder.dropped
+            response.close()
+            metrics.bytes = decoder.bytes
+            metrics.finish(status)
+            self._report_metrics(metrics, True)
+
+    def _expected_tokens(self, kind, default):
+        with self.stats_lock:
+            history = self.completion_history.get(kind)
+            if history:
+                return sum(history) // len(history)
+        return default
+
+    def _record_completion(self, kind, tokens):
+        with self.stats_lock:
+            self.completion_history.setdefault(kind, deque(maxlen=COMPLETION_HISTORY)).append(tokens)
+
+    def _report_metrics(self, metrics, final):
+        if final:
+            log_request_metrics(metrics)
+        if self.on_metrics:
+            self.on_metrics(metrics, final)
+
+    def _iter_stream_content(self, response, decoder, metrics=None):
+        for event in iter_json_events(response, decoder):
+            if metrics is not None and isinstance(event, dict) and event.get('usage'):
+                metrics.usage = event['usage']
+            try:
+                content = event['choices'][0]['delta'].get('content')
+            except (KeyError, IndexError, TypeError, AttributeError):
+                # 末尾只携带 usage 的事件属正常情况，其余结构异常计入丢弃
+                if not (isinstance(event, dict) and event.get('usage')):
+                    decoder.dropped += 1
+                continue
+            if content:
+                yield content
@@ -0,0 +1,155 @@
+import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# --- Word 教案导出：每个课时一页，8 行表格排版 ---
+# 表格样式、行高、合并单元格与固定标题只构建一次，之后每个课时深拷贝这份模板再填字；
+# 每个课时渲染好的 XML 片段按内容指纹缓存，重复导出时未改动的课时直接复用。
+# python-docx 在导出时才导入，不拖慢启动
+
+# 排版有变化时递增，旧的片段缓存随之失效
+LAYOUT_VERSION = 2
+FRAGMENT_CACHE_SIZE = 64
+
+
+class FragmentCache:
+    # 指纹 -> 该课时的 XML 片段列表 (分页符、标题、表格)，LRU 淘汰
+    def __init__(self, max_entries=FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            fragments = self.entries.get(key)
+            if fragments is not None:
+                self.entries.move_to_end(key)
+            return fragments
+
+    def put(self, key, fragments):
+        with self.lock:
+            self.entries[key] = fragments
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def fragment_key(i, topic, total_p, date, data):
+    raw = json.dumps([LAYOUT_VERSION, i, topic, total_p, date, data], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _build_template(doc):
+    # 构建一张只含固定内容的课时表格，从文档中摘下作为模板
+    from docx.shared import Cm
+
+    table = doc.add_table(rows=8, cols=4)
+    table.style = 'Table Grid'
+    table.autofit = False
+
+    for row in table.rows:
+        row.height = Cm(1.2)
+
+    table.cell(0, 0).text = "课题"
+    table.cell(0, 2).text = "时间"
+    table.cell(1, 0).text = "课程章节"
+    table.cell(1, 2).text = "课时说明"
+    for r in range(2, 8):
+        table.cell(r, 0).merge(table.cell(r, 3))
+    table.cell(7, 0).text = "课后反思:\n"
+
+    tbl = table._tbl
+    tbl.getparent().remove(tbl)
+    return tbl
+
+
+def _render_period(doc, template, i, topic, total_p, date, data):
+    # 在文档末尾渲染一个课时，返回新增的顶层元素
+    from docx.table import Table
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    added = []
+    if i > 1:
+        added.append(doc.add_page_break()._p)
+
+    p_title = doc.add_heading(f"第 {i} 课时教案", level=1)
+    p_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    added.append(p_title._p)
+
+    tbl = copy.deepcopy(template)
+    p_title._p.addnext(tbl)
+    added.append(tbl)
+    table = Table(tbl, doc._body)
+
+    table.cell(0, 1).text = topic
+    table.cell(0, 3).text = date
+
+    # 优化点：导出教案时不再将“自定义内容”写入课时说明
+    table.cell(1, 1).text = data.get('chapter', '')
+    table.cell(1, 3).text = f"第 {i} 课时 (共 {total_p} 课时)"
+
+    table.cell(2, 0).text = f"课程标准:\n{data.get('standard', '（未生成，请点击生成框架）')}"
+    table.cell(3, 0).text = f"素养导向目标:\n{data.get('objectives', '')}"
+
+    p = table.cell(4, 0).paragraphs[0]
+    p.add_run("教学重点：").bold = True
+    p.add_run(f"{data.get('key_points', '')}\n")
+    p.add_run("教学难点：").bold = True
+    p.add_run(f"{data.get('difficulties', '')}\n")
+    p.add_run("教学方法：").bold = True
+    p.add_run(f"{data.get('methods', '')}")
+
+    cell = table.cell(5, 0)
+    cell.text = "教学过程与师生活动 (40分钟)"
+    # 教学过程按行拆成独立段落，长文本不再挤在一个段落里
+    for line in data.get('process', '').split("\n"):
+        cell.add_paragraph(line)
+
+    table.cell(6, 0).text = f"作业设计:\n{data.get('homework', '')}"
+    return added
+
+
+def export_lessons(filename, topic, total_p, lesson_data, cache=None, on_progress=None, should_stop=None):
+    # on_progress(done, total) 每完成一个课时回调一次；返回复用缓存的课时数
+    from docx import Document
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import qn
+    from lxml import etree
+
+    doc = Document()
+    doc.styles['Normal'].font.name = u'宋体'
+    doc.styles['Normal']._element.rPr.rFonts.set(qn('w:eastAsia'), u'宋体')
+    body = doc.element.body
+    date = datetime.now().strftime("%Y-%m-%d")
+
+    template = None
+    reused = 0
+    for i in range(1, total_p + 1):
+        if should_stop is not None and should_stop():
+            return reused
+        data = lesson_data.get(i, {})
+        if data:
+            key = fragment_key(i, topic, total_p, date, data) if cache is not None else None
+            fragments = cache.get(key) if cache is not None else None
+            if fragments is not None:
+                for xml in fragments:
+                    body.sectPr.addprevious(parse_xml(xml))
+                reused += 1
+            else:
+                if template is None:
+                    template = _build_template(doc)
+                added = _render_period(doc, template, i, topic, total_p, date, data)
+                if cache is not None:
+                    cache.put(key, [etree.tostring(el) for el in added])
+        if on_progress:
+            on_progress(i, total_p)
+
+    doc.save(filename)
+    return reused
@@ -0,0 +1,366 @@
+import os
+import time
+import threading
+from collections import deque
+
+from api_client import (DeepSeekClient, ApiError, RequestCancelled, abort_response,
+                        DEFAULT_BASE_URL, DEFAULT_MODEL, BASE_URL_ENV)
+
+# --- 接口后端注册表：DeepSeek、任意 OpenAI 兼容地址、本地 llama.cpp / vLLM 服务 ---
+# 按各后端近期的首字延迟与失败率排序路由；可选对冲：首选后端超过阈值仍未开始输出时，
+# 向次选后端再发一份同样的请求，先开始输出的一路胜出，另一路立即断开 (对冲会产生少量重复计费)
+# 开始输出前失败的请求总会按排序改投下一个启用的后端
+
+# 添加后端时可选的预设；未写 api_key 的后端共用主界面配置的 Key，本地服务不需要 Key
+PRESETS = {
+    "deepseek": {"base_url": DEFAULT_BASE_URL, "model": DEFAULT_MODEL},
+    "llama.cpp": {"base_url": "http://127.0.0.1:8080/v1", "model": "local", "api_key": ""},
+    "vllm": {"base_url": "http://127.0.0.1:8000/v1", "model": "Qwen2.5-7B-Instruct", "api_key": ""},
+}
+# 开启对冲时默认的首字等待阈值 (毫秒)；配置为 0 表示不对冲
+DEFAULT_HEDGE_MS = 3000
+# 一次请求最多同时在途的后端数 (首选 + 对冲)
+HEDGE_MAX_ATTEMPTS = 2
+# 延迟统计：保留最近的样本，超过有效期的样本不再参与排序 (高峰期过后自动恢复)
+STATS_WINDOW = 30
+STATS_TTL = 30 * 60
+MIN_SAMPLES = 3
+# 样本不足的后端按该首字延迟 (秒) 参与排序，首选后端明显变慢时会被换下来试一试
+UNSAMPLED_SCORE = 3.0
+FAILED_SCORE = 60.0
+
+
+class LatencyStats:
+    def __init__(self, window=STATS_WINDOW, ttl=STATS_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # (时刻, 首字延迟秒数)；(时刻, 是否成功)
+        self.samples = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.requests = 0
+        self.hedge_wins = 0
+        self.hedge_losses = 0
+
+    def record(self, seconds, ok=True):
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            if seconds is not None:
+                self.samples.append((now, seconds))
+            self.outcomes.append((now, ok))
+
+    def record_hedge(self, won):
+        with self.lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedge_losses += 1
+
+    def _recent(self, items):
+        horizon = time.monotonic() - self.ttl
+        return [v for t, v in items if t >= horizon]
+
+    def snapshot(self):
+        with self.lock:
+            samples = sorted(self._recent(self.samples))
+            outcomes = self._recent(self.outcomes)
+            requests, wins, losses = self.requests, self.hedge_wins, self.hedge_losses
+        failures = sum(1 for ok in outcomes if not ok)
+        return {
+            "samples": len(samples),
+            "p50": _percentile(samples, 0.5),
+            "p95": _percentile(samples, 0.95),
+            "error_rate": failures / len(outcomes) if outcomes else 0.0,
+            "requests": requests,
+            "hedge_wins": wins,
+            "hedge_losses": losses,
+        }
+
+    def score(self):
+        # 越小越优先：首字中位数按失败率加权
+        snap = self.snapshot()
+        if snap["samples"] < MIN_SAMPLES:
+            return FAILED_SCORE if snap["error_rate"] >= 1.0 else UNSAMPLED_SCORE
+        return snap["p50"] * (1 + 2 * snap["error_rate"])
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Backend:
+    # api_key 为 None 时共用注册表的 Key；本地服务传空串
+    # session_url：仅本次运行生效的地址 (环境变量指向模拟服务器等)，不写回配置
+    def __init__(self, name, base_url, model, api_key=None, enabled=True, session_url=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.shared_key = api_key is None
+        self.enabled = enabled
+        self.client = DeepSeekClient(api_key=api_key or "", base_url=session_url or self.base_url, model=model)
+        self.stats = LatencyStats()
+
+    @classmethod
+    def from_config(cls, entry, session_url=None):
+        preset = PRESETS.get(entry.get("name"), {})
+        return cls(
+            entry.get("name") or "backend",
+            entry.get("base_url") or preset.get("base_url") or DEFAULT_BASE_URL,
+            entry.get("model") or preset.get("model") or DEFAULT_MODEL,
+            entry["api_key"] if "api_key" in entry else preset.get("api_key"),
+            bool(entry.get("enabled", True)),
+            session_url
+        )
+
+    def to_config(self):
+        entry = {"name": self.name, "base_url": self.base_url, "model": self.client.model}
+        if not self.shared_key:
+            entry["api_key"] = self.client.api_key
+        if not self.enabled:
+            entry["enabled"] = False
+        return entry
+
+    @property
+    def model(self):
+        return self.client.model
+
+
+class HedgedResponse:
+    # 包装胜出的响应：先交还探测首个事件时已读出的数据，再接着读原响应
+    def __init__(self, response, head, chunks, backend, backend_model, hedged):
+        self._response = response
+        self._head = head
+        self._chunks = chunks
+        self.backend = backend
+        self.backend_model = backend_model
+        self.hedged = hedged
+
+    def iter_content(self, chunk_size=None):
+        yield from self._head
+        self._head = []
+        if self._chunks is not None:
+            yield from self._chunks
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+def _read_first_event(chunks):
+    # 读到第一个 data: 事件 (服务端开始输出) 为止；排队时的 keep-alive 注释不算
+    head = []
+    for chunk in chunks:
+        head.append(chunk)
+        if b"data:" in b"".join(head[-2:]):
+            break
+    return head
+
+
+class _HedgedCall:
+    def __init__(self, messages, stream, extra):
+        self.messages = messages
+        self.stream = stream
+        self.extra = extra
+        self.cond = threading.Condition()
+        self.launched = []
+        self.errors = []
+        # backend -> 已收到响应头、正在等首个事件的响应
+        self.pending = {}
+        self.winner = None
+        # 是否因首字超时并行发出过对冲请求 (失败后改投下一个不算)
+        self.hedged = False
+        self.cancelled = False
+        # 已有结果、取消或全部失败后置位：迟到的响应直接断开
+        self.finished = False
+
+    def launch(self, backend):
+        self.launched.append(backend)
+        threading.Thread(target=self._run, args=(backend,), daemon=True).start()
+
+    def cancel(self):
+        with self.cond:
+            self.cancelled = True
+            self.cond.notify_all()
+
+    def _run(self, backend):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = backend.client.chat(self.messages, stream=self.stream, **self.extra)
+            chunks = head = None
+            with self.cond:
+                if not self.finished:
+                    self.pending[backend] = response
+            if not self.finished and self.stream:
+                chunks = response.iter_content(chunk_size=None)
+                head = _read_first_event(chunks)
+        except Exception as e:
+            with self.cond:
+                self.pending.pop(backend, None)
+                if self.finished:
+                    self._lost(backend, started)
+                    return
+                backend.stats.record(None, ok=False)
+                self.errors.append(e)
+                self.cond.notify_all()
+            return
+        with self.cond:
+            self.pending.pop(backend, None)
+            if self.finished:
+                self._lost(backend, started)
+                abort_response(response)
+                return
+            self.finished = True
+            seconds = time.perf_counter() - started
+            # 非流式请求的耗时取决于输出长度，不计入首字统计
+            backend.stats.record(seconds if self.stream else None)
+            if self.hedged:
+                backend.stats.record_hedge(True)
+            self.winner = HedgedResponse(response, head or [], chunks, backend.name, backend.model, self.hedged)
+            self.cond.notify_all()
+
+    def _lost(self, backend, started):
+        # 被断开的一路至少这么慢，按下限记入样本，避免慢后端一直排在前面
+        if self.stream and not self.cancelled:
+            backend.stats.record(time.perf_counter() - started)
+            backend.stats.record_hedge(False)
+
+
+class BackendRegistry:
+    # 对外与 DeepSeekClient 接口一致 (model / api_key / chat / chat_cancellable / complete)，可直接交给 LessonEngine
+    def __init__(self, backends, api_key="", hedge_after_ms=0):
+        self.lock = threading.Lock()
+        self.backends = list(backends)
+        self.hedge_after_ms = hedge_after_ms
+        self._api_key = ""
+        self.api_key = api_key
+
+    @property
+    def api_key(self):
+        return self._api_key
+
+    @api_key.setter
+    def api_key(self, value):
+        self._api_key = value
+        for backend in self.backends:
+            if backend.shared_key:
+                backend.client.api_key = value
+
+    @property
+    def model(self):
+        # 预计应答的后端 (排序第一位) 的模型，用于查找缓存；写入缓存时以实际应答的 backend_model 为准
+        ranked = self.ranked()
+        return ranked[0].model if ranked else DEFAULT_MODEL
+
+    @property
+    def needs_shared_key(self):
+        return any(b.enabled and b.shared_key for b in self.backends)
+
+    # ---------- 后端管理 (界面线程调用，写时复制列表) ----------
+    def get(self, name):
+        for backend in self.backends:
+            if backend.name == name:
+                return backend
+        return None
+
+    def add(self, backend):
+        with self.lock:
+            backends = [b for b in self.backends if b.name != backend.name] + [backend]
+            if backend.shared_key:
+                backend.client.api_key = self._api_key
+            self.backends = backends
+
+    def remove(self, name):
+        with self.lock:
+            removed = [b for b in self.backends if b.name == name]
+            self.backends = [b for b in self.backends if b.name != name]
+        for backend in removed:
+            backend.client.close()
+
+    def move_to_front(self, name):
+        with self.lock:
+            self.backends = sorted(self.backends, key=lambda b: b.name != name)
+
+    def set_enabled(self, name, enabled):
+        backend = self.get(name)
+        if backend is not None:
+            backend.enabled = enabled
+
+    def to_config(self):
+        return [b.to_config() for b in self.backends]
+
+    def ranked(self):
+        # 按评分排序，评分相同 (都缺样本) 时保持配置顺序
+        enabled = [b for b in self.backends if b.enabled]
+        return sorted(enabled, key=lambda b: b.stats.score())
+
+    def stats_rows(self):
+        return [(b, b.stats.snapshot()) for b in self.backends]
+
+    # ---------- 请求 ----------
+    def chat(self, messages, stream=False, **extra):
+        return self.chat_cancellable(messages, None, stream=stream, **extra)
+
+    def chat_cancellable(self, messages, cancel_token, stream=False, **extra):
+        # 开始输出前失败的后端按排序依次改投下一个 (与是否对冲无关)；全部失败时抛出首个错误 (限流退避据此处理)
+        # 对冲阈值只决定何时并行发出第二份请求
+        order = self.ranked()
+        if not order:
+            raise ApiError(0, "没有启用的接口后端")
+        hedge = self.hedge_after_ms / 1000 if self.hedge_after_ms and stream and len(order) > 1 else None
+        call = _HedgedCall(messages, stream, extra)
+        handle = cancel_token.on_cancel(call.cancel) if cancel_token is not None else None
+        try:
+            with call.cond:
+                call.launch(order[0])
+                deadline = time.monotonic() + hedge if hedge else None
+                while call.winner is None and not call.cancelled:
+                    remaining = order[len(call.launched):]
+                    if len(call.errors) == len(call.launched):
+                        if not remaining:
+                            break
+                        call.launch(remaining[0])
+                        deadline = time.monotonic() + hedge if hedge else None
+                        continue
+                    timeout = None
+                    if hedge is not None and remaining and len(call.launched) - len(call.errors) < HEDGE_MAX_ATTEMPTS:
+                        timeout = deadline - time.monotonic()
+                        if timeout <= 0:
+                            call.hedged = True
+                            call.launch(remaining[0])
+                            deadline = time.monotonic() + hedge
+                            continue
+                    call.cond.wait(timeout)
+                call.finished = True
+                losers = list(call.pending.values())
+                winner = call.winner
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove(handle)
+        for response in losers:
+            abort_response(response)
+        if call.cancelled:
+            if winner is not None:
+                abort_response(winner)
+            raise RequestCancelled()
+        if winner is None:
+            raise call.errors[0]
+        return winner
+
+    def complete(self, messages, **extra):
+        response = self.chat(messages, stream=False, **extra)
+        return response.json()['choices'][0]['message']['content']
+
+    def close(self):
+        for backend in self.backends:
+            backend.client.close()
+
+
+def build_registry(config, api_key=""):
+    # 旧配置只有 api_base_url：视为单一 DeepSeek 后端
+    # 环境变量 JINTA_API_BASE_URL 只在本次运行中替换 DeepSeek 后端的地址，其余后端与保存的配置不受影响
+    entries = config.get("backends") or [
+        {"name": "deepseek", "base_url": config.get("api_base_url") or DEFAULT_BASE_URL, "model": DEFAULT_MODEL}]
+    override = os.environ.get(BASE_URL_ENV)
+    backends = [Backend.from_config(e, override if e.get("name") == "deepseek" else None) for e in entries]
+    return BackendRegistry(backends, api_key, int(config.get("hedge_after_ms", 0) or 0))
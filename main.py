@@ -2,6 +2,7 @@ import sys
 import os
 import json
 import threading
+import multiprocessing
 import tkinter as tk
 from tkinter import messagebox, filedialog, simpledialog
 
@@ -10,20 +11,32 @@ try:
     import PIL._tkinter_finder
 except ImportError:
     pass
-import PIL.ImageTk 
+# PIL.ImageTk 由 ttkbootstrap 自行导入；python-docx / requests / 解析库均在首次使用时加载
 # -----------------
 
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.scrolled import ScrolledText
-import requests
-from docx import Document
-from docx.shared import Cm, Pt, RGBColor
-from docx.oxml.ns import qn
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from datetime import datetime
-import pptx
-import pypdf
+from doc_cache import DocumentCache
+from doc_ingest import IngestEngine, IngestCancelled
+from doc_index import DEFAULT_CONTEXT_BUDGET
+from prompt_budget import DEFAULT_REQUEST_BUDGET
+from api_client import ApiError, RequestCancelled, DEFAULT_BASE_URL
+from llm_backends import Backend, PRESETS, DEFAULT_HEDGE_MS, build_registry
+from cancel_token import CancelToken
+from text_cleaner import clean_text
+from response_cache import ResponseCache
+from lesson_engine import LessonEngine, CONFIG_FILE, PLAN_TYPES, DEFAULT_INSTRUCTION
+from lesson_export import export_lessons, FragmentCache
+from project_store import ProjectStore, AUTOSAVE_FILE, PROJECT_EXT
+from stream_buffer import StreamBuffer, FRAME_MS as STREAM_FRAME_MS
+from batch_scheduler import BatchScheduler, DEFAULT_CONCURRENCY, DONE as BATCH_DONE
+from folder_watch import FolderScanner, WATCH_INTERVAL_MS
+from text_store import TextStore, DEFAULT_MEMORY_MB
+
+APP_TITLE = "金塔县中学教案智能生成系统 v4.3 (精排优化版)"
+# 自动保存间隔 (毫秒)：每次只追加变化的内容
+AUTOSAVE_MS = 5000
 
 # --- 字体自动适配 ---
 DEFAULT_FONT = "Helvetica"
@@ -38,26 +51,69 @@ else:
     MAIN_FONT_NAME = "WenQuanYi Micro Hei" 
     UI_FONT_SIZE = 10
 
-# --- 配置文件路径 (用户主目录) ---
-CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".jinta_lesson_config.json")
-
 class LessonPlanWriter(ttk.Window):
     def __init__(self):
         super().__init__(themename="flatly") 
-        self.title("金塔县中学教案智能生成系统 v4.3 (精排优化版)")
+        self.title(APP_TITLE)
         self.geometry("1350x950")
         
         self.lesson_data = {} 
         self.active_period = 1 
         
         self.is_generating = False
-        self.stop_flag = False
+        # 当前生成任务的取消令牌：停止时立即断开在途请求
+        self.cancel_token = CancelToken()
+        # 教学过程流式输出缓冲：按帧合并后再刷新界面
+        self.stream_buffer = StreamBuffer()
+        # 批量生成调度器与窗口
+        self.batch = None
+        self.batch_window = None
+        # Word 导出在后台线程进行；未改动课时的渲染结果跨次导出复用
+        self.is_exporting = False
+        self.export_cache = FragmentCache()
+        self.batch_concurrency = DEFAULT_CONCURRENCY
         
         # 多文档内容存储字典
         self.uploaded_files = {}
+        # 文档管理器窗口与其中的 Treeview (未打开时为 None)
+        self.fm_window = None
+        self.be_window = None
+        self.be_tree = None
+        self.be_refresh_job = None
+        self.fm_tree = None
+        self.fm_detached = set()
+        self.fm_filter_job = None
+        self.fm_filter_var = None
+        self.fm_summary_var = tk.StringVar(value="")
+        # 内容与已载入文档重复而未注入的文件：路径 -> 已载入的同内容文档路径
+        self.duplicate_docs = {}
+        # 监视的参考资料文件夹 (配置中保存，下次启动自动恢复)
+        self.watch_folder = ""
+        self.watch_scanner = None
+        self.watch_job = None
+        self.watch_busy = False
+        # 解析结果磁盘缓存：同一文件再次注入时跳过解析
+        self.doc_cache = DocumentCache()
+        # 进程池解析引擎：多文件并行，大PDF按页段拆分到多个核心
+        self.ingest_engine = IngestEngine(
+            cache=self.doc_cache,
+            on_progress=self._on_ingest_progress,
+            on_done=self._on_ingest_done,
+            on_error=self._on_ingest_error
+        )
+        self.ingest_progress = {}
+        self.context_budget = DEFAULT_CONTEXT_BUDGET
+        self.request_budget = DEFAULT_REQUEST_BUDGET
+        self.use_digests = False
+        # 解析文本的内存缓存上限 (MB)，其余正文留在磁盘存储里按需读取
+        self.text_memory_mb = DEFAULT_MEMORY_MB
         
         # 变量
         self.api_key = "" 
+        self.api_base_url = DEFAULT_BASE_URL
+        # 接口后端 (DeepSeek / OpenAI 兼容地址 / 本地服务) 与对冲阈值；未配置时只用 DeepSeek
+        self.backend_config = None
+        self.hedge_after_ms = 0
         self.api_status_var = tk.StringVar(value="❌ 未配置")
         self.total_periods_var = tk.IntVar(value=1)
         self.current_period_disp_var = tk.StringVar(value="1")
@@ -66,9 +122,37 @@ class LessonPlanWriter(ttk.Window):
         self.author_info = "设计与开发：金塔县中学化学教研组 · 俞晋全 | 核心驱动：DeepSeek-V3"
         
         self.load_config() 
+        # 生成引擎：Prompt 构建、流式请求与清洗，与命令行批处理共用
+        # 两条生成路径共享一个后端注册表 (各后端连接池 + 超时 + 重试，按延迟路由)；响应缓存命中时直接回放，不重复计费
+        # 文档正文存放在磁盘文本存储中，界面与索引只保留元数据，内存占用不随资料量增长
+        self.text_store = TextStore(memory_limit=self.text_memory_mb * 1024 * 1024)
+        self.engine = LessonEngine(
+            build_registry({"backends": self.backend_config, "api_base_url": self.api_base_url,
+                            "hedge_after_ms": self.hedge_after_ms}, self.api_key),
+            response_cache=ResponseCache(),
+            context_budget=self.context_budget,
+            request_budget=self.request_budget,
+            doc_cache=self.doc_cache,
+            text_store=self.text_store
+        )
+        self.engine.use_digests = self.use_digests
+        self.bypass_cache_var = tk.BooleanVar(value=False)
+        # 文档摘要：每份文档按课题提炼一次，开启后以摘要代替原文注入
+        self.use_digests_var = tk.BooleanVar(value=self.use_digests)
+        self.digest_token = CancelToken()
+        # 每次请求的连接、首字、吞吐与用量：实时显示在状态栏右侧，并写入本地日志
+        self.metrics_var = tk.StringVar(value="")
+        self.engine.on_metrics = self._on_request_metrics
         self.setup_context_menu() # 初始化右键菜单
         self.setup_ui()
         self.save_current_data_to_memory(1)
+        # 项目文件：未命名时自动保存到缓存目录，崩溃后下次启动可恢复
+        self.project = ProjectStore(AUTOSAVE_FILE, doc_cache=self.doc_cache, text_source=self.engine.document_text)
+        self.autosave_busy = False
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(300, self._offer_restore)
+        if self.watch_folder and os.path.isdir(self.watch_folder):
+            self.after(500, lambda: self.start_watch(self.watch_folder))
 
     def load_config(self):
         try:
@@ -76,6 +160,15 @@ class LessonPlanWriter(ttk.Window):
                 with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
                     config = json.load(f)
                     self.api_key = config.get("api_key", "")
+                    self.context_budget = int(config.get("context_token_budget", DEFAULT_CONTEXT_BUDGET))
+                    self.request_budget = int(config.get("request_token_budget", DEFAULT_REQUEST_BUDGET))
+                    self.api_base_url = config.get("api_base_url", DEFAULT_BASE_URL)
+                    self.batch_concurrency = int(config.get("batch_concurrency", DEFAULT_CONCURRENCY))
+                    self.use_digests = bool(config.get("use_digests", False))
+                    self.watch_folder = config.get("watch_folder", "")
+                    self.backend_config = config.get("backends")
+                    self.hedge_after_ms = int(config.get("hedge_after_ms", 0) or 0)
+                    self.text_memory_mb = int(config.get("text_memory_mb", DEFAULT_MEMORY_MB))
                     if self.api_key:
                         self.api_status_var.set("✅ 已就绪 (自动加载)")
         except Exception:
@@ -83,7 +176,18 @@ class LessonPlanWriter(ttk.Window):
 
     def save_config(self):
         try:
-            config = {"api_key": self.api_key}
+            config = {
+                "api_key": self.api_key,
+                "context_token_budget": self.context_budget,
+                "request_token_budget": self.request_budget,
+                "api_base_url": self.api_base_url,
+                "batch_concurrency": self.batch_concurrency,
+                "use_digests": self.use_digests,
+                "watch_folder": self.watch_folder,
+                "text_memory_mb": self.text_memory_mb,
+                "backends": self.engine.api_client.to_config(),
+                "hedge_after_ms": self.hedge_after_ms
+            }
             with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
                 json.dump(config, f)
         except Exception as e:
@@ -98,6 +202,7 @@ class LessonPlanWriter(ttk.Window):
         )
         if new_key is not None:
             self.api_key = new_key.strip()
+            self.engine.api_client.api_key = self.api_key
             self.save_config() 
             if self.api_key:
                 self.api_status_var.set("✅ 已就绪")
@@ -105,6 +210,219 @@ class LessonPlanWriter(ttk.Window):
             else:
                 self.api_status_var.set("❌ 未配置")
 
+    def open_budget_settings(self):
+        new_budget = simpledialog.askinteger(
+            title="素材 Token 预算",
+            prompt="每次请求注入参考文档的最大 Token 数：\n(文档总量不超过预算时全部注入，超出时按相关度挑选段落)",
+            initialvalue=self.context_budget,
+            minvalue=500,
+            maxvalue=60000,
+            parent=self
+        )
+        if new_budget is not None:
+            self.context_budget = new_budget
+            self.engine.context_budget = new_budget
+            self.save_config()
+            self.status_var.set(f"✅ 素材预算已设为 {new_budget} tokens")
+
+    def open_text_memory_settings(self):
+        new_limit = simpledialog.askinteger(
+            title="正文内存上限",
+            prompt="参考文档正文存放在磁盘，最近用到的段落缓存在内存中。\n缓存上限 (MB)：\n(只限制正文缓存；检索索引另计，随文档量增长)",
+            initialvalue=self.text_memory_mb,
+            minvalue=4,
+            maxvalue=4096,
+            parent=self
+        )
+        if new_limit is not None:
+            self.text_memory_mb = new_limit
+            self.text_store.set_memory_limit(new_limit * 1024 * 1024)
+            self.save_config()
+            self.status_var.set(f"✅ 正文内存缓存上限已设为 {new_limit} MB")
+
+    # ---------- 接口后端：DeepSeek / OpenAI 兼容地址 / 本地服务，按首字延迟路由，可选对冲 ----------
+    def open_backend_settings(self):
+        if self.be_window is not None and self.be_window.winfo_exists():
+            self.be_window.lift()
+            return
+        top = tk.Toplevel(self)
+        top.title("接口后端")
+        top.geometry("900x400")
+        top.transient(self)
+        self.be_window = top
+
+        tree_frame = ttk.Frame(top, padding=(10, 10, 10, 0))
+        tree_frame.pack(fill=BOTH, expand=True)
+        columns = ("name", "model", "url", "p50", "p95", "samples", "errors", "hedge")
+        headings = ("后端", "模型", "地址", "首字 p50", "首字 p95", "样本", "失败率", "对冲 胜/负")
+        widths = (110, 150, 260, 80, 80, 50, 60, 80)
+        tree = ttk.Treeview(tree_frame, columns=columns, show="headings", selectmode="browse", bootstyle="info")
+        for col, text, width in zip(columns, headings, widths):
+            tree.heading(col, text=text)
+            tree.column(col, width=width, anchor=W if col in ("name", "model", "url") else E, stretch=(col == "url"))
+        tree.pack(fill=BOTH, expand=True)
+        self.be_tree = tree
+
+        hedge_frame = ttk.Frame(top, padding=(10, 10, 10, 0))
+        hedge_frame.pack(fill=X)
+        hedge_var = tk.BooleanVar(value=self.hedge_after_ms > 0)
+        hedge_ms_var = tk.IntVar(value=self.hedge_after_ms or DEFAULT_HEDGE_MS)
+
+        def apply_hedge(*args):
+            try:
+                ms = max(200, int(hedge_ms_var.get()))
+            except (tk.TclError, ValueError):
+                return
+            self.hedge_after_ms = ms if hedge_var.get() else 0
+            self.engine.api_client.hedge_after_ms = self.hedge_after_ms
+            self.save_config()
+
+        ttk.Checkbutton(hedge_frame, text="首字超时对冲：超过", variable=hedge_var, command=apply_hedge, bootstyle="round-toggle").pack(side=LEFT)
+        spin = ttk.Spinbox(hedge_frame, from_=200, to=30000, increment=500, width=7, textvariable=hedge_ms_var, command=apply_hedge)
+        spin.pack(side=LEFT, padx=5)
+        spin.bind("<FocusOut>", apply_hedge)
+        ttk.Label(hedge_frame, text="毫秒仍未开始输出时，向下一个后端再发一份，先输出者胜出 (会产生少量重复计费)",
+                  font=(MAIN_FONT_NAME, 9), bootstyle="secondary").pack(side=LEFT)
+
+        btn_frame = ttk.Frame(top, padding=10)
+        btn_frame.pack(fill=X)
+        ttk.Button(btn_frame, text="➕ 添加", command=self._be_add, bootstyle="success").pack(side=LEFT, padx=(0, 5))
+        ttk.Button(btn_frame, text="⬆ 设为首选", command=self._be_promote, bootstyle="info outline").pack(side=LEFT, padx=5)
+        ttk.Button(btn_frame, text="⏯ 启用/停用", command=self._be_toggle, bootstyle="secondary outline").pack(side=LEFT, padx=5)
+        ttk.Button(btn_frame, text="🗑 删除", command=self._be_remove, bootstyle="danger outline").pack(side=LEFT, padx=5)
+        ttk.Label(btn_frame, text="排序依据近 30 分钟的首字延迟与失败率；首选后端仅在评分相同时优先",
+                  font=(MAIN_FONT_NAME, 9), bootstyle="secondary").pack(side=RIGHT)
+        self._be_refresh()
+
+    def _be_refresh(self):
+        # 窗口打开期间定时刷新延迟统计
+        if self.be_window is None or not self.be_window.winfo_exists():
+            self.be_refresh_job = None
+            return
+        selected = self.be_tree.selection()
+        self.be_tree.delete(*self.be_tree.get_children())
+        ranked = [b.name for b in self.engine.api_client.ranked()]
+
+        def fmt(seconds):
+            return f"{seconds:.2f}s" if seconds is not None else "—"
+        for backend, snap in self.engine.api_client.stats_rows():
+            if not backend.enabled:
+                name = f"⏸ {backend.name}"
+            elif ranked and ranked[0] == backend.name:
+                name = f"★ {backend.name}"
+            else:
+                name = backend.name
+            self.be_tree.insert("", END, iid=backend.name, values=(
+                name, backend.model, backend.client.base_url, fmt(snap["p50"]), fmt(snap["p95"]),
+                snap["samples"], f"{snap['error_rate']:.0%}", f"{snap['hedge_wins']}/{snap['hedge_losses']}"))
+        keep = [iid for iid in selected if self.be_tree.exists(iid)]
+        if keep:
+            self.be_tree.selection_set(keep)
+        self.be_refresh_job = self.after(2000, self._be_refresh)
+
+    def _be_selected(self):
+        selected = self.be_tree.selection()
+        return selected[0] if selected else None
+
+    def _be_add(self):
+        name = simpledialog.askstring(
+            title="添加接口后端",
+            prompt="后端名称：\n预设 deepseek / llama.cpp / vllm 会自动填入地址与模型，也可填写任意名称自定义",
+            parent=self.be_window
+        )
+        if not name or not name.strip(): return
+        name = name.strip()
+        preset = PRESETS.get(name, {})
+        base_url = simpledialog.askstring(
+            title="添加接口后端", prompt="接口地址 (OpenAI 兼容，请求发往 地址/chat/completions)：",
+            initialvalue=preset.get("base_url", "https://"), parent=self.be_window)
+        if not base_url or not base_url.strip(): return
+        model = simpledialog.askstring(
+            title="添加接口后端", prompt="模型名称：", initialvalue=preset.get("model", ""), parent=self.be_window)
+        if not model or not model.strip(): return
+        api_key = preset.get("api_key")
+        if "api_key" not in preset:
+            api_key = simpledialog.askstring(
+                title="添加接口后端", prompt="该后端的 API Key：\n(留空表示共用主界面配置的 Key)", parent=self.be_window)
+            if api_key is None: return
+            api_key = api_key.strip() or None
+        self.engine.api_client.add(Backend(name, base_url.strip(), model.strip(), api_key))
+        self.save_config()
+        self._be_refresh_now()
+
+    def _be_promote(self):
+        name = self._be_selected()
+        if name is None: return
+        self.engine.api_client.move_to_front(name)
+        self.save_config()
+        self._be_refresh_now()
+
+    def _be_toggle(self):
+        name = self._be_selected()
+        backend = self.engine.api_client.get(name) if name else None
+        if backend is None: return
+        if backend.enabled and sum(1 for b in self.engine.api_client.backends if b.enabled) <= 1:
+            messagebox.showwarning("接口后端", "至少需要保留一个启用的后端。", parent=self.be_window)
+            return
+        self.engine.api_client.set_enabled(name, not backend.enabled)
+        self.save_config()
+        self._be_refresh_now()
+
+    def _be_remove(self):
+        name = self._be_selected()
+        if name is None: return
+        if len(self.engine.api_client.backends) <= 1:
+            messagebox.showwarning("接口后端", "至少需要保留一个后端。", parent=self.be_window)
+            return
+        if not messagebox.askyesno("删除后端", f"确定删除后端 {name} 吗？", parent=self.be_window): return
+        self.engine.api_client.remove(name)
+        self.save_config()
+        self._be_refresh_now()
+
+    def _be_refresh_now(self):
+        if self.be_refresh_job is not None:
+            self.after_cancel(self.be_refresh_job)
+        self._be_refresh()
+
+    def _sync_bypass_cache(self):
+        # 后台线程不直接读取 Tk 变量，这里同步成普通属性
+        self.engine.bypass_cache = self.bypass_cache_var.get()
+
+    def _sync_use_digests(self):
+        self.use_digests = self.use_digests_var.get()
+        self.engine.use_digests = self.use_digests
+        self.save_config()
+        if not self.use_digests:
+            self.digest_token.cancel()
+            return
+        # 开启时立即在后台为当前课题准备摘要，生成时即可直接使用
+        topic = self.topic_entry.get()
+        if (self.api_key or not self.engine.api_client.needs_shared_key) and self.engine.missing_digests(topic):
+            self.digest_token = CancelToken()
+            threading.Thread(target=self._thread_build_digests, args=(topic, self.digest_token), daemon=True).start()
+
+    def _thread_build_digests(self, topic, token):
+        try:
+            if self.ensure_digests(topic, token):
+                self.after(0, lambda: self.status_var.set(f"📝 《{topic}》的文档摘要已就绪"))
+        except RequestCancelled:
+            pass
+        except ApiError as e:
+            text = f"❌ 摘要生成失败: API错误 {e.status_code}"
+            self.after(0, lambda: self.status_var.set(text))
+        except Exception as e:
+            text = f"❌ 摘要生成失败: {str(e)}"
+            self.after(0, lambda: self.status_var.set(text))
+
+    def ensure_digests(self, topic, should_stop):
+        # 在工作线程调用；未开启摘要时直接返回
+        if not self.engine.use_digests:
+            return 0
+        def on_progress(name, done, total):
+            text = f"📝 正在提炼 {name} 的摘要：{done}/{total} 段"
+            self.after(0, lambda: self.status_var.set(text))
+        return self.engine.ensure_digests(topic, should_stop, on_progress)
+
     # ================= 右键菜单模块 =================
     def setup_context_menu(self):
         self.context_menu = tk.Menu(self, tearoff=0, font=(MAIN_FONT_NAME, UI_FONT_SIZE))
@@ -165,103 +483,360 @@ class LessonPlanWriter(ttk.Window):
         if not filepaths:
             return
         
-        for filepath in filepaths:
-            if filepath in self.uploaded_files:
-                continue 
-            self.status_var.set(f"⏳ 正在解析文档: {os.path.basename(filepath)}...")
-            threading.Thread(target=self._process_document_thread, args=(filepath,)).start()
+        pending = [fp for fp in filepaths if fp not in self.uploaded_files]
+        if not pending:
+            return
+        for filepath in pending:
+            self.ingest_progress[filepath] = (0, 0)
+        self.status_var.set(f"⏳ 正在解析 {len(pending)} 个文档...")
+        self.ingest_engine.ingest(pending)
 
-    def _process_document_thread(self, filepath):
-        try:
-            text_content = ""
-            ext = os.path.splitext(filepath)[1].lower()
-            filename = os.path.basename(filepath)
-
-            if ext == '.docx':
-                doc = Document(filepath)
-                text_content = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-            elif ext == '.pptx':
-                prs = pptx.Presentation(filepath)
-                for slide in prs.slides:
-                    for shape in slide.shapes:
-                        if hasattr(shape, "text"):
-                            text_content += shape.text + "\n"
-            elif ext == '.pdf':
-                reader = pypdf.PdfReader(filepath)
-                text_content = "\n".join([page.extract_text() for page in reader.pages if page.extract_text()])
-            else:
-                with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                    text_content = f.read()
+    def cancel_ingest(self):
+        if self.ingest_engine.cancel():
+            self.status_var.set("⛔ 已取消文档解析")
 
-            if not text_content.strip():
-                raise ValueError("未提取到有效文本或不支持该二进制格式。")
+    def _on_ingest_progress(self, filepath, done, total, unit):
+        self.after(0, lambda: self._update_ingest_status(filepath, done, total, unit))
 
+    def _update_ingest_status(self, filepath, done, total, unit):
+        if filepath not in self.ingest_progress:
+            return
+        self.ingest_progress[filepath] = (done, total)
+        self.status_var.set(f"⏳ 正在解析 {os.path.basename(filepath)}: 第 {done}/{total} {unit} (剩余 {len(self.ingest_progress)} 个文件)")
+
+    def _loaded_path_for_hash(self, content_hash, exclude=None):
+        for fp, info in list(self.uploaded_files.items()):
+            if fp != exclude and info.get("hash") == content_hash:
+                return fp
+        return None
+
+    def _skip_duplicate(self, filepath, original):
+        self.duplicate_docs[filepath] = original
+        self.ingest_progress.pop(filepath, None)
+        name = self.uploaded_files.get(original, {}).get("name", os.path.basename(original))
+        self.status_var.set(f"♻️ {os.path.basename(filepath)} 与已载入的 {name} 内容相同，已跳过")
+
+    def _on_ingest_done(self, filepath, filename, text_content, content_hash, from_cache, meta):
+        # 同一内容 (改名/复制的同一本教材) 只注入一次
+        original = self._loaded_path_for_hash(content_hash, exclude=filepath) if content_hash else None
+        if original is not None:
+            self.after(0, lambda: self._skip_duplicate(filepath, original))
+            return
+        # 分块建索引在后台线程完成，不占用界面线程
+        self.engine.add_document(filepath, filename, text_content, content_hash)
+        def _apply():
+            original = self._loaded_path_for_hash(content_hash, exclude=filepath) if content_hash else None
+            if original is not None:
+                self.engine.remove_document(filepath)
+                self._skip_duplicate(filepath, original)
+                return
+            self.duplicate_docs.pop(filepath, None)
             self.uploaded_files[filepath] = {
                 "name": filename,
-                "text": text_content
+                "chars": len(text_content),
+                "hash": content_hash,
+                "pages": meta.get("pages", 0)
             }
-            self.after(0, self.update_files_count_ui)
-            self.after(0, lambda: self.status_var.set(f"✅ 文档 {filename} 解析成功！"))
-        except Exception as e:
-            self.after(0, lambda: messagebox.showerror("解析失败", f"无法解析 {os.path.basename(filepath)}:\n{str(e)}"))
-            self.after(0, lambda: self.status_var.set("❌ 部分文档解析失败"))
+            self.ingest_progress.pop(filepath, None)
+            self.update_files_count_ui()
+            self._fm_insert(filepath)
+            if from_cache:
+                self.status_var.set(f"⚡ 文档 {filename} 命中缓存，已秒速载入")
+            else:
+                self.status_var.set(f"✅ 文档 {filename} 解析成功！")
+        self.after(0, _apply)
+
+    def _on_ingest_error(self, filepath, filename, exc):
+        def _apply():
+            self.ingest_progress.pop(filepath, None)
+            if isinstance(exc, IngestCancelled):
+                return
+            messagebox.showerror("解析失败", f"无法解析 {filename}:\n{str(exc)}")
+            self.status_var.set("❌ 部分文档解析失败")
+        self.after(0, _apply)
 
     def update_files_count_ui(self):
-        self.files_count_var.set(f"已载入 {len(self.uploaded_files)} 个文档")
+        note = f" · 👁 监视 {os.path.basename(self.watch_folder) or self.watch_folder}" if self.watch_scanner is not None else ""
+        self.files_count_var.set(f"已载入 {len(self.uploaded_files)} 个文档{note}")
 
+    # ---------- 文档管理器：Treeview 只绘制可见行，增删与筛选都按行增量进行 ----------
     def open_file_manager(self):
+        if self.fm_window is not None and self.fm_window.winfo_exists():
+            self.fm_window.lift()
+            return
         if not self.uploaded_files:
             messagebox.showinfo("管理文档", "当前未载入任何参考文档。")
             return
-            
+
         top = tk.Toplevel(self)
         top.title("文档管理器")
-        top.geometry("500x350")
-        top.transient(self) 
-        
-        ttk.Label(top, text="下方是已成功解析并注入AI大脑的参考文件：", padding=10, font=(MAIN_FONT_NAME, UI_FONT_SIZE, "bold")).pack(anchor=W)
-        
-        sf = ttk.Frame(top)
-        sf.pack(fill=BOTH, expand=True, padx=10, pady=(0, 10))
-        
-        canvas = tk.Canvas(sf, highlightthickness=0)
-        scrollbar = ttk.Scrollbar(sf, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-        
-        canvas_window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        def _configure_canvas(event):
-            canvas.itemconfig(canvas_window, width=event.width)
-        canvas.bind('<Configure>', _configure_canvas)
-        scrollable_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        
-        canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        def refresh_list():
-            for widget in scrollable_frame.winfo_children():
-                widget.destroy()
-            for filepath, data in list(self.uploaded_files.items()):
-                cf = ttk.Frame(scrollable_frame)
-                cf.pack(fill=X, expand=True, pady=4, padx=5)
-                
-                lbl = ttk.Label(cf, text=f"📄 {data['name']}", font=(MAIN_FONT_NAME, UI_FONT_SIZE))
-                lbl.pack(side=LEFT, fill=X, expand=True)
-                
-                def make_delete_cmd(fp=filepath):
-                    def _delete():
-                        if fp in self.uploaded_files:
-                            del self.uploaded_files[fp]
-                        self.update_files_count_ui()
-                        refresh_list()
-                        if not self.uploaded_files:
-                            top.destroy()
-                    return _delete
-                
-                btn = ttk.Button(cf, text="✖ 删除", bootstyle="danger", command=make_delete_cmd(filepath))
-                btn.pack(side=RIGHT, padx=(5, 0))
-                
-        refresh_list()
+        top.geometry("760x480")
+        top.transient(self)
+        self.fm_window = top
+
+        search_frame = ttk.Frame(top, padding=(10, 10, 10, 5))
+        search_frame.pack(fill=X)
+        ttk.Label(search_frame, text="🔍 筛选:", font=(MAIN_FONT_NAME, UI_FONT_SIZE)).pack(side=LEFT)
+        self.fm_filter_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.fm_filter_var)
+        search_entry.pack(side=LEFT, fill=X, expand=True, padx=5)
+        self.fm_filter_var.trace_add("write", lambda *args: self._fm_schedule_filter())
+
+        tree_frame = ttk.Frame(top, padding=(10, 0))
+        tree_frame.pack(fill=BOTH, expand=True)
+        columns = ("name", "pages", "chars", "tokens")
+        tree = ttk.Treeview(tree_frame, columns=columns, show="headings", selectmode="extended", bootstyle="info")
+        for col, text, width, anchor in zip(columns, ("文件名", "页数", "字符数", "估算 Tokens"), (400, 70, 100, 100), (W, CENTER, E, E)):
+            tree.heading(col, text=text)
+            tree.column(col, width=width, anchor=anchor, stretch=(col == "name"))
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=LEFT, fill=BOTH, expand=True)
+        scrollbar.pack(side=RIGHT, fill=Y)
+        tree.bind("<Delete>", lambda e: self._fm_remove_selected())
+        self.fm_tree = tree
+        self.fm_detached = set()
+
+        btn_frame = ttk.Frame(top, padding=10)
+        btn_frame.pack(fill=X)
+        ttk.Label(btn_frame, textvariable=self.fm_summary_var, font=(MAIN_FONT_NAME, 9), bootstyle="secondary").pack(side=LEFT)
+        ttk.Button(btn_frame, text="🗑 删除选中", command=self._fm_remove_selected, bootstyle="danger").pack(side=RIGHT, padx=5)
+        ttk.Button(btn_frame, text="✅ 全选", command=lambda: tree.selection_set(tree.get_children()), bootstyle="secondary outline").pack(side=RIGHT, padx=5)
+
+        for filepath in self.uploaded_files:
+            self._fm_insert(filepath)
+        self._fm_update_summary()
+        search_entry.focus_set()
+
+    def _fm_alive(self):
+        return self.fm_tree is not None and self.fm_window is not None and self.fm_window.winfo_exists()
+
+    def _fm_row(self, filepath):
+        data = self.uploaded_files[filepath]
+        tokens = self.engine.doc_index.doc_tokens(filepath)
+        return (f"📄 {data['name']}", data.get("pages") or "—", f"{data['chars']:,}", f"{tokens:,}" if tokens else "…")
+
+    def _fm_matches(self, filepath):
+        keyword = self.fm_filter_var.get().strip().lower()
+        return not keyword or keyword in self.uploaded_files[filepath]["name"].lower()
+
+    def _fm_insert(self, filepath):
+        # 新文档载入后只追加一行；不符合当前筛选时先插入再摘下
+        if not self._fm_alive() or filepath not in self.uploaded_files:
+            return
+        if self.fm_tree.exists(filepath):
+            self.fm_tree.item(filepath, values=self._fm_row(filepath))
+        else:
+            self.fm_tree.insert("", END, iid=filepath, values=self._fm_row(filepath))
+        if self._fm_matches(filepath):
+            self.fm_detached.discard(filepath)
+        else:
+            self.fm_tree.detach(filepath)
+            self.fm_detached.add(filepath)
+        self._fm_update_summary()
+
+    def _fm_delete_row(self, filepath):
+        if self._fm_alive() and self.fm_tree.exists(filepath):
+            self.fm_tree.delete(filepath)
+        self.fm_detached.discard(filepath)
+
+    def _fm_reload(self):
+        if not self._fm_alive():
+            return
+        self.fm_tree.delete(*self.fm_tree.get_children())
+        for filepath in self.fm_detached:
+            if self.fm_tree.exists(filepath):
+                self.fm_tree.delete(filepath)
+        self.fm_detached = set()
+        for filepath in self.uploaded_files:
+            self._fm_insert(filepath)
+        self._fm_update_summary()
+
+    def _fm_schedule_filter(self):
+        # 输入时防抖，停顿片刻再筛选
+        if self.fm_filter_job is not None:
+            self.after_cancel(self.fm_filter_job)
+        self.fm_filter_job = self.after(150, self._fm_apply_filter)
+
+    def _fm_apply_filter(self):
+        self.fm_filter_job = None
+        if not self._fm_alive():
+            return
+        # 按载入顺序重新挂回匹配的行，不匹配的行摘下 (不销毁)
+        index = 0
+        for filepath in self.uploaded_files:
+            if not self.fm_tree.exists(filepath):
+                continue
+            if self._fm_matches(filepath):
+                self.fm_tree.move(filepath, "", index)
+                self.fm_detached.discard(filepath)
+                index += 1
+            elif filepath not in self.fm_detached:
+                self.fm_tree.detach(filepath)
+                self.fm_detached.add(filepath)
+        self._fm_update_summary()
+
+    def _fm_update_summary(self):
+        if not self._fm_alive():
+            return
+        shown = len(self.fm_tree.get_children())
+        total = len(self.uploaded_files)
+        tokens = sum(self.engine.doc_index.doc_tokens(fp) for fp in self.fm_tree.get_children())
+        prefix = f"显示 {shown}/{total} 个文档" if shown != total else f"共 {total} 个文档"
+        stats = self.text_store.stats()
+        self.fm_summary_var.set(f"{prefix}，约 {tokens:,} tokens · 正文磁盘 {stats['disk_bytes'] / 1048576:.1f} MB，"
+                                f"内存缓存 {stats['memory_bytes'] / 1048576:.1f}/{stats['memory_limit'] / 1048576:.0f} MB")
+
+    def _fm_remove_selected(self):
+        selected = [iid for iid in self.fm_tree.selection() if iid in self.uploaded_files]
+        if not selected:
+            return
+        if len(selected) > 1 and not messagebox.askyesno("删除文档", f"确定移除选中的 {len(selected)} 个文档吗？", parent=self.fm_window):
+            return
+        self.remove_documents(selected)
+
+    def remove_documents(self, filepaths, promote_duplicates=True):
+        versions = []
+        for fp in filepaths:
+            self.uploaded_files.pop(fp, None)
+            self.duplicate_docs.pop(fp, None)
+            self._fm_delete_row(fp)
+            # 记下此刻的入库版本：随后重新注入的同一路径版本不同，不会被迟到的后台移除删掉
+            version = self.engine.doc_index.version(fp)
+            if version is not None:
+                versions.append((fp, version))
+        self.update_files_count_ui()
+        # 从检索索引中移除 (连同磁盘上的正文) 放到后台，批量删除大文档时界面不卡顿
+        def _unindex():
+            for fp, version in versions:
+                self.engine.remove_document(fp, version)
+            self.after(0, self._fm_update_summary)
+        threading.Thread(target=_unindex, daemon=True).start()
+        self.status_var.set(f"🗑 已移除 {len(filepaths)} 个参考文档")
+        if promote_duplicates:
+            # 被移除文档的同内容副本仍在时改用副本 (命中解析缓存，不会重新解析)
+            removed = set(filepaths)
+            promote = {}
+            for dup, original in list(self.duplicate_docs.items()):
+                if original in removed:
+                    del self.duplicate_docs[dup]
+                    if os.path.exists(dup):
+                        promote.setdefault(original, dup)
+            if promote:
+                self.ingest_engine.ingest(list(promote.values()))
+
+    # ================= 参考资料文件夹监视 =================
+    def toggle_watch_folder(self):
+        if self.watch_scanner is not None:
+            if messagebox.askyesno("监视文件夹", f"正在监视：{self.watch_folder}\n确定停止监视吗？(已载入的文档会保留)"):
+                self.stop_watch()
+            return
+        folder = filedialog.askdirectory(title="选择要监视的参考资料文件夹")
+        if folder:
+            self.start_watch(folder)
+
+    def start_watch(self, folder):
+        self.stop_watch(save=False)
+        self.watch_folder = folder
+        self.watch_scanner = FolderScanner(folder, self.doc_cache.hash_file)
+        self.save_config()
+        self.update_files_count_ui()
+        self.status_var.set(f"👁 正在扫描监视文件夹：{folder}")
+        self._watch_tick()
+
+    def stop_watch(self, save=True):
+        if self.watch_job is not None:
+            self.after_cancel(self.watch_job)
+            self.watch_job = None
+        if self.watch_scanner is None:
+            return
+        self.watch_scanner = None
+        self.watch_folder = ""
+        if save:
+            self.save_config()
+            self.update_files_count_ui()
+            self.status_var.set("⏹ 已停止监视文件夹")
+
+    def _watch_tick(self):
+        self.watch_job = None
+        scanner = self.watch_scanner
+        if scanner is None:
+            return
+        # 扫描与哈希在后台线程；上一轮未结束时跳过本轮
+        if not self.watch_busy:
+            self.watch_busy = True
+            threading.Thread(target=self._thread_watch_scan, args=(scanner,), daemon=True).start()
+        self.watch_job = self.after(WATCH_INTERVAL_MS, self._watch_tick)
+
+    def _thread_watch_scan(self, scanner):
+        try:
+            result = scanner.scan()
+        except Exception as e:
+            result = None
+            text = f"❌ 扫描监视文件夹失败: {str(e)}"
+            self.after(0, lambda: self.status_var.set(text))
+        self.after(0, lambda: self._apply_watch_result(scanner, result))
+
+    def _apply_watch_result(self, scanner, result):
+        self.watch_busy = False
+        if scanner is not self.watch_scanner or not result:
+            return
+        # 改名/移动：沿用已解析的文本，只换路径
+        for old, new, content_hash in result.renamed:
+            if old in self.uploaded_files:
+                self._rename_document(old, new)
+            else:
+                self.duplicate_docs.pop(old, None)
+                result.added.append((new, content_hash))
+        # 删除
+        gone = [path for path, _ in result.removed if path in self.uploaded_files]
+        for path, _ in result.removed:
+            self.duplicate_docs.pop(path, None)
+        if gone:
+            self.remove_documents(gone)
+        # 新增与改动：内容与已载入文档相同的直接跳过，其余交给解析引擎 (命中缓存时不重新解析)
+        pending = []
+        duplicates = 0
+        for path, content_hash in result.added + result.changed:
+            info = self.uploaded_files.get(path)
+            if info is not None and info.get("hash") == content_hash:
+                continue
+            original = self._loaded_path_for_hash(content_hash, exclude=path)
+            if original is not None:
+                self.duplicate_docs[path] = original
+                if info is not None:
+                    # 改动后恰好与另一份文档相同
+                    self.remove_documents([path], promote_duplicates=False)
+                duplicates += 1
+                continue
+            pending.append(path)
+        for path in pending:
+            self.ingest_progress[path] = (0, 0)
+        if pending:
+            self.ingest_engine.ingest(pending)
+        parts = []
+        if pending:
+            parts.append(f"解析 {len(pending)} 个新增/改动文件")
+        if result.renamed:
+            parts.append(f"{len(result.renamed)} 个改名")
+        if gone:
+            parts.append(f"移除 {len(gone)} 个已删除文件")
+        if duplicates:
+            parts.append(f"跳过 {duplicates} 个重复文件")
+        if parts:
+            self.status_var.set("👁 监视文件夹有变化：" + "，".join(parts))
+
+    def _rename_document(self, old, new):
+        info = self.uploaded_files.pop(old)
+        info["name"] = os.path.basename(new)
+        self.uploaded_files[new] = info
+        for dup, original in self.duplicate_docs.items():
+            if original == old:
+                self.duplicate_docs[dup] = new
+        self._fm_delete_row(old)
+        self._fm_insert(new)
+        # 索引与磁盘上的正文直接换路径，不重新分块
+        self.engine.rename_document(old, new, info["name"])
 
     # ================= 界面构建模块 =================
     def setup_ui(self):
@@ -273,10 +848,20 @@ class LessonPlanWriter(ttk.Window):
         
         ttk.Button(api_frame, text="⚙️ 配置 API Key", command=self.open_api_settings, bootstyle="info").pack(side=LEFT, padx=5)
         ttk.Label(api_frame, textvariable=self.api_status_var, font=(MAIN_FONT_NAME, 9)).pack(side=LEFT, padx=5)
+        ttk.Button(api_frame, text="📏 素材预算", command=self.open_budget_settings, bootstyle="info-link").pack(side=LEFT)
+        ttk.Button(api_frame, text="🧠 正文内存", command=self.open_text_memory_settings, bootstyle="info-link").pack(side=LEFT)
+        ttk.Button(api_frame, text="🔀 接口后端", command=self.open_backend_settings, bootstyle="info-link").pack(side=LEFT)
+        ttk.Checkbutton(api_frame, text="绕过缓存", variable=self.bypass_cache_var, command=self._sync_bypass_cache, bootstyle="round-toggle").pack(side=LEFT, padx=5)
+        ttk.Checkbutton(api_frame, text="摘要代替原文", variable=self.use_digests_var, command=self._sync_use_digests, bootstyle="round-toggle").pack(side=LEFT, padx=5)
 
         action_frame = ttk.Labelframe(header_frame, text="⚙️ 全局操作", padding=10, bootstyle="secondary")
         action_frame.pack(side=RIGHT, fill=Y, padx=(10, 0))
         
+        ttk.Button(action_frame, text="📚 批量生成全部课时", command=self.open_batch_window, bootstyle="success").pack(fill=X, pady=2)
+        project_btns = ttk.Frame(action_frame)
+        project_btns.pack(fill=X, pady=2)
+        ttk.Button(project_btns, text="📂 打开项目", command=self.open_project, bootstyle="primary outline").pack(side=LEFT, fill=X, expand=True, padx=(0, 2))
+        ttk.Button(project_btns, text="💾 保存项目", command=self.save_project, bootstyle="primary outline").pack(side=LEFT, fill=X, expand=True, padx=(2, 0))
         ttk.Button(action_frame, text="📥 导出全套Word教案", command=self.export_word, bootstyle="warning").pack(fill=X, pady=2)
         ttk.Button(action_frame, text="🗑️ 清空所有数据", command=self.clear_all_data, bootstyle="danger outline").pack(fill=X, pady=2)
         ttk.Button(action_frame, text="ℹ️ 关于作者", command=self.show_author, bootstyle="info outline").pack(fill=X, pady=2)
@@ -293,7 +878,7 @@ class LessonPlanWriter(ttk.Window):
         self.add_right_click(self.topic_entry) 
         
         ttk.Label(f1, text="教案类型:", font=(MAIN_FONT_NAME, UI_FONT_SIZE)).pack(side=LEFT, padx=(10, 5))
-        self.type_combo = ttk.Combobox(f1, values=["详案 (标准)", "简案 (提纲)", "匹配教学环节详案", "匹配教学环节简案"], state="readonly", width=16, bootstyle="primary")
+        self.type_combo = ttk.Combobox(f1, values=PLAN_TYPES, state="readonly", width=16, bootstyle="primary")
         self.type_combo.current(0)
         self.type_combo.pack(side=LEFT)
 
@@ -319,6 +904,8 @@ class LessonPlanWriter(ttk.Window):
         ttk.Button(f2, text="📎 注入参考文档", command=self.btn_upload_document, bootstyle="success outline").pack(side=LEFT, padx=5)
         ttk.Label(f2, textvariable=self.files_count_var, font=(MAIN_FONT_NAME, 9), bootstyle="secondary").pack(side=LEFT, padx=(5,10))
         ttk.Button(f2, text="📂 管理文档", command=self.btn_open_file_manager, bootstyle="secondary-link").pack(side=LEFT)
+        ttk.Button(f2, text="👁 监视文件夹", command=self.toggle_watch_folder, bootstyle="info-link").pack(side=LEFT)
+        ttk.Button(f2, text="⏹ 取消解析", command=self.cancel_ingest, bootstyle="danger-link").pack(side=LEFT)
 
         main_pane = ttk.Panedwindow(self, orient=HORIZONTAL)
         main_pane.pack(fill=BOTH, expand=True, padx=15, pady=5)
@@ -397,7 +984,7 @@ class LessonPlanWriter(ttk.Window):
         ttk.Label(cmd_frame, text="💬 额外指令:", font=font_bold).pack(side=LEFT)
         self.instruction_entry = ttk.Entry(cmd_frame, bootstyle="success")
         self.instruction_entry.pack(side=LEFT, fill=X, expand=True, padx=5)
-        self.instruction_entry.insert(0, "环节清晰，体现学生探究，师生互动具体")
+        self.instruction_entry.insert(0, DEFAULT_INSTRUCTION)
         self.add_right_click(self.instruction_entry) 
 
         self.process_text = ScrolledText(right_frame, font=(MAIN_FONT_NAME, 11), padding=10)
@@ -417,6 +1004,7 @@ class LessonPlanWriter(ttk.Window):
         self.status_var = tk.StringVar(value="准备就绪")
         status_lbl = ttk.Label(footer_frame, textvariable=self.status_var, padding=(10, 5), font=(MAIN_FONT_NAME, 9))
         status_lbl.pack(side=LEFT)
+        ttk.Label(footer_frame, textvariable=self.metrics_var, padding=(10, 5), font=(MAIN_FONT_NAME, 9), bootstyle="info").pack(side=LEFT)
         
         author_lbl = ttk.Label(footer_frame, text=self.author_info, padding=(10, 5), font=(MAIN_FONT_NAME, 9), foreground="gray")
         author_lbl.pack(side=RIGHT)
@@ -465,25 +1053,21 @@ class LessonPlanWriter(ttk.Window):
                 self.process_text.insert("1.0", data['process'])
 
     def clean_text(self, text):
-        text = text.replace("**", "").replace("__", "")
-        text = text.replace("```json", "").replace("```", "")
-        lines = []
-        for line in text.split('\n'):
-            clean_line = line.strip()
-            while clean_line.startswith("#"):
-                clean_line = clean_line[1:].strip()
-            lines.append(clean_line)
-        return "\n".join(lines)
+        return clean_text(text)
 
     def get_api_key(self):
-        if not self.api_key:
+        # 只启用了自带 Key (或无需 Key 的本地服务) 的后端时，不要求配置主 Key
+        if not self.api_key and self.engine.api_client.needs_shared_key:
             messagebox.showwarning("未配置 API Key", "请先点击左上角的【⚙️ 配置 API Key】按钮进行授权。\n配置后将自动保存，下次无需输入。")
             return None
-        return self.api_key
+        return self.api_key or "-"
 
     def stop_generation(self):
         if self.is_generating:
-            self.stop_flag = True
+            self.cancel_token.cancel()
+            self.digest_token.cancel()
+            if self.batch is not None and self.batch.is_active():
+                self.batch.cancel()
             self.status_var.set("⛔ 已停止生成")
 
     def clear_current(self):
@@ -502,7 +1086,10 @@ class LessonPlanWriter(ttk.Window):
             self.period_combo.current(0)
             
             self.uploaded_files.clear()
+            self.duplicate_docs.clear()
+            self.engine.clear_documents()
             self.update_files_count_ui()
+            self._fm_reload()
             
             for key in self.fields:
                 self.fields[key].delete("1.0", END)
@@ -512,17 +1099,46 @@ class LessonPlanWriter(ttk.Window):
             
             self.status_var.set("⚠️ 所有数据已重置")
 
-    def get_combined_doc_context(self):
-        if not self.uploaded_files:
-            return ""
-        context = "\n【文档素材库：教师上传的多份参考文件】\n"
-        for filepath, data in self.uploaded_files.items():
-            context += f"\n--- 文件名称: {data['name']} ---\n{data['text']}\n"
-        return context
+    def get_combined_doc_context(self, query=""):
+        return self.engine.get_combined_doc_context(query)
+
+    def report_prompt_stats(self, stats):
+        # 在生成线程调用，经 after 回到界面线程更新状态栏
+        note = f"，裁掉 {stats['dropped_passages']} 段素材" if stats['dropped_passages'] else ""
+        if stats['over_budget']:
+            note += "，⚠️ 指令本身已超预算"
+        text = f"📏 Prompt ≈ {stats['prompt_tokens']} tokens，其中共享前缀 {stats['prefix_tokens']} (压缩前 {stats['raw_tokens']}，预算 {stats['budget']}{note})"
+        self.after(0, lambda: self.status_var.set(text))
+
+    def build_framework_prompt(self, topic, current_p, total_p, custom_content, report=True):
+        messages, stats = self.engine.build_framework_prompt(topic, current_p, total_p, custom_content)
+        if report:
+            self.report_prompt_stats(stats)
+        return messages
+
+    def build_process_prompt(self, topic, context, instruction, plan_type, current_p, report=True):
+        messages, stats = self.engine.build_process_prompt(topic, context, instruction, plan_type, current_p)
+        if report:
+            self.report_prompt_stats(stats)
+        return messages
+
+    def _on_request_metrics(self, metrics, final):
+        # 工作线程回调：摘要在此生成，界面线程只负责赋值
+        text = metrics.summary()
+        if final and metrics.status != "ok":
+            text += " (已取消)" if metrics.status == "cancelled" else " (失败)"
+        self.after(0, lambda: self.metrics_var.set(text))
+
+    def _sse_note(self, anomalies_before):
+        dropped = self.engine.sse_anomalies - anomalies_before
+        return f"（丢弃 {dropped} 个异常事件）" if dropped else ""
 
     def generate_framework(self):
         api_key = self.get_api_key()
         if not api_key: return
+        if self.is_generating:
+            self.status_var.set("⏳ 已有生成任务进行中，请稍候或先停止")
+            return
         
         topic = self.topic_entry.get()
         current_p = self.active_period
@@ -530,69 +1146,39 @@ class LessonPlanWriter(ttk.Window):
         custom_content = self.fields['custom_content'].get("1.0", END).strip()
         
         self.is_generating = True
-        self.stop_flag = False
-        threading.Thread(target=self._thread_generate_framework, args=(api_key, topic, current_p, total_p, custom_content)).start()
+        self.cancel_token = CancelToken()
+        threading.Thread(target=self._thread_generate_framework, args=(topic, current_p, total_p, custom_content)).start()
 
-    def _thread_generate_framework(self, api_key, topic, current_p, total_p, custom_content):
-        self.status_var.set(f"🤖 正在分析第 {current_p} 课时框架...")
-        
-        doc_context = self.get_combined_doc_context()
-        
-        custom_instruction_block = ""
-        if custom_content:
-            custom_instruction_block = f"""
-        【最高优先级：教师自定义指令】
-        用户原话：“{custom_content}”
-        (注意：请你务必严格、优先遵循上述指令。如果指令中要求你解读、参考指定的上传文件，请仔细在下文的【文档素材库】中寻找对应内容，并完全依据指令的要求执行。请勿使用通用废话敷衍。)
-        """
-        else:
-            custom_instruction_block = f"请根据教学逻辑，自动规划第{current_p}课时（共{total_p}课时）的核心内容。"
-
-        # 优化点：修改了 Prompt 指令，强制要求素养目标带有数字编号分条列出。
-        prompt = f"""
-        任务：为高中化学课题《{topic}》设计第 {current_p} 课时的教案框架。
-        
-        {custom_instruction_block}
-        {doc_context}
-
-        【核心要求】
-        1. **课程标准**：【必须】引用**《普通高中化学课程标准（2017年版2025年日常修订版）》**中与本课时内容直接相关的具体条目，严禁使用“匹配课标”等模糊词汇。
-        2. **素养导向**：严禁使用“三维目标”分类。必须分条列出具体的素养目标，并带上数字编号（如 1. 2. 3.），每条采用“通过...培养...素养”的句式描述。
-        3. 格式：纯文本，无Markdown。**【重要】化学式、离子符号、化学方程式【必须】严格使用 Unicode 标准的上标和下标字符（例如：H₂O, SO₄²⁻, Fe³⁺, ∆表示加热），绝对不能用普通数字替代。**
-        4. 返回JSON格式，Key必须保持一致：
-        {{
-            "chapter": "所属章节",
-            "standard": "在此处填写具体的2025日常修订版课标条目内容",
-            "objectives": "素养导向目标",
-            "key_points": "重点",
-            "difficulties": "难点",
-            "methods": "方法",
-            "homework": "作业"
-        }}
-        """
-        
+    def _thread_generate_framework(self, topic, current_p, total_p, custom_content):
+        text = f"🤖 正在分析第 {current_p} 课时框架..."
+        self.after(0, lambda text=text: self.status_var.set(text))
         try:
-            url = "https://api.deepseek.com/chat/completions"
-            headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-            data = {
-                "model": "deepseek-chat",
-                "messages": [{"role": "user", "content": prompt}],
-                "stream": False
-            }
-            
-            response = requests.post(url, headers=headers, json=data)
-            if response.status_code == 200:
-                raw_content = response.json()['choices'][0]['message']['content']
-                json_str = raw_content.replace("```json", "").replace("```", "").strip()
-                data = json.loads(json_str)
-                for k, v in data.items():
-                    data[k] = self.clean_text(v)
-                self.after(0, lambda: self._update_framework_ui(data))
-                self.status_var.set("✅ 框架生成完毕")
-            else:
-                self.status_var.set(f"❌ API错误: {response.status_code}")
+            self.ensure_digests(topic, self.cancel_token)
+            messages = self.build_framework_prompt(topic, current_p, total_p, custom_content)
+            received = []
+
+            def on_field(key, value):
+                received.append(key)
+                self.after(0, lambda: self._update_framework_ui({key: value}))
+                text = f"🤖 第 {current_p} 课时框架：已生成 {len(received)} 项..."
+                self.after(0, lambda: self.status_var.set(text))
+
+            anomalies_before = self.engine.sse_anomalies
+            data = self.engine.run_framework(messages, self.cancel_token, on_field)
+            if data is not None:
+                # 增量阶段未拿到字段时才整体回填，避免界面重复刷新
+                if not received:
+                    self.after(0, lambda: self._update_framework_ui(data))
+                text = "✅ 框架生成完毕" + self._sse_note(anomalies_before)
+                self.after(0, lambda text=text: self.status_var.set(text))
+        except RequestCancelled:
+            pass
+        except ApiError as e:
+            text = f"❌ API错误: {e.status_code}"
+            self.after(0, lambda text=text: self.status_var.set(text))
         except Exception as e:
-            self.status_var.set(f"❌ 错误: {str(e)}")
+            text = f"❌ 错误: {str(e)}"
+            self.after(0, lambda text=text: self.status_var.set(text))
         finally:
             self.is_generating = False
 
@@ -605,6 +1191,9 @@ class LessonPlanWriter(ttk.Window):
     def start_writing_process(self):
         api_key = self.get_api_key()
         if not api_key: return
+        if self.is_generating:
+            self.status_var.set("⏳ 已有生成任务进行中，请稍候或先停止")
+            return
         
         context = {k: v.get("1.0", END).strip() for k, v in self.fields.items()}
         topic = self.topic_entry.get()
@@ -613,168 +1202,425 @@ class LessonPlanWriter(ttk.Window):
         current_p = self.active_period
         
         self.is_generating = True
-        self.stop_flag = False
-        threading.Thread(target=self._thread_write_process, args=(api_key, topic, context, instruction, plan_type, current_p)).start()
-
-    def _thread_write_process(self, api_key, topic, context, instruction, plan_type, current_p):
-        self.status_var.set(f"✍️ 正在撰写第 {current_p} 课时过程...")
-        
-        custom_content = context.get('custom_content', '')
-        
-        stage_requirements = ""
-        if "匹配教学环节" in plan_type:
-            stage_requirements = """
-        【教学环节强制要求】
-        必须严格按照以下五个高中化学常规环节展开：
-        - 环节一：学习目标。对标课标，深度融合五大核心素养，表述清晰可量化（如“能写出”、“会分析”）。
-        - 环节二：情景创设。使用生活、实验或前沿情境引发认知冲突或探究欲望。
-        - 环节三：任务驱动教学。拆解本节核心任务，该环节必须包含“自主学习或者合作探究”、“归纳小结”、“评价训练”3个基本子环节。
-        - 环节四：课堂小结。师生共同梳理本节课知识脉络，形成完整体系。
-        - 环节五：课堂检测。紧密围绕目标设计基础达标与能力提升题。
-        """
-
-        detail_level = ""
-        if "简案" in plan_type:
-            detail_level = "【篇幅与深度要求】只需体现出教学的核心框架和逻辑思路。严禁长篇大论，不需要写出具体的师生对话和详细的题目内容。"
-        elif "详案" in plan_type:
-            detail_level = "【篇幅与深度要求】需要详细写出教师的具体话术引导、预期的学生具体回答，以及每一道评价训练和课堂检测的具体题目内容。"
-
-        doc_context = self.get_combined_doc_context()
-        
-        custom_instruction_block = ""
-        if custom_content:
-            custom_instruction_block = f"""
-        【最高优先级：教师自定义指令】
-        用户原话：“{custom_content}”
-        (注意：请你必须严格、优先遵循上述指令。如果指令中点名要求依据某个具体课件或教材来撰写，请务必在下文的【文档素材库】中检索该文件内容，紧密结合其中的知识点、情境和习题来设计这节课的教学过程，你的输出必须高度体现该指令的定制意图。)
-        """
-
-        prompt = f"""
-        任务：撰写高中化学《{topic}》第 {current_p} 课时的“教学过程”。
-        
-        {custom_instruction_block}
-        
-        【基础设计信息】
-        素养目标：{context['objectives']}
-        重难点：{context['key_points']}
-        {doc_context}
-        
-        【严格限制】
-        1. 格式：纯文本，严禁Markdown。**【重要】所有的化学式、离子符号等【必须】严格使用 Unicode 标准的上下标字符（例如：H₂O, CO₃²⁻, Fe³⁺）。**
-        2. 时长：40分钟。
-        3. 风格类型：{plan_type}。{instruction}
-        4. 理念：新课标“教-学-评”一体化。
-        {stage_requirements}
-        {detail_level}
-        
-        【输出结构】
-        环节名称（时间） - 教师活动 - 学生活动 - 设计意图
-        """
-
-        url = "https://api.deepseek.com/chat/completions"
-        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-        data = {
-            "model": "deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": True
+        self.cancel_token = CancelToken()
+        self.stream_buffer.open()
+        self.after(STREAM_FRAME_MS, self._pump_stream_buffer)
+        threading.Thread(target=self._thread_write_process, args=(topic, context, instruction, plan_type, current_p)).start()
+
+    def _pump_stream_buffer(self):
+        text, still_open = self.stream_buffer.drain()
+        if text:
+            self.process_text.insert(END, text)
+            self.process_text.see(END)
+        if still_open:
+            self.after(STREAM_FRAME_MS, self._pump_stream_buffer)
+
+    def _thread_write_process(self, topic, context, instruction, plan_type, current_p):
+        text = f"✍️ 正在撰写第 {current_p} 课时过程..."
+        self.after(0, lambda text=text: self.status_var.set(text))
+        try:
+            self.ensure_digests(topic, self.cancel_token)
+            messages = self.build_process_prompt(topic, context, instruction, plan_type, current_p)
+            anomalies_before = self.engine.sse_anomalies
+            self.engine.run_process(messages, self.cancel_token, self.stream_buffer.push)
+            if not self.cancel_token.cancelled:
+                text = "✅ 撰写完成" + self._sse_note(anomalies_before)
+                self.after(0, lambda text=text: self.status_var.set(text))
+        except RequestCancelled:
+            pass
+        except ApiError as e:
+            text = f"❌ API错误: {e.status_code}"
+            self.after(0, lambda text=text: self.status_var.set(text))
+        except Exception as e:
+            text = f"❌ 错误: {str(e)}"
+            self.after(0, lambda text=text: self.status_var.set(text))
+        finally:
+            # 关闭缓冲后界面线程会把剩余文本刷完再停止轮询
+            self.stream_buffer.close()
+            self.is_generating = False
+
+    # ================= 项目文件与自动保存 =================
+    def collect_project_state(self):
+        # 在界面线程拍快照；课时字典逐个复制，后台写盘时界面可继续编辑
+        self.save_current_data_to_memory(self.active_period)
+        return {
+            "meta": {
+                "topic": self.topic_entry.get(),
+                "plan_type": self.type_combo.get(),
+                "instruction": self.instruction_entry.get(),
+                "total_periods": self.total_periods_var.get(),
+                "active_period": self.active_period
+            },
+            "periods": {p: dict(data) for p, data in self.lesson_data.items()},
+            "docs": {fp: dict(info) for fp, info in self.uploaded_files.items()}
         }
 
+    def _state_is_empty(self, state):
+        return not state["docs"] and not any(v for data in state["periods"].values() for v in data.values())
+
+    def _autosave_tick(self):
+        if not self.autosave_busy:
+            self.autosave_busy = True
+            state = self.collect_project_state()
+            threading.Thread(target=self._write_autosave, args=(self.project, state), daemon=True).start()
+        self.after(AUTOSAVE_MS, self._autosave_tick)
+
+    def _write_autosave(self, project, state):
         try:
-            response = requests.post(url, headers=headers, json=data, stream=True)
-            for line in response.iter_lines():
-                if self.stop_flag: break
-                if line:
-                    decoded_line = line.decode('utf-8').replace("data: ", "")
-                    if decoded_line != "[DONE]":
-                        try:
-                            json_line = json.loads(decoded_line)
-                            content = json_line['choices'][0]['delta'].get('content', '')
-                            if content:
-                                content = self.clean_text(content)
-                                self.after(0, lambda c=content: self.process_text.insert(END, c))
-                                self.after(0, lambda: self.process_text.see(END))
-                        except:
-                            pass
-            self.status_var.set("✅ 撰写完成")
+            project.save(state)
         except Exception as e:
-            self.status_var.set(f"❌ 错误: {str(e)}")
+            text = f"⚠️ 自动保存失败: {str(e)}"
+            self.after(0, lambda: self.status_var.set(text))
         finally:
-            self.is_generating = False
+            self.autosave_busy = False
+
+    def _offer_restore(self):
+        # 上次未正常保存的工作：后台读取后询问是否恢复；否则开始自动保存
+        if not self.project.exists():
+            self.after(AUTOSAVE_MS, self._autosave_tick)
+            return
+        self._load_project_async(self.project, ask_restore=True)
+
+    def open_project(self):
+        if self.is_generating:
+            messagebox.showinfo("打开项目", "当前有生成任务进行中，请先等待完成或点击停止。")
+            return
+        if self.project.path == AUTOSAVE_FILE and not self._state_is_empty(self.collect_project_state()):
+            answer = messagebox.askyesnocancel("打开项目", "当前工作尚未保存为项目，是否先保存？")
+            if answer is None: return
+            if answer:
+                self.save_project()
+                if self.project.path == AUTOSAVE_FILE: return
+        filename = filedialog.askopenfilename(filetypes=[("教案项目", "*" + PROJECT_EXT)])
+        if not filename: return
+        # 打开前先把当前工作落盘；未命名的临时工作已确认放弃
+        if self.project.path == AUTOSAVE_FILE:
+            self.project.delete()
+        else:
+            self._flush_project()
+        self._load_project_async(ProjectStore(filename, doc_cache=self.doc_cache, text_source=self.engine.document_text))
+
+    def _load_project_async(self, store, ask_restore=False):
+        self.status_var.set("⏳ 正在打开项目...")
+
+        def _load():
+            try:
+                state = store.load()
+            except Exception as e:
+                self.after(0, lambda e=e: self._on_project_load_error(store, e, ask_restore))
+                return
+            self.after(0, lambda: self._on_project_loaded(store, state, ask_restore))
+        threading.Thread(target=_load, daemon=True).start()
+
+    def _on_project_load_error(self, store, exc, ask_restore):
+        if ask_restore:
+            store.delete()
+            self.status_var.set("⚠️ 上次的自动保存已损坏，已忽略")
+            self.after(AUTOSAVE_MS, self._autosave_tick)
+        else:
+            messagebox.showerror("打开失败", f"无法打开项目:\n{str(exc)}")
+            self.status_var.set("❌ 项目打开失败")
+
+    def _on_project_loaded(self, store, state, ask_restore):
+        if ask_restore:
+            self.after(AUTOSAVE_MS, self._autosave_tick)
+            if self._state_is_empty(state):
+                store.delete()
+                self.status_var.set("准备就绪")
+                return
+            topic = state["meta"].get("topic", "")
+            if not messagebox.askyesno("恢复工作", f"检测到上次未保存的工作（课题：{topic}），是否恢复？"):
+                store.delete()
+                self.status_var.set("准备就绪")
+                return
+        self._apply_project_state(state)
+        self.project = store
+        name = "" if store.path == AUTOSAVE_FILE else os.path.basename(store.path)
+        self.title(f"{APP_TITLE} - {name}" if name else APP_TITLE)
+
+    def _apply_project_state(self, state):
+        meta = state["meta"]
+        self.topic_entry.delete(0, END)
+        self.topic_entry.insert(0, meta.get("topic", ""))
+        if meta.get("plan_type") in PLAN_TYPES:
+            self.type_combo.set(meta["plan_type"])
+        self.instruction_entry.delete(0, END)
+        self.instruction_entry.insert(0, meta.get("instruction", DEFAULT_INSTRUCTION))
+
+        self.lesson_data = {p: dict(data) for p, data in state["periods"].items()}
+        total = max([int(meta.get("total_periods", 1))] + list(self.lesson_data))
+        self.total_periods_var.set(total)
+        self.period_combo['values'] = list(range(1, total + 1))
+        self.active_period = min(max(1, int(meta.get("active_period", 1))), total)
+        self.period_combo.set(self.active_period)
+        self.load_data_from_memory(self.active_period)
+
+        # 参考文档：优先取项目内嵌文本或解析缓存，都没有时从源文件重新解析
+        self.uploaded_files.clear()
+        self.duplicate_docs.clear()
+        self.engine.clear_documents()
+        ready = []
+        reparse = []
+        missing = []
+        for filepath, doc in state["docs"].items():
+            if doc.get("text") is not None:
+                self.uploaded_files[filepath] = {"name": doc["name"], "chars": len(doc["text"]), "hash": doc["hash"],
+                                                 "pages": self.doc_cache.get_meta(doc["hash"]).get("pages", 0)}
+                ready.append((filepath, doc["name"], doc.pop("text"), doc["hash"]))
+            elif os.path.exists(filepath):
+                reparse.append(filepath)
+            else:
+                missing.append(doc["name"])
+        self.update_files_count_ui()
+
+        loaded = len(ready)
+
+        def _index():
+            # 逐份写入文本存储后即释放内存中的副本
+            while ready:
+                filepath, name, text, content_hash = ready.pop(0)
+                self.engine.add_document(filepath, name, text, content_hash)
+            # 索引建好后刷新管理器中的 token 列
+            self.after(0, self._fm_reload)
+        threading.Thread(target=_index, daemon=True).start()
+        if reparse:
+            for filepath in reparse:
+                self.ingest_progress[filepath] = (0, 0)
+            self.ingest_engine.ingest(reparse)
+
+        note = f"，⚠️ {len(missing)} 个参考文档已找不到" if missing else ""
+        if reparse:
+            note += f"，正在重新解析 {len(reparse)} 个文档"
+        self.status_var.set(f"📂 项目已打开：{len(self.lesson_data)} 个课时，{loaded} 个文档{note}")
+
+    def save_project(self):
+        state = self.collect_project_state()
+        if self.project.path == AUTOSAVE_FILE:
+            filename = filedialog.asksaveasfilename(defaultextension=PROJECT_EXT, filetypes=[("教案项目", "*" + PROJECT_EXT)])
+            if not filename: return
+            store = ProjectStore(filename, doc_cache=self.doc_cache, text_source=self.engine.document_text)
+            try:
+                size = store.compact(state)
+            except Exception as e:
+                messagebox.showerror("保存失败", f"无法保存项目: {str(e)}")
+                return
+            # 已另存为正式项目，自动保存的临时文件不再需要
+            self.project.delete()
+            self.project = store
+            self.title(f"{APP_TITLE} - {os.path.basename(filename)}")
+            self.status_var.set(f"💾 项目已保存：{os.path.basename(filename)} ({size // 1024} KB)")
+            return
+        try:
+            written = self.project.save(state)
+        except Exception as e:
+            messagebox.showerror("保存失败", f"无法保存项目: {str(e)}")
+            return
+        self.status_var.set(f"💾 项目已保存（本次写入 {written} 字节）")
+
+    def _flush_project(self):
+        # 同步写盘：关闭窗口、切换项目前调用
+        state = self.collect_project_state()
+        try:
+            if self.project.path == AUTOSAVE_FILE and self._state_is_empty(state):
+                self.project.delete()
+            else:
+                self.project.save(state)
+        except Exception:
+            pass
+
+    def on_close(self):
+        self.stop_watch(save=False)
+        self.cancel_token.cancel()
+        self.digest_token.cancel()
+        if self.batch is not None:
+            self.batch.cancel()
+        self._flush_project()
+        self.destroy()
+
+    # ================= 批量生成全部课时 =================
+    def open_batch_window(self):
+        api_key = self.get_api_key()
+        if not api_key: return
+        if self.batch_window is not None and self.batch_window.winfo_exists():
+            self.batch_window.lift()
+            return
+        if self.is_generating:
+            messagebox.showinfo("批量生成", "当前已有生成任务进行中，请先等待完成或点击停止。")
+            return
+
+        self.save_current_data_to_memory(self.active_period)
+        top = tk.Toplevel(self)
+        top.title("批量生成全部课时")
+        top.geometry("620x420")
+        top.transient(self)
+        self.batch_window = top
+
+        opt_frame = ttk.Frame(top, padding=10)
+        opt_frame.pack(fill=X)
+        ttk.Label(opt_frame, text="并发数:", font=(MAIN_FONT_NAME, UI_FONT_SIZE)).pack(side=LEFT)
+        concurrency_var = tk.IntVar(value=self.batch_concurrency)
+        ttk.Spinbox(opt_frame, from_=1, to=8, width=3, textvariable=concurrency_var).pack(side=LEFT, padx=5)
+        only_missing_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(opt_frame, text="仅生成空缺内容", variable=only_missing_var, bootstyle="round-toggle").pack(side=LEFT, padx=10)
+
+        columns = ("period", "framework", "process", "info")
+        tree = ttk.Treeview(top, columns=columns, show="headings", height=10, bootstyle="info")
+        for col, text, width in zip(columns, ("课时", "教学框架", "教学过程", "说明"), (60, 110, 110, 300)):
+            tree.heading(col, text=text)
+            tree.column(col, width=width, anchor=W if col == "info" else CENTER)
+        tree.pack(fill=BOTH, expand=True, padx=10)
+
+        total_p = self.total_periods_var.get()
+        for p in range(1, total_p + 1):
+            tree.insert("", END, iid=str(p), values=(f"第 {p} 课时", "—", "—", ""))
+
+        btn_frame = ttk.Frame(top, padding=10)
+        btn_frame.pack(fill=X)
+
+        def start():
+            try:
+                self.batch_concurrency = max(1, int(concurrency_var.get()))
+            except (ValueError, tk.TclError):
+                self.batch_concurrency = DEFAULT_CONCURRENCY
+            self.save_config()
+            start_btn.configure(state=DISABLED)
+            self._start_batch(tree, total_p, only_missing_var.get())
+
+        def retry_selected():
+            if self.batch is None: return
+            for iid in tree.selection():
+                p = int(iid)
+                for kind in ("framework", "process"):
+                    self.batch.retry((kind, p))
+            if self.batch.is_active():
+                self.is_generating = True
+
+        start_btn = ttk.Button(btn_frame, text="▶ 开始生成", command=start, bootstyle="success")
+        start_btn.pack(side=LEFT, padx=5)
+        ttk.Button(btn_frame, text="🔁 重试选中课时", command=retry_selected, bootstyle="warning outline").pack(side=LEFT, padx=5)
+        ttk.Button(btn_frame, text="⛔ 取消全部", command=self.stop_generation, bootstyle="danger outline").pack(side=LEFT, padx=5)
+
+    def _start_batch(self, tree, total_p, only_missing):
+        topic = self.topic_entry.get()
+        instruction = self.instruction_entry.get()
+        plan_type = self.type_combo.get()
+
+        def on_update(job):
+            self.after(0, lambda: self._on_batch_update(tree, job))
+
+        def rate_limit_delay(exc):
+            if isinstance(exc, ApiError) and exc.is_rate_limited:
+                return exc.retry_after or 0
+            return None
+
+        self.batch = BatchScheduler(self.batch_concurrency, on_update=on_update, rate_limit_delay=rate_limit_delay)
+        for p in range(1, total_p + 1):
+            data = self.lesson_data.get(p, {})
+            custom_content = data.get('custom_content', '')
+            need_framework = not (only_missing and data.get('objectives'))
+            need_process = not (only_missing and data.get('process'))
+
+            def framework_job(should_stop, p=p, custom_content=custom_content):
+                self.ensure_digests(topic, should_stop)
+                messages = self.build_framework_prompt(topic, p, total_p, custom_content, report=False)
+                result = self.engine.run_framework(messages, should_stop)
+                if result is not None:
+                    self.after(0, lambda: self._store_period_result(p, result))
+                return result
+
+            def process_job(should_stop, p=p, data=data):
+                context = dict(data)
+                framework = self.batch.jobs.get(("framework", p))
+                if framework is not None and framework.result:
+                    context.update(framework.result)
+                self.ensure_digests(topic, should_stop)
+                messages = self.build_process_prompt(topic, context, instruction, plan_type, p, report=False)
+                text = self.engine.run_process(messages, should_stop)
+                if not should_stop():
+                    self.after(0, lambda: self._store_period_result(p, {'process': text}))
+                return text
+
+            if need_framework:
+                self.batch.add(("framework", p), framework_job)
+            else:
+                tree.set(str(p), "framework", "已有")
+            if need_process:
+                self.batch.add(("process", p), process_job, depends_on=("framework", p) if need_framework else None)
+            else:
+                tree.set(str(p), "process", "已有")
+
+        if not self.batch.jobs:
+            self.status_var.set("✅ 所有课时均已有内容，无需批量生成")
+            return
+        self.is_generating = True
+        self.cancel_token = CancelToken()
+        self.status_var.set(f"📚 批量生成已启动：{len(self.batch.jobs)} 个任务，并发 {self.batch_concurrency}")
+        self.batch.start()
+
+    def _on_batch_update(self, tree, job):
+        kind, p = job.key
+        if tree.winfo_exists():
+            tree.set(str(p), kind, job.status)
+            if job.error:
+                tree.set(str(p), "info", job.error[:80])
+            elif job.status == BATCH_DONE:
+                tree.set(str(p), "info", "")
+        if self.batch is None or self.batch.is_active():
+            return
+        self.is_generating = False
+        done = sum(1 for j in self.batch.jobs.values() if j.status == BATCH_DONE)
+        self.status_var.set(f"📚 批量生成结束：{done}/{len(self.batch.jobs)} 个任务完成")
+
+    def _store_period_result(self, period, result):
+        # 结果写入对应课时；若正好是当前编辑课时，同时刷新界面
+        if period == self.active_period:
+            if 'process' in result:
+                self.process_text.delete("1.0", END)
+                self.process_text.insert("1.0", result['process'])
+            self._update_framework_ui({k: v for k, v in result.items() if k != 'process'})
+            self.save_current_data_to_memory(period)
+        else:
+            self.lesson_data.setdefault(period, {}).update(result)
 
     def export_word(self):
+        if self.is_exporting:
+            self.status_var.set("⏳ 正在导出，请稍候")
+            return
         self.save_current_data_to_memory(self.active_period)
         filename = filedialog.asksaveasfilename(defaultextension=".docx", filetypes=[("Word Document", "*.docx")])
         if not filename: return
 
+        topic = self.topic_entry.get()
+        total_p = self.total_periods_var.get()
+        # 导出用快照，后台渲染期间界面可继续编辑
+        lesson_data = {p: dict(data) for p, data in self.lesson_data.items()}
+        self.is_exporting = True
+        self.status_var.set(f"📥 正在导出 {total_p} 个课时...")
+        threading.Thread(target=self._thread_export_word, args=(filename, topic, total_p, lesson_data), daemon=True).start()
+
+    def _thread_export_word(self, filename, topic, total_p, lesson_data):
+        def on_progress(done, total):
+            text = f"📥 正在导出：第 {done}/{total} 课时"
+            self.after(0, lambda: self.status_var.set(text))
+
         try:
-            doc = Document()
-            doc.styles['Normal'].font.name = u'宋体'
-            doc.styles['Normal']._element.rPr.rFonts.set(qn('w:eastAsia'), u'宋体')
-            
-            topic = self.topic_entry.get()
-            total_p = self.total_periods_var.get()
-            
-            for i in range(1, total_p + 1):
-                data = self.lesson_data.get(i, {})
-                if not data: continue 
-                
-                if i > 1: doc.add_page_break() 
-                
-                p_title = doc.add_heading(f"第 {i} 课时教案", level=1)
-                p_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                
-                table = doc.add_table(rows=8, cols=4)
-                table.style = 'Table Grid'
-                table.autofit = False
-                
-                for row in table.rows:
-                    row.height = Cm(1.2)
-
-                table.cell(0, 0).text = "课题"
-                table.cell(0, 1).text = topic
-                table.cell(0, 2).text = "时间"
-                table.cell(0, 3).text = datetime.now().strftime("%Y-%m-%d")
-
-                # 优化点：导出教案时不再将“自定义内容”写入课时说明
-                info_text = f"第 {i} 课时 (共 {total_p} 课时)"
-                
-                table.cell(1, 0).text = "课程章节"
-                table.cell(1, 1).text = data.get('chapter', '')
-                table.cell(1, 2).text = "课时说明"
-                table.cell(1, 3).text = info_text
-
-                table.cell(2, 0).merge(table.cell(2, 3))
-                table.cell(2, 0).text = f"课程标准:\n{data.get('standard', '（未生成，请点击生成框架）')}" 
-
-                table.cell(3, 0).merge(table.cell(3, 3))
-                table.cell(3, 0).text = f"素养导向目标:\n{data.get('objectives', '')}"
-
-                table.cell(4, 0).merge(table.cell(4, 3))
-                p = table.cell(4, 0).paragraphs[0]
-                p.add_run("教学重点：").bold = True
-                p.add_run(f"{data.get('key_points', '')}\n")
-                p.add_run("教学难点：").bold = True
-                p.add_run(f"{data.get('difficulties', '')}\n")
-                p.add_run("教学方法：").bold = True
-                p.add_run(f"{data.get('methods', '')}")
-
-                table.cell(5, 0).merge(table.cell(5, 3))
-                cell = table.cell(5, 0)
-                cell.text = "教学过程与师生活动 (40分钟)"
-                cell.add_paragraph(data.get('process', ''))
-
-                table.cell(6, 0).merge(table.cell(6, 3))
-                table.cell(6, 0).text = f"作业设计:\n{data.get('homework', '')}"
-
-                table.cell(7, 0).merge(table.cell(7, 3))
-                table.cell(7, 0).text = "课后反思:\n"
-
-            doc.save(filename)
-            messagebox.showinfo("导出成功", f"🎉 已成功导出 {total_p} 个课时的教案！")
-            
+            reused = export_lessons(filename, topic, total_p, lesson_data, cache=self.export_cache, on_progress=on_progress)
         except Exception as e:
-            messagebox.showerror("导出失败", str(e))
+            self.after(0, lambda e=e: self._on_export_finished(None, str(e)))
+            return
+        note = f"（{reused} 个未改动课时直接复用）" if reused else ""
+        self.after(0, lambda: self._on_export_finished(f"🎉 已成功导出 {total_p} 个课时的教案！{note}", None))
+
+    def _on_export_finished(self, message, error):
+        self.is_exporting = False
+        if error is not None:
+            self.status_var.set("❌ 导出失败")
+            messagebox.showerror("导出失败", error)
+            return
+        self.status_var.set("✅ 导出完成")
+        messagebox.showinfo("导出成功", message)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = LessonPlanWriter()
     app.mainloop()
\ No newline at end of file
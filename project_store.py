@@ -0,0 +1,232 @@
+import os
+import json
+import zlib
+import base64
+import threading
+
+from doc_cache import CACHE_ROOT
+
+# --- 教案项目文件：追加写日志 (JSON Lines)，每次保存只写入变化部分 ---
+# 记录类型：
+#   header                      文件头 (格式名 + 版本)
+#   set    key, value           课题 / 教案类型 / 额外指令 / 总课时 / 当前课时
+#   field  p, key, value        某课时某字段被整体替换
+#   append p, key, text         某课时某字段在原内容后追加 (流式撰写时只写增量)
+#   drop   p                    删除某课时
+#   doc    path, name, hash, chars[, text_z]
+#                               参考文档：默认只记解析缓存的内容哈希，缓存中没有时内嵌压缩文本
+#   undoc  path                 移除参考文档
+# 崩溃时最多丢失最后一条未写完的记录；作废内容累积过多时整体重写 (压实)
+
+PROJECT_EXT = ".jlesson"
+PROJECT_FORMAT = "jinta-lesson-project"
+PROJECT_VERSION = 1
+AUTOSAVE_FILE = os.path.join(CACHE_ROOT, "autosave" + PROJECT_EXT)
+# 作废字节数超过该值且超过文件一半时压实
+COMPACT_MIN_BYTES = 1024 * 1024
+
+
+def empty_state():
+    return {"meta": {}, "periods": {}, "docs": {}}
+
+
+def _encode_text(text):
+    return base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
+
+
+def _decode_text(blob):
+    return zlib.decompress(base64.b64decode(blob)).decode("utf-8")
+
+
+def _line(record):
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class ProjectStore:
+    # state: {"meta": {键: 值}, "periods": {课时: {字段: 文本}}, "docs": {路径: {"name", "hash", "chars"[, "text"]}}}
+    # docs 中不带 text 时，需要内嵌文本才通过 text_source(路径) 取回 (文本平时存放在磁盘存储里)
+    def __init__(self, path, doc_cache=None, embed_documents=False, text_source=None):
+        self.path = path
+        self.doc_cache = doc_cache
+        self.text_source = text_source
+        self.embed_documents = embed_documents
+        self.lock = threading.Lock()
+        self.saved = empty_state()
+        self.valid_size = 0
+        self.garbage = 0
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    # ---------- 读取 ----------
+    def load(self):
+        # 逐条回放日志；返回的 docs 中 text 为 None 表示需从源文件重新解析
+        with self.lock:
+            state = empty_state()
+            offset = 0
+            garbage = 0
+            with open(self.path, 'rb') as f:
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # 崩溃时写了一半的最后一条
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        break
+                    garbage += self._apply(state, record)
+                    offset += len(raw)
+            self.valid_size = offset
+            self.garbage = garbage
+            self.saved = self._copy(state)
+
+        for path, doc in state["docs"].items():
+            if doc.get("text") is None and self.doc_cache is not None:
+                cached = self.doc_cache.get(doc["hash"])
+                if cached is not None:
+                    doc["text"] = cached["text"]
+        return state
+
+    def _apply(self, state, record):
+        # 返回该记录使之作废的旧内容字节数 (估算)
+        op = record.get("op")
+        if op == "set":
+            state["meta"][record["key"]] = record["value"]
+        elif op == "field":
+            fields = state["periods"].setdefault(int(record["p"]), {})
+            old = fields.get(record["key"], "")
+            fields[record["key"]] = record["value"]
+            return len(old.encode("utf-8"))
+        elif op == "append":
+            fields = state["periods"].setdefault(int(record["p"]), {})
+            fields[record["key"]] = fields.get(record["key"], "") + record["text"]
+        elif op == "drop":
+            old = state["periods"].pop(int(record["p"]), {})
+            return sum(len(v.encode("utf-8")) for v in old.values())
+        elif op == "doc":
+            text = _decode_text(record["text_z"]) if record.get("text_z") else None
+            state["docs"][record["path"]] = {"name": record["name"], "hash": record["hash"], "text": text}
+        elif op == "undoc":
+            state["docs"].pop(record["path"], None)
+        return 0
+
+    @staticmethod
+    def _copy(state):
+        return {
+            "meta": dict(state["meta"]),
+            "periods": {p: dict(fields) for p, fields in state["periods"].items()},
+            "docs": {path: {"name": d["name"], "hash": d["hash"]} for path, d in state["docs"].items()}
+        }
+
+    # ---------- 写入 ----------
+    def save(self, state):
+        # 与上次落盘的状态比较，只追加变化的记录；返回写入的字节数
+        with self.lock:
+            records, garbage = self._diff(state)
+            if not records:
+                return 0
+            if self.garbage + garbage > COMPACT_MIN_BYTES and self.garbage + garbage > self.valid_size // 2:
+                return self._rewrite_locked(state)
+            payload = b"".join(_line(r) for r in records)
+            if self.valid_size == 0:
+                payload = _line({"op": "header", "format": PROJECT_FORMAT, "version": PROJECT_VERSION}) + payload
+            self._append_locked(payload)
+            self.garbage += garbage
+            self.saved = self._copy(state)
+            return len(payload)
+
+    def compact(self, state):
+        # 整体重写为一份不含历史的快照 (另存为、作废内容过多时)
+        with self.lock:
+            return self._rewrite_locked(state)
+
+    def _diff(self, state):
+        records = []
+        garbage = 0
+        saved = self.saved
+
+        for key, value in state["meta"].items():
+            if saved["meta"].get(key) != value:
+                records.append({"op": "set", "key": key, "value": value})
+
+        for p, fields in state["periods"].items():
+            old_fields = saved["periods"].get(p, {})
+            for key, value in fields.items():
+                old = old_fields.get(key)
+                if old == value or (old is None and value == ""):
+                    continue
+                if old and value.startswith(old):
+                    records.append({"op": "append", "p": p, "key": key, "text": value[len(old):]})
+                else:
+                    records.append({"op": "field", "p": p, "key": key, "value": value})
+                    garbage += len((old or "").encode("utf-8"))
+        for p in saved["periods"]:
+            if p not in state["periods"]:
+                records.append({"op": "drop", "p": p})
+                garbage += sum(len(v.encode("utf-8")) for v in saved["periods"][p].values())
+
+        for path, doc in state["docs"].items():
+            old = saved["docs"].get(path)
+            if old is not None and old["hash"] == doc["hash"]:
+                continue
+            records.append(self._doc_record(path, doc))
+        for path in saved["docs"]:
+            if path not in state["docs"]:
+                records.append({"op": "undoc", "path": path})
+        return records, garbage
+
+    def _doc_record(self, path, doc):
+        text = doc.get("text")
+        chars = doc.get("chars", len(text or ""))
+        record = {"op": "doc", "path": path, "name": doc["name"], "hash": doc["hash"], "chars": chars}
+        # 解析缓存会按 LRU 淘汰，缓存里已经没有的文档直接内嵌压缩文本
+        in_cache = self.doc_cache is not None and self.doc_cache.contains(doc["hash"])
+        if self.embed_documents or not in_cache:
+            if text is None and self.text_source is not None:
+                text = self.text_source(path)
+            if text:
+                record["text_z"] = _encode_text(text)
+        return record
+
+    def _append_locked(self, payload):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        mode = 'r+b' if os.path.exists(self.path) else 'wb'
+        with open(self.path, mode) as f:
+            # 丢弃崩溃遗留的半条记录后再追加
+            f.seek(self.valid_size)
+            f.truncate()
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.valid_size += len(payload)
+
+    def _rewrite_locked(self, state):
+        records = [{"op": "header", "format": PROJECT_FORMAT, "version": PROJECT_VERSION}]
+        records += [{"op": "set", "key": k, "value": v} for k, v in state["meta"].items()]
+        for p in sorted(state["periods"]):
+            for key, value in state["periods"][p].items():
+                if value:
+                    records.append({"op": "field", "p": p, "key": key, "value": value})
+        records += [self._doc_record(path, doc) for path, doc in state["docs"].items()]
+        payload = b"".join(_line(r) for r in records)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.valid_size = len(payload)
+        self.garbage = 0
+        self.saved = self._copy(state)
+        return len(payload)
+
+    def delete(self):
+        with self.lock:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.saved = empty_state()
+            self.valid_size = 0
+            self.garbage = 0
@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import time
+from collections import Counter
+
+# --- Prompt 预算阶段：本地估算 token、压缩素材、按单次请求预算裁剪 ---
+DEFAULT_REQUEST_BUDGET = 16000
+# 输出与模板波动的预留量
+RESPONSE_RESERVE = 512
+# 共享前缀之后留给单次请求任务说明与补充素材的量；前缀据此裁剪，不随单次请求变化
+SUFFIX_RESERVE = 2000
+SHARED_CONTEXT_TITLE = "【文档素材库：教师上传的多份参考文件（按与本课题的相关度节选）】"
+EXTRA_CONTEXT_TITLE = "【本课时补充素材：与本课时要求最相关的其他节选】"
+PROMPT_LOG_FILE = os.path.join(os.path.expanduser("~"), ".jinta_lesson_cache", "prompt_stats.jsonl")
+
+# 页眉页脚判定：短行在素材中反复出现即视为版式噪声
+HEADER_MAX_CHARS = 40
+HEADER_MIN_REPEATS = 3
+
+_CJK_RE = re.compile(r"[一-鿿]")
+_SPACES_RE = re.compile(r"[ \t　\xa0]+")
+_PAGE_NO_RE = re.compile(r"^(?:[-—–\s]*\d{1,4}[-—–\s]*|第\s*\d{1,4}\s*页(?:\s*[/，,]?\s*共\s*\d{1,4}\s*页)?|page\s*\d{1,4}(?:\s*of\s*\d{1,4})?|\d{1,4}\s*/\s*\d{1,4})$", re.IGNORECASE)
+
+
+def estimate_tokens(text):
+    # 粗略估算：中文约 0.6 token/字，其余字符约 0.3 token/字
+    cjk = len(_CJK_RE.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def compact_whitespace(text):
+    lines = []
+    blank = False
+    for line in text.split("\n"):
+        line = _SPACES_RE.sub(" ", line).strip()
+        if not line:
+            if not blank and lines:
+                lines.append("")
+            blank = True
+            continue
+        blank = False
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def _norm(line):
+    return _SPACES_RE.sub("", line).lower()
+
+
+def compact_sections(sections):
+    # sections: [(文件名, [段落...])]
+    # 去除页码行、重复页眉页脚，以及跨文档重复出现的段落
+    line_counts = Counter()
+    for _, passages in sections:
+        for passage in passages:
+            for line in passage.split("\n"):
+                key = _norm(line)
+                # 以冒号结尾的短行多为“答案：”“解析：”之类的正文标签，不参与页眉判定
+                if key and len(key) <= HEADER_MAX_CHARS and not key.endswith(("：", ":")):
+                    line_counts[key] += 1
+    repeated = {k for k, c in line_counts.items() if c >= HEADER_MIN_REPEATS}
+
+    seen_lines = set()
+    seen_paragraphs = set()
+    removed = 0
+    result = []
+    for name, passages in sections:
+        kept = []
+        for passage in passages:
+            lines = []
+            for line in passage.split("\n"):
+                key = _norm(line)
+                if not key:
+                    continue
+                if _PAGE_NO_RE.match(key):
+                    removed += 1
+                    continue
+                if key in repeated:
+                    if key in seen_lines:
+                        removed += 1
+                        continue
+                    seen_lines.add(key)
+                elif len(key) > HEADER_MAX_CHARS:
+                    if key in seen_paragraphs:
+                        removed += 1
+                        continue
+                    seen_paragraphs.add(key)
+                lines.append(_SPACES_RE.sub(" ", line).strip())
+            if lines:
+                kept.append("\n".join(lines))
+        if kept:
+            result.append((name, kept))
+    return result, removed
+
+
+def trim_sections(sections, max_tokens):
+    # 段落已按原文顺序排列；超预算时按文件轮转保留，避免某一份文档独占预算
+    if max_tokens <= 0:
+        return [], sum(len(p) for _, p in sections)
+    costs = [[estimate_tokens(p) for p in passages] for _, passages in sections]
+    if sum(map(sum, costs)) <= max_tokens:
+        return sections, 0
+    keep = [[] for _ in sections]
+    used = 0
+    depth = 0
+    progressed = True
+    while progressed:
+        progressed = False
+        for i, (_, passages) in enumerate(sections):
+            if depth < len(passages):
+                progressed = True
+                if used + costs[i][depth] <= max_tokens:
+                    keep[i].append(depth)
+                    used += costs[i][depth]
+        depth += 1
+    result = []
+    dropped = 0
+    for (name, passages), idx in zip(sections, keep):
+        dropped += len(passages) - len(idx)
+        if idx:
+            result.append((name, [passages[j] for j in idx]))
+    return result, dropped
+
+
+def format_doc_context(sections, title=SHARED_CONTEXT_TITLE):
+    if not sections:
+        return ""
+    context = f"\n{title}\n"
+    for name, passages in sections:
+        context += f"\n--- 文件名称: {name} ---\n" + "\n……\n".join(passages) + "\n"
+    return context
+
+
+def build_messages(system, shared_sections, render, extra_sections=(), request_budget=DEFAULT_REQUEST_BUDGET):
+    # 两段式 prompt，便于接口端的前缀缓存命中：
+    #   system = 固定说明 + 共享素材：同一课题的各课时、框架与过程请求逐字节一致
+    #   user   = render(补充素材)：课时序号、自定义指令等每次都变的部分
+    # 共享素材只按固定的预留量裁剪，不受本次任务说明长短影响；返回 (messages, stats)
+    extra_sections = list(extra_sections)
+    raw_tokens = (estimate_tokens(system + format_doc_context(shared_sections))
+                  + estimate_tokens(render(format_doc_context(extra_sections, EXTRA_CONTEXT_TITLE))))
+    system_tokens = estimate_tokens(compact_whitespace(system))
+    shared, removed_shared = compact_sections(shared_sections)
+    shared, dropped_shared = trim_sections(shared, request_budget - RESPONSE_RESERVE - SUFFIX_RESERVE - system_tokens)
+    prefix = compact_whitespace(system + format_doc_context(shared))
+    prefix_tokens = estimate_tokens(prefix)
+
+    fixed_tokens = estimate_tokens(compact_whitespace(render("")))
+    extra, removed_extra = compact_sections(extra_sections)
+    extra, dropped_extra = trim_sections(extra, request_budget - RESPONSE_RESERVE - prefix_tokens - fixed_tokens)
+    suffix = compact_whitespace(render(format_doc_context(extra, EXTRA_CONTEXT_TITLE)))
+    messages = [{"role": "system", "content": prefix}, {"role": "user", "content": suffix}]
+    stats = {
+        "raw_tokens": raw_tokens,
+        "prompt_tokens": prefix_tokens + estimate_tokens(suffix),
+        "prefix_tokens": prefix_tokens,
+        "fixed_tokens": system_tokens + fixed_tokens,
+        "budget": request_budget,
+        "removed_lines": removed_shared + removed_extra,
+        "dropped_passages": dropped_shared + dropped_extra,
+        "over_budget": system_tokens + fixed_tokens + RESPONSE_RESERVE > request_budget
+    }
+    return messages, stats
+
+
+def log_prompt_stats(kind, stats, log_file=PROMPT_LOG_FILE):
+    try:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        record = dict(stats, kind=kind, ts=round(time.time(), 3))
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception:
+        pass
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import socket
+import threading
+
+from prompt_budget import estimate_tokens
+
+# --- 单次接口请求的耗时与吞吐统计 ---
+# connect_ms：发出请求到收到响应头 (含建连、TLS 握手与服务端排队)
+# ttft_ms：发出请求到第一个正文增量；total_ms：到流结束
+# tokens_per_s 按首个增量之后的生成时长计算；接口未返回 usage 时用本地估算值
+# prompt_cache_hit/miss_tokens：DeepSeek 在 usage 中返回的前缀缓存命中情况 (命中部分按低价计费)
+# backend：实际应答的接口后端；hedged：本次请求是否发出过对冲请求
+METRICS_LOG_FILE = os.path.join(os.path.expanduser("~"), ".jinta_lesson_cache", "request_metrics.jsonl")
+# 流式过程中回调界面的最短间隔 (秒)
+LIVE_INTERVAL = 0.5
+# 尚无完整请求可参考时，各类请求预计的输出 token 数 (用于估算取消节省的 token)
+EXPECTED_COMPLETION_TOKENS = {"framework": 600, "process": 2500}
+
+_log_lock = threading.Lock()
+
+
+class RequestMetrics:
+    def __init__(self, kind, model):
+        self.kind = kind
+        self.model = model
+        self.backend = None
+        self.hedged = False
+        self.started = time.perf_counter()
+        self.connect_ms = None
+        self.ttft_ms = None
+        self.total_ms = None
+        self.bytes = 0
+        self.estimated_completion_tokens = 0
+        self.usage = {}
+        self.status = "ok"
+        self.last_live = 0.0
+        # 取消相关：预计输出量、取消信号到达时刻、从取消到工作线程释放的耗时
+        self.expected_tokens = EXPECTED_COMPLETION_TOKENS.get(kind, 0)
+        self.cancel_at = None
+        self.cancel_release_ms = None
+
+    def _elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def mark_connected(self):
+        self.connect_ms = self._elapsed_ms()
+
+    def on_content(self, text):
+        if self.ttft_ms is None:
+            self.ttft_ms = self._elapsed_ms()
+        # estimate_tokens 对每段文本额外加 1，逐段累加时扣掉
+        self.estimated_completion_tokens += estimate_tokens(text) - 1
+
+    def live_due(self):
+        # 控制实时刷新的频率，避免每个增量都打扰界面线程
+        now = time.perf_counter()
+        if now - self.last_live >= LIVE_INTERVAL:
+            self.last_live = now
+            return True
+        return False
+
+    def mark_cancel(self):
+        # 在发出取消的线程调用
+        if self.cancel_at is None:
+            self.cancel_at = time.perf_counter()
+
+    def finish(self, status="ok"):
+        self.total_ms = self._elapsed_ms()
+        self.status = status
+        if status == "cancelled" and self.cancel_at is not None:
+            self.cancel_release_ms = (time.perf_counter() - self.cancel_at) * 1000
+
+    @property
+    def completion_tokens(self):
+        return self.usage.get("completion_tokens") or self.estimated_completion_tokens
+
+    @property
+    def saved_tokens(self):
+        # 取消后不再生成、也不再计费的输出量 (估算)
+        if self.status != "cancelled":
+            return 0
+        return max(0, self.expected_tokens - self.completion_tokens)
+
+    @property
+    def tokens_per_s(self):
+        if self.ttft_ms is None:
+            return 0.0
+        end_ms = self.total_ms if self.total_ms is not None else self._elapsed_ms()
+        seconds = (end_ms - self.ttft_ms) / 1000
+        return self.completion_tokens / seconds if seconds > 0 else 0.0
+
+    def to_record(self):
+        return {
+            "ts": round(time.time(), 3),
+            "host": socket.gethostname(),
+            "kind": self.kind,
+            "model": self.model,
+            "backend": self.backend,
+            "hedged": self.hedged,
+            "status": self.status,
+            "connect_ms": _round(self.connect_ms),
+            "ttft_ms": _round(self.ttft_ms),
+            "total_ms": _round(self.total_ms),
+            "bytes": self.bytes,
+            "prompt_tokens": self.usage.get("prompt_tokens"),
+            "completion_tokens": self.usage.get("completion_tokens"),
+            "prompt_cache_hit_tokens": self.usage.get("prompt_cache_hit_tokens"),
+            "prompt_cache_miss_tokens": self.usage.get("prompt_cache_miss_tokens"),
+            "estimated_completion_tokens": self.estimated_completion_tokens,
+            "tokens_per_s": round(self.tokens_per_s, 1),
+            "saved_tokens_est": self.saved_tokens,
+            "cancel_release_ms": _round(self.cancel_release_ms),
+        }
+
+    def summary(self):
+        # 状态栏用的一行摘要
+        parts = []
+        if self.backend:
+            parts.append(f"{self.backend}{' (对冲胜出)' if self.hedged else ''}")
+        if self.ttft_ms is not None:
+            parts.append(f"首字 {self.ttft_ms / 1000:.1f}s")
+        elif self.connect_ms is not None:
+            parts.append(f"连接 {self.connect_ms / 1000:.1f}s")
+        parts.append(f"{self.tokens_per_s:.0f} tok/s")
+        if self.total_ms is not None:
+            parts.append(f"总计 {self.total_ms / 1000:.1f}s")
+        if self.usage.get("prompt_tokens") is not None:
+            parts.append(f"输入 {self.usage['prompt_tokens']} / 输出 {self.usage.get('completion_tokens', 0)} tokens")
+        else:
+            parts.append(f"输出≈{self.completion_tokens} tokens")
+        hit = self.usage.get("prompt_cache_hit_tokens")
+        if hit is not None:
+            total = hit + (self.usage.get("prompt_cache_miss_tokens") or 0)
+            parts.append(f"前缀缓存命中 {hit}/{total} ({hit / total:.0%})" if total else "前缀缓存未命中")
+        parts.append(f"{self.bytes / 1024:.0f} KB")
+        if self.saved_tokens:
+            parts.append(f"取消节省≈{self.saved_tokens} tokens")
+        return "⏱ " + " · ".join(parts)
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+def log_request_metrics(metrics, log_file=METRICS_LOG_FILE):
+    try:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        line = json.dumps(metrics.to_record(), ensure_ascii=False) + "\n"
+        with _log_lock:
+            with open(log_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except Exception:
+        pass
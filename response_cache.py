@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from doc_cache import CACHE_ROOT
+
+# --- 模型响应磁盘缓存 (SQLite)：按 模型 + 完整消息体 的指纹寻址 ---
+RESPONSE_DB = os.path.join(CACHE_ROOT, "responses.sqlite3")
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+# 命中缓存时按界面节奏回放：单个片段最多等待的秒数，以及整段回放的总时长上限
+REPLAY_INTERVAL = 0.01
+REPLAY_MAX_SECONDS = 2.0
+
+
+def make_key(model, messages, **params):
+    payload = {"model": model, "messages": messages}
+    payload.update(params)
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, db_path=RESPONSE_DB, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, kind TEXT, created REAL, accessed REAL, size INTEGER, chunks BLOB)"
+            )
+            self.conn.commit()
+
+    def get(self, key):
+        # 返回按原始顺序排列的增量片段列表；未命中或已过期返回 None
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT created, chunks FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        try:
+            return json.loads(zlib.decompress(row[1]).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return None
+
+    def put(self, key, chunks, kind=""):
+        blob = zlib.compress(json.dumps(chunks, ensure_ascii=False).encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, created, accessed, size, chunks) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, now, now, len(blob), blob)
+            )
+            self._evict_locked(now)
+            self.conn.commit()
+
+    def _evict_locked(self, now):
+        self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+
+
+def replay(chunks, should_stop=None):
+    # 把缓存的完整响应按接近真实流式的节奏重新产出，避免界面一次性涌入
+    interval = min(REPLAY_INTERVAL, REPLAY_MAX_SECONDS / max(1, len(chunks)))
+    for chunk in chunks:
+        if should_stop is not None and should_stop():
+            return
+        yield chunk
+        time.sleep(interval)
@@ -0,0 +1,100 @@
+import json
+
+# --- 增量 SSE 解码器：直接处理 iter_content 的原始字节块 ---
+# 按 Server-Sent Events 规范处理 data/event 字段、多行 data、注释与心跳行；
+# 只在完整行上做 UTF-8 解码，多字节字符被切在两个字节块之间也不会出错。
+
+DONE_SENTINEL = "[DONE]"
+
+
+class SSEDecoder:
+    def __init__(self):
+        self.pending = b""
+        self.data_lines = []
+        self.event_type = ""
+        self.events = 0
+        self.comments = 0
+        self.invalid = 0
+        self.dropped = 0
+        # 收到的原始字节数 (不含 HTTP 头)
+        self.bytes = 0
+
+    def feed(self, chunk):
+        # 返回本块中新完成的 [(event_type, data)]
+        events = []
+        self.bytes += len(chunk)
+        buf = self.pending + chunk if self.pending else chunk
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+            line = buf[start:end]
+            start = end + 1
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            self._process_line(line, events)
+        self.pending = buf[start:]
+        return events
+
+    def _process_line(self, line, events):
+        if not line:
+            # 空行：派发累积的事件
+            if self.data_lines:
+                events.append((self.event_type or "message", "\n".join(self.data_lines)))
+                self.events += 1
+            self.data_lines = []
+            self.event_type = ""
+            return
+        if line[:1] == b":":
+            # 注释 / keep-alive
+            self.comments += 1
+            return
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError:
+            self.invalid += 1
+            return
+        field, sep, value = text.partition(":")
+        if sep and value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            self.data_lines.append(value)
+        elif field == "event":
+            self.event_type = value
+        elif field in ("id", "retry"):
+            pass
+        else:
+            self.dropped += 1
+
+    def close(self):
+        # 流结束时若还有未以空行结束的事件，宽松地派发出去
+        events = []
+        if self.pending:
+            line, self.pending = self.pending, b""
+            self._process_line(line.rstrip(b"\r"), events)
+        self._process_line(b"", events)
+        return events
+
+    def stats(self):
+        return {"events": self.events, "comments": self.comments, "invalid": self.invalid, "dropped": self.dropped, "bytes": self.bytes}
+
+
+def iter_json_events(response, decoder=None):
+    # 从流式响应中逐个产出已解析的 JSON 事件，遇到 [DONE] 结束
+    decoder = decoder or SSEDecoder()
+    for chunk in response.iter_content(chunk_size=None):
+        for _, data in decoder.feed(chunk):
+            if data == DONE_SENTINEL:
+                return
+            try:
+                yield json.loads(data)
+            except ValueError:
+                decoder.invalid += 1
+    for _, data in decoder.close():
+        if data == DONE_SENTINEL:
+            return
+        try:
+            yield json.loads(data)
+        except ValueError:
+            decoder.invalid += 1
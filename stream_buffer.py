@@ -0,0 +1,32 @@
+import threading
+
+# --- 流式文本缓冲：后台线程写入，界面线程按固定帧率一次性取出 ---
+# 界面每帧只做一次 insert + 一次 see，开销与到达的 token 数无关
+FRAME_MS = 50
+
+
+class StreamBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parts = []
+        self.is_open = False
+
+    def open(self):
+        with self.lock:
+            self.parts = []
+            self.is_open = True
+
+    def close(self):
+        with self.lock:
+            self.is_open = False
+
+    def push(self, text):
+        with self.lock:
+            self.parts.append(text)
+
+    def drain(self):
+        # 返回 (本帧累积文本, 是否仍在写入)
+        with self.lock:
+            text = "".join(self.parts)
+            self.parts = []
+            return text, self.is_open
@@ -0,0 +1,102 @@
+import re
+
+# --- 流式文本清洗：跨增量保留半截标记状态，单遍完成规范化 ---
+# 规则与原 clean_text 完全一致：依次去掉 ** / __ / ```json / ``` 标记，
+# 再对每行去除首尾空白以及行首的 # 号。四级标记过滤串联成流水线，
+# 每级只扣留可能构成标记的尾部前缀，被增量切断的标记 (如 "*" + "*") 也能正确识别。
+
+_MARKERS = ("**", "__", "```json", "```")
+_NO_HOLDS = [""] * len(_MARKERS)
+_LEADING_RE = re.compile(r"^[^\S\n]*(?:#[^\S\n]*)*")
+
+
+def _partial_start(text, marker):
+    # 返回 text 末尾可能是 marker 真前缀的起始位置；没有则返回 len(text)
+    n = len(text)
+    for q in range(max(0, n - len(marker) + 1), n):
+        if marker.startswith(text[q:]):
+            return q
+    return n
+
+
+class StreamingCleaner:
+    def __init__(self):
+        # holds[i]：第 i 级过滤器扣留的、可能与后续增量拼成标记的尾部
+        self.holds = [""] * len(_MARKERS)
+        self.at_line_start = True
+        self.ws_pending = ""
+
+    def feed(self, text):
+        # 返回本次可确定输出的文本；被截断的标记或行尾空白留待下次判断
+        if self.holds != _NO_HOLDS or "*" in text or "_" in text or "`" in text:
+            for level, marker in enumerate(_MARKERS):
+                text = self._filter(level, marker, text)
+        return self._normalize_lines(text)
+
+    def finish(self):
+        # 残留的尾部已不可能构成标记，逐级下放
+        text = ""
+        for level, marker in enumerate(_MARKERS):
+            text = self._filter(level, marker, text) + self.holds[level]
+            self.holds[level] = ""
+        out = self._normalize_lines(text)
+        # 文本末尾的空白与原实现一样直接丢弃
+        self.ws_pending = ""
+        return out
+
+    def clean(self, text):
+        return self.feed(text) + self.finish()
+
+    def _filter(self, level, marker, text):
+        buf = self.holds[level] + text if self.holds[level] else text
+        # 快速路径：不含标记首字符时既不可能匹配，也不可能留下半截前缀
+        if marker[0] not in buf:
+            self.holds[level] = ""
+            return buf
+        # 与 str.replace 相同的自左向右不重叠匹配
+        parts = []
+        i = 0
+        size = len(marker)
+        while True:
+            j = buf.find(marker, i)
+            if j < 0:
+                break
+            parts.append(buf[i:j])
+            i = j + size
+        tail = buf[i:]
+        cut = _partial_start(tail, marker)
+        parts.append(tail[:cut])
+        self.holds[level] = tail[cut:]
+        return "".join(parts)
+
+    def _normalize_lines(self, text):
+        if not text:
+            return ""
+        # 快速路径：行中间的普通片段原样输出
+        if not self.at_line_start and not self.ws_pending and "\n" not in text and not text[-1].isspace():
+            return text
+        out = []
+        lines = text.split("\n")
+        last = len(lines) - 1
+        for idx, piece in enumerate(lines):
+            if self.at_line_start:
+                piece = piece[_LEADING_RE.match(piece).end():]
+                if piece:
+                    self.at_line_start = False
+            elif self.ws_pending:
+                piece = self.ws_pending + piece
+                self.ws_pending = ""
+            if idx < last:
+                out.append(piece.rstrip())
+                out.append("\n")
+                self.at_line_start = True
+                self.ws_pending = ""
+            else:
+                stripped = piece.rstrip()
+                self.ws_pending = piece[len(stripped):] if not self.at_line_start else ""
+                out.append(stripped)
+        return "".join(out)
+
+
+def clean_text(text):
+    return StreamingCleaner().clean(text)
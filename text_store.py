@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from doc_cache import CACHE_ROOT
+
+# --- 解析文本的磁盘存储：每份文档的分块按顺序写入一个文件，内存里只留偏移索引 ---
+# 读取时按 (偏移, 长度) 定点读出所需分块 (普通文件读写，不做内存映射)；最近用过的分块放在有上限的 LRU 里
+# memory_limit 只限制这部分正文缓存；倒排索引与每块的偏移、词数等元数据仍常驻内存，随分块数量增长
+TEXT_STORE_ROOT = os.path.join(CACHE_ROOT, "text_store")
+DEFAULT_MEMORY_MB = 32
+# 每个存储目录里由所属进程持有独占锁的文件；锁随进程退出 (含崩溃) 由系统释放
+OWNER_FILE = "owner.lock"
+# 没有锁文件的目录 (旧版本遗留) 超过该时长后删除
+STALE_SECONDS = 7 * 24 * 3600
+# 锁文件刚创建不久的目录一律视为仍在使用 (所属进程可能正处在创建与加锁之间)
+OWNER_GRACE_SECONDS = 60
+
+
+def _try_lock(f):
+    # 非阻塞独占锁，已被其它进程持有时抛出 OSError
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _is_abandoned(path):
+    # 能拿到锁说明所属进程已经退出；刚建好还没来得及加锁的目录按修改时间判断
+    owner = os.path.join(path, OWNER_FILE)
+    if not os.path.exists(owner):
+        return time.time() - os.path.getmtime(path) > STALE_SECONDS
+    if time.time() - os.path.getmtime(owner) < OWNER_GRACE_SECONDS:
+        return False
+    with open(owner, 'a+b') as f:
+        try:
+            _try_lock(f)
+        except OSError:
+            return False
+    return True
+
+
+def _cleanup_stale(root, keep):
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(root, name)
+        if path == keep or not os.path.isdir(path):
+            continue
+        try:
+            if _is_abandoned(path):
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+class TextStore:
+    def __init__(self, root=TEXT_STORE_ROOT, memory_limit=DEFAULT_MEMORY_MB * 1024 * 1024):
+        os.makedirs(root, exist_ok=True)
+        self.dir = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=root)
+        # 先创建并加锁，再写入进程号，避免其它进程的清理在两步之间拿到锁删掉本目录
+        self.owner = open(os.path.join(self.dir, OWNER_FILE), 'a+b')
+        _try_lock(self.owner)
+        self.owner.truncate(0)
+        self.owner.write(str(os.getpid()).encode("ascii"))
+        self.owner.flush()
+        self.memory_limit = memory_limit
+        self.lock = threading.Lock()
+        # 句柄 -> (文件路径, [(偏移, 字节数)])
+        self.docs = {}
+        self.next_handle = 0
+        # (句柄, 序号) -> 文本
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        _cleanup_stale(root, self.dir)
+        atexit.register(self.close)
+
+    def put(self, chunks):
+        # 写入一份文档的全部分块，返回句柄
+        with self.lock:
+            self.next_handle += 1
+            handle = self.next_handle
+        path = os.path.join(self.dir, f"{handle}.txt")
+        offsets = []
+        position = 0
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                data = chunk.encode("utf-8")
+                f.write(data)
+                offsets.append((position, len(data)))
+                position += len(data)
+        with self.lock:
+            self.docs[handle] = (path, offsets)
+        return handle
+
+    def read(self, handle, seqs):
+        # 按序号读出分块文本，返回与 seqs 对应的列表
+        result = {}
+        missing = []
+        with self.lock:
+            path, offsets = self.docs[handle]
+            for seq in seqs:
+                text = self.cache.get((handle, seq))
+                if text is None:
+                    missing.append(seq)
+                else:
+                    self.cache.move_to_end((handle, seq))
+                    result[seq] = text
+            self.hits += len(seqs) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            with open(path, 'rb') as f:
+                for seq in sorted(missing):
+                    offset, size = offsets[seq]
+                    f.seek(offset)
+                    result[seq] = f.read(size).decode("utf-8")
+            with self.lock:
+                if handle in self.docs:
+                    for seq in missing:
+                        self._remember_locked((handle, seq), result[seq])
+        return [result[seq] for seq in seqs]
+
+    def iter_chunks(self, handle):
+        # 顺序读出整份文档 (摘要、项目内嵌等少数场景)，不进入 LRU
+        with self.lock:
+            path, offsets = self.docs[handle]
+        with open(path, 'rb') as f:
+            for offset, size in offsets:
+                f.seek(offset)
+                yield f.read(size).decode("utf-8")
+
+    def _remember_locked(self, key, text):
+        size = sys.getsizeof(text)
+        if size > self.memory_limit:
+            return
+        self.cache[key] = text
+        self.cached_bytes += size
+        while self.cached_bytes > self.memory_limit:
+            _, old = self.cache.popitem(last=False)
+            self.cached_bytes -= sys.getsizeof(old)
+
+    def set_memory_limit(self, memory_limit):
+        with self.lock:
+            self.memory_limit = memory_limit
+            while self.cache and self.cached_bytes > self.memory_limit:
+                _, old = self.cache.popitem(last=False)
+                self.cached_bytes -= sys.getsizeof(old)
+
+    def remove(self, handle):
+        with self.lock:
+            entry = self.docs.pop(handle, None)
+            if entry is None:
+                return
+            for seq in range(len(entry[1])):
+                text = self.cache.pop((handle, seq), None)
+                if text is not None:
+                    self.cached_bytes -= sys.getsizeof(text)
+        try:
+            os.remove(entry[0])
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            disk = sum(sum(size for _, size in offsets) for _, offsets in self.docs.values())
+            return {"documents": len(self.docs), "disk_bytes": disk, "memory_bytes": self.cached_bytes,
+                    "memory_limit": self.memory_limit, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self.lock:
+            self.docs.clear()
+            self.cache.clear()
+            self.cached_bytes = 0
+        if not self.owner.closed:
+            self.owner.close()
+        shutil.rmtree(self.dir, ignore_errors=True)